@@ -0,0 +1,64 @@
+import random
+
+# Корпус пип-боев для бенчмарков парсера профиля.
+# Тексты собираются из шаблонов, повторяющих реальные сообщения игры: разные фракции,
+# необязательные блоки (банда, экипировка, репутация, рейд) и переменная длина экипировки.
+
+FACTIONS = ("Республика", "Конгломерат", "Мегатонна", "Убежище 4", "Коммуна")
+SQUADS = ("Альфа", "Бета", "Волки пустоши", "Ночные крысы", "Стальной легион")
+LOCATIONS = ("Пустошь", "Старая фабрика", "Руины Гексагона", "Радиоактивный кратер", "Оазис")
+REPUTATION = ("Хороший", "Нейтральный", "Подозрительный", "Герой пустоши")
+GEAR = (
+    "🔪Кастет +5", "🔫Лазерный пистолет +12", "💣Граната x3", "🧥Кожаная куртка +8",
+    "⛑Шлем рейдера +4", "💉Стимулятор x5", "🔋Батарея x2", "🪓Топор пожарного +15",
+    "🛡Броня рейнджера +22", "🎒Рюкзак путника",
+)
+NAMES = ("Тестер", "Сталкер", "Ночной_Волк", "Iron Mike", "Пупс", "Бродяга 13", "Ёжик", "Раш")
+
+
+def make_pipboy(rng: random.Random) -> str:
+    # Один пип-бой со случайными значениями
+    name = f"{rng.choice(NAMES)}{rng.randint(1, 999)}"
+    health_max = rng.randint(100, 900)
+    stamina_max = rng.randint(5, 30)
+    lines = [
+        "📟Пип-бой 3000 v16.5",
+        f"{name}, ⚛️{rng.choice(FACTIONS)}",
+    ]
+    if rng.random() < 0.8:
+        lines.append(f"🤟Банда: {rng.choice(SQUADS)}")
+    lines += [
+        f"❤️Здоровье: {rng.randint(1, health_max)}/{health_max}",
+        f"🍗Голод: {rng.randint(0, 100)}% /myfood",
+        f"⚔️Урон: {rng.randint(10, 900)} (+{rng.randint(0, 90)}) 🛡Броня: {rng.randint(0, 500)} (+{rng.randint(0, 50)})",
+        f"💪Сила: {rng.randint(1, 1200)} 🎯Меткость: {rng.randint(1, 1200)}",
+        f"🗣Харизма: {rng.randint(1, 1200)} 🤸🏽‍♂️Ловкость: {rng.randint(1, 1200)}",
+        f"🔋Выносливость: {rng.randint(0, stamina_max)}/{stamina_max} /ref",
+        f"📍{rng.choice(LOCATIONS)}, 👣{rng.randint(0, 120)}км",
+        "",
+    ]
+    if rng.random() < 0.9:
+        lines.append("Экипировка:")
+        lines += rng.sample(GEAR, rng.randint(1, 6))
+        lines.append("")
+    lines += [
+        "Ресурсы:",
+        f"🕳Крышки: {rng.randint(0, 100000)}",
+        f"📦Материалы: {rng.randint(0, 100000)}",
+        f"🧸Пупсы: {rng.randint(0, 30)}",
+    ]
+    if rng.random() < 0.7:
+        lines += ["Репутация:", rng.choice(REPUTATION)]
+    lines.append(f"ID{rng.randint(10_000_000, 9_999_999_999)}")
+    if rng.random() < 0.3:
+        lines += [
+            f"Рейд в {rng.randint(0, 23):02d}:00 через {rng.randint(1, 59)} мин: {rng.choice(LOCATIONS)}",
+            f"{rng.choice(LOCATIONS)} 🕳+{rng.randint(10, 999)} 📦+{rng.randint(10, 999)} 💊Баффаут",
+        ]
+    return "\n".join(lines)
+
+
+def build_corpus(size: int = 1000, seed: int = 42) -> list[str]:
+    # Детерминированный корпус: одинаковый seed — одинаковые тексты между запусками
+    rng = random.Random(seed)
+    return [make_pipboy(rng) for _ in range(size)]
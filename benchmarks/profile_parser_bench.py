@@ -0,0 +1,131 @@
+import argparse
+import re
+import time
+
+from benchmarks.pipboy_corpus import build_corpus
+from services.profile_parser import parse_profile_text
+
+# Бенчмарк парсера пип-боя.
+# Запуск из корня проекта: python -m benchmarks.profile_parser_bench [--size N] [--rounds N]
+
+
+def legacy_parse(text: str) -> dict:
+    # Прежний построчный разбор с перекомпиляцией шаблонов — эталон для сравнения
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    data = {}
+    gear_lines = []
+    in_gear_block = False
+    for idx, line in enumerate(lines):
+        if re.search(r",\s+⚛️", line):
+            match = re.match(r"(.+),\s+⚛️(.+)", line)
+            if match:
+                data["nickname"], data["faction"] = match.groups()
+        if "Банда:" in line:
+            data["squad"] = line.split(":", 1)[-1].strip()
+        if "Здоровье" in line:
+            nums = re.findall(r"\d+", line)
+            if len(nums) == 2:
+                data["health_current"], data["health_max"] = map(int, nums)
+        if "Голод" in line:
+            if match := re.search(r"(\d+)%", line):
+                data["hunger"] = int(match.group(1))
+        if "⚔️Урон" in line:
+            if match := re.search(r"⚔️Урон: (\d+)", line):
+                data["damage"] = int(match.group(1))
+        if "🛡Броня" in line:
+            if match := re.search(r"🛡Броня: (\d+)", line):
+                data["armor"] = int(match.group(1))
+        if "Сила:" in line or "Меткость:" in line or "Харизма:" in line or "Ловкость:" in line:
+            if match := re.search(r"💪Сила: (\d+)", line):
+                data["strength"] = int(match.group(1))
+            if match := re.search(r"🎯Меткость: (\d+)", line):
+                data["accuracy"] = int(match.group(1))
+            if match := re.search(r"🗣Харизма: (\d+)", line):
+                data["charisma"] = int(match.group(1))
+            if match := re.search(r"🤸🏽‍♂️Ловкость: (\d+)", line):
+                data["agility"] = int(match.group(1))
+        if "Выносливость" in line:
+            nums = re.findall(r"\d+", line)
+            if len(nums) == 2:
+                data["stamina_current"], data["stamina_max"] = map(int, nums)
+        if "📍" in line:
+            if match := re.search(r"📍(.+?),", line):
+                data["location"] = match.group(1).strip()
+            if match := re.search(r"(\d+)км", line):
+                data["distance_km"] = int(match.group(1))
+        if line.startswith("Экипировка"):
+            in_gear_block = True
+            continue
+        if in_gear_block:
+            if any(line.startswith(x) for x in ("Ресурсы", "Репутация", "ID", "Рейд в")):
+                in_gear_block = False
+            else:
+                gear_lines.append(line)
+        if "Крышки" in line:
+            if match := re.search(r"Крышки:\s*(\d+)", line):
+                data["caps"] = int(match.group(1))
+        if "Материалы" in line:
+            if match := re.search(r"Материалы:\s*(\d+)", line):
+                data["materials"] = int(match.group(1))
+        if "Пупсы" in line:
+            if match := re.search(r"Пупсы:\s*(\d+)", line):
+                data["bobbleheads"] = int(match.group(1))
+        if line.startswith("Репутация"):
+            if idx + 1 < len(lines):
+                rep_line = lines[idx + 1]
+                if not rep_line.startswith("ID") and not rep_line.startswith("🏵"):
+                    data["reputation"] = rep_line.strip()
+        if match := re.search(r"ID(\d+)", line):
+            data["game_id"] = int(match.group(1))
+        if "Рейд в" in line:
+            data["raid_time"] = line.split(":", 1)[-1].strip()
+            if idx + 1 < len(lines):
+                raid_line = lines[idx + 1]
+                data["raid_location"] = raid_line.strip()
+                if match := re.search(r"🕳\+(\d+)", raid_line):
+                    data["raid_reward_caps"] = int(match.group(1))
+                if match := re.search(r"📦\+(\d+)", raid_line):
+                    data["raid_reward_materials"] = int(match.group(1))
+                extra = re.sub(r"🕳\+\d+|📦\+\d+", "", raid_line).strip()
+                if extra:
+                    data["raid_reward_other"] = extra
+    if gear_lines:
+        data["gear"] = "\n".join(gear_lines)
+    return data
+
+
+def measure(parse, corpus, rounds: int) -> float:
+    # Лучший результат из нескольких прогонов, профилей в секунду
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for text in corpus:
+            parse(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк парсера пип-боя")
+    parser.add_argument("--size", type=int, default=2000, help="Размер корпуса")
+    parser.add_argument("--rounds", type=int, default=5, help="Количество прогонов")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.seed)
+
+    # Сначала убеждаемся, что оба парсера дают одинаковый результат
+    mismatches = sum(parse_profile_text(text).as_dict() != legacy_parse(text) for text in corpus)
+    if mismatches:
+        print(f"[ERROR] Результаты расходятся в {mismatches} из {len(corpus)} профилей")
+
+    legacy = measure(legacy_parse, corpus, args.rounds)
+    compiled = measure(parse_profile_text, corpus, args.rounds)
+    print(f"Корпус: {len(corpus)} пип-боев, {sum(len(t) for t in corpus) / len(corpus):.0f} символов в среднем")
+    print(f"legacy:   {legacy:10.0f} профилей/с")
+    print(f"compiled: {compiled:10.0f} профилей/с  (x{compiled / legacy:.2f})")
+
+
+if __name__ == "__main__":
+    main()
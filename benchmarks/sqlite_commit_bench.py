@@ -0,0 +1,92 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from database.db import apply_sqlite_pragmas
+
+# Бенчмарк задержки коммита SQLite: настройки по умолчанию (rollback journal, synchronous=FULL)
+# против настроек из config.py (WAL, synchronous=NORMAL, кэш, mmap, temp_store, busy_timeout).
+# Как в хендлерах: каждая операция — маленькая запись и отдельный коммит.
+# Запуск из корня проекта: python -m benchmarks.sqlite_commit_bench [--commits N] [--rows N]
+
+
+def prepare(path: str, rows: int):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, game_id INTEGER UNIQUE, nickname TEXT, seen_at REAL)")
+    conn.executemany(
+        "INSERT INTO users (game_id, nickname, seen_at) VALUES (?, ?, ?)",
+        ((i, f"Игрок{i}", 0.0) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def reader(path: str, tuned: bool, stop: threading.Event, latencies: list):
+    # Параллельный читатель: в rollback journal он ждёт, пока писатель держит блокировку
+    conn = sqlite3.connect(path, timeout=30)
+    if tuned:
+        apply_sqlite_pragmas(conn)
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.execute("SELECT COUNT(*) FROM users WHERE seen_at > 0").fetchone()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(tuned: bool, commits: int, rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare(path, rows)
+
+        conn = sqlite3.connect(path, timeout=30)
+        if tuned:
+            apply_sqlite_pragmas(conn)
+
+        stop = threading.Event()
+        read_latencies = []
+        thread = threading.Thread(target=reader, args=(path, tuned, stop, read_latencies))
+        thread.start()
+
+        commit_latencies = []
+        for i in range(commits):
+            start = time.perf_counter()
+            conn.execute("UPDATE users SET seen_at = ? WHERE game_id = ?", (time.time(), i % rows))
+            conn.commit()
+            commit_latencies.append(time.perf_counter() - start)
+
+        stop.set()
+        thread.join()
+        conn.close()
+
+    commit_latencies.sort()
+    read_latencies.sort()
+    return {
+        "commit_p50": statistics.median(commit_latencies),
+        "commit_p99": commit_latencies[int(len(commit_latencies) * 0.99)],
+        "commits_per_s": commits / sum(commit_latencies),
+        "read_p99": read_latencies[int(len(read_latencies) * 0.99)] if read_latencies else 0.0,
+        "reads": len(read_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{args.commits} коммитов, {args.rows} строк, параллельный читатель\n")
+    for title, tuned in (("По умолчанию", False), ("config.py", True)):
+        r = run(tuned, args.commits, args.rows)
+        print(
+            f"{title:>12}: коммит p50 {r['commit_p50'] * 1000:.3f} мс, p99 {r['commit_p99'] * 1000:.3f} мс, "
+            f"{r['commits_per_s']:.0f} коммитов/с; чтение p99 {r['read_p99'] * 1000:.3f} мс ({r['reads']} чтений)"
+        )
+
+
+if __name__ == "__main__":
+    main()
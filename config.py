@@ -11,3 +11,16 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 # Список ID администраторов, полученный из переменной окружения
 ADMIN_IDS = ast.literal_eval(os.getenv("ADMIN_IDS", "[]"))
 
+
+# Лимиты рассылок: сообщений в секунду на весь бот и число параллельных отправителей
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+
+
+# Настройки SQLite, применяются к каждому соединению (database/db.py)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")            # WAL: читатели не ждут писателя
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")           # В WAL fsync только при checkpoint
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))   # Кэш страниц на соединение
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # Чтение через mmap (байты)
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")             # Временные таблицы и сортировки в памяти
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Ожидание блокировки вместо ошибки
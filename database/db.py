@@ -1,15 +1,42 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
 
-# Создание движка базы данных
-engine = create_engine("sqlite:///db_data/bot.db", echo=False)
+from config import (
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_TEMP_STORE,
+)
+
+# Путь к файлу базы данных
+DB_PATH = "db_data/bot.db"
+
+# Асинхронный движок на aiosqlite — запросы не блокируют цикл событий
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{DB_PATH}", echo=False)
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    # Настройки SQLite для нового соединения (значения — в config.py).
+    # busy_timeout ставим первым: переключение в WAL само может ждать блокировку
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")  # Отрицательное значение — размер в КиБ
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA temp_store={SQLITE_TEMP_STORE}")
+    cursor.close()
+
+
+event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
 
 
 # Создание базового класса для моделей
 Base = declarative_base()
 
-# Создание фабрики сессий
-SessionLocal = sessionmaker(bind=engine)
-
-# Создание экземпляра сессии
-session = SessionLocal()
+# Фабрика асинхронных сессий (объекты не протухают после commit).
+# Хендлеры получают сессию через DbSessionMiddleware, фоновые задачи открывают свою
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
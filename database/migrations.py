@@ -0,0 +1,165 @@
+from sqlalchemy import inspect, text
+
+from database.models import Base, nickname_key, pin_text_hash
+
+# Удаление дублей перед созданием уникальных индексов: оставляем самую свежую запись.
+# Ключ — (таблица, уникальный индекс): запрос нужен, только пока индекса ещё нет
+DEDUPLICATE = {
+    ("raid_participation", "ux_raid_participation_raid_user"): """
+    DELETE FROM raid_participation
+    WHERE id NOT IN (SELECT MAX(id) FROM raid_participation GROUP BY raid_id, user_id)
+    """,
+    ("raid_reminders", "ux_raid_reminders_raid_user"): """
+    DELETE FROM raid_reminders
+    WHERE id NOT IN (SELECT MAX(id) FROM raid_reminders GROUP BY raid_id, user_id)
+    """,
+}
+
+
+def has_column(conn, table: str, column: str) -> bool:
+    return column in {col["name"] for col in inspect(conn).get_columns(table)}
+
+
+def deduplicate(conn):
+    # Полный проход по таблице только перед созданием уникального индекса (см. create_missing_indexes)
+    inspector = inspect(conn)
+    for (table, index_name), sql in DEDUPLICATE.items():
+        if index_name not in {index["name"] for index in inspector.get_indexes(table)}:
+            conn.execute(text(sql))
+
+
+def add_missing_columns(conn):
+    # create_all не добавляет новые колонки в существующие таблицы — досоздаём их через ALTER TABLE
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+
+def backfill_nickname_keys(conn):
+    # Заполняет users.nickname_key для старых записей. casefold считается в Python:
+    # lower() в SQLite не понимает кириллицу. Если ник уже занят (отличается только регистром),
+    # ключ получает суффикс "#id": запись заполняется один раз, а игрока находит точное
+    # совпадение ника (см. find_user_by_nickname)
+    taken = {row[0] for row in conn.execute(text("SELECT nickname_key FROM users WHERE nickname_key IS NOT NULL"))}
+    rows = conn.execute(text("SELECT id, nickname FROM users WHERE nickname_key IS NULL AND nickname IS NOT NULL ORDER BY id"))
+    for user_id, nickname in rows.all():
+        key = nickname_key(nickname)
+        if not key:
+            continue
+        if key in taken:
+            print(f"[WARN] Ник «{nickname}» (users.id={user_id}) совпадает с другим игроком без учёта регистра")
+            key = f"{key}#{user_id}"
+        taken.add(key)
+        conn.execute(text("UPDATE users SET nickname_key = :key WHERE id = :id"), {"key": key, "id": user_id})
+
+
+def backfill_pin_batches(conn):
+    # Старые записи журнала пинов без пакета: каждому пину (админ + текст) заводим
+    # завершённый пакет в outbox_batches, чтобы журнал группировался только по batch_id.
+    # Такие записи бывают только в базах, где тексты пинов ещё не вынесены в pin_messages
+    if not has_column(conn, "raid_pin_send_logs", "pin_text"):
+        return
+    conn.execute(text("""
+        CREATE TEMP TABLE pin_groups AS
+        SELECT admin_id, pin_text, COUNT(*) AS total, MIN(sent_at) AS first_at, MAX(sent_at) AS last_at,
+               NULL AS batch_id
+        FROM raid_pin_send_logs
+        WHERE batch_id IS NULL
+        GROUP BY admin_id, pin_text
+    """))
+    # Пакеты заводим в порядке отправки, чтобы их id росли вместе со временем, как у новых пакетов
+    groups = conn.execute(text("SELECT rowid, total, first_at, last_at FROM pin_groups ORDER BY first_at")).all()
+    for group_id, total, first_at, last_at in groups:
+        batch_id = conn.execute(
+            text("""
+                INSERT INTO outbox_batches (purpose, total, created_at, finished_at)
+                VALUES ('pin', :total, :first_at, :last_at)
+                RETURNING id
+            """),
+            {"total": total, "first_at": first_at, "last_at": last_at},
+        ).scalar()
+        conn.execute(text("UPDATE pin_groups SET batch_id = :batch_id WHERE rowid = :id"), {"batch_id": batch_id, "id": group_id})
+
+    # Проставляем пакеты всем записям одним проходом по журналу
+    if groups:
+        conn.execute(text("CREATE INDEX temp.ix_pin_groups ON pin_groups (pin_text, admin_id)"))
+        conn.execute(text("""
+            UPDATE raid_pin_send_logs
+            SET batch_id = (
+                SELECT g.batch_id FROM pin_groups g
+                WHERE g.pin_text IS raid_pin_send_logs.pin_text AND g.admin_id IS raid_pin_send_logs.admin_id
+            )
+            WHERE batch_id IS NULL
+        """))
+    conn.execute(text("DROP TABLE temp.pin_groups"))
+
+
+def compact_pin_texts(conn) -> bool:
+    # Разовое сжатие журнала пинов: тексты из raid_pin_send_logs.pin_text (копия на каждого
+    # получателя) переносим в pin_messages и удаляем колонку. Возвращает True, если что-то сжали
+    if not has_column(conn, "raid_pin_send_logs", "pin_text"):
+        return False
+
+    texts = conn.execute(text("SELECT DISTINCT pin_text FROM raid_pin_send_logs WHERE pin_text IS NOT NULL")).scalars().all()
+    if texts:
+        conn.execute(
+            text("INSERT INTO pin_messages (text_hash, text) VALUES (:text_hash, :text) ON CONFLICT (text_hash) DO NOTHING"),
+            [{"text_hash": pin_text_hash(pin_text), "text": pin_text} for pin_text in texts],
+        )
+        # Сопоставление текст -> id во временной таблице с ключом по тексту: ссылки проставляются одним UPDATE
+        conn.execute(text("CREATE TEMP TABLE pin_text_ids (pin_text TEXT PRIMARY KEY, id INTEGER)"))
+        conn.execute(text("INSERT OR IGNORE INTO temp.pin_text_ids SELECT text, id FROM pin_messages"))
+        conn.execute(text("""
+            UPDATE raid_pin_send_logs
+            SET pin_message_id = (SELECT t.id FROM temp.pin_text_ids t WHERE t.pin_text = raid_pin_send_logs.pin_text)
+            WHERE pin_message_id IS NULL
+        """))
+        conn.execute(text("DROP TABLE temp.pin_text_ids"))
+
+    conn.execute(text("ALTER TABLE raid_pin_send_logs DROP COLUMN pin_text"))
+    return True
+
+
+def purge_finished_outbox(conn) -> bool:
+    # Сообщения завершённых пакетов: раньше они оставались в outbox_messages навсегда
+    # (сейчас воркер удаляет их после отчёта). Возвращает True, если что-то удалили
+    result = conn.execute(text("""
+        DELETE FROM outbox_messages
+        WHERE batch_id IN (SELECT id FROM outbox_batches WHERE finished_at IS NOT NULL)
+    """))
+    return result.rowcount > 0
+
+
+def vacuum(conn):
+    # Возвращает освободившееся место файлу базы; выполняется вне транзакции
+    conn.exec_driver_sql("VACUUM")
+
+
+def create_missing_indexes(conn):
+    # create_all не трогает уже существующие таблицы, поэтому индексы досоздаём отдельно
+    # Имена берём из sqlite_master: рефлексия SQLAlchemy не видит индексы по выражениям
+    existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def run_migrations(conn) -> bool:
+    # Миграции для существующих db_data/bot.db (выполняются при старте после create_all).
+    # Возвращает True, если база сжата и после миграций нужен VACUUM
+    add_missing_columns(conn)
+    deduplicate(conn)
+    backfill_nickname_keys(conn)
+    backfill_pin_batches(conn)
+    compacted = compact_pin_texts(conn)
+    compacted = purge_finished_outbox(conn) or compacted
+    create_missing_indexes(conn)
+    return compacted
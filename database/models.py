@@ -1,21 +1,50 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index, func, literal_column
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime
+import hashlib
 
 Base = declarative_base()
 
+
+def nickname_key(nickname):
+    # Ключ ника для поиска без учёта регистра: casefold понимает кириллицу, а lower() в SQLite — нет
+    return nickname.strip().casefold() if nickname else None
+
+
+def pin_text_hash(text):
+    # Хеш текста пина: по нему одинаковые пины находят уже сохранённую запись pin_messages
+    return hashlib.blake2b((text or "").encode(), digest_size=16).hexdigest()
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     game_id = Column(Integer, unique=True, index=True)
     nickname = Column(String)
+    nickname_key = Column(String, unique=True, index=True)  # Ник в casefold, обновляется вместе с nickname
     faction = Column(String)
     squad = Column(String)
     role = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_admin = Column(Boolean, default=False)
 
+    __table_args__ = (
+        Index("ix_users_nickname_id", "nickname", "id"),  # Поиск по точному нику
+        # Порядок /list_users: игроки без ника идут первыми (NULL в сравнении кортежей обрывал бы курсор)
+        Index("ix_users_list_order", func.coalesce(nickname, literal_column("''")), id),
+    )
+
+    @classmethod
+    def list_order_key(cls):
+        # Тот же вид выражения, что в ix_users_list_order, — иначе SQLite не использует индекс
+        return func.coalesce(cls.nickname, literal_column("''"))
+
+    @validates("nickname")
+    def _sync_nickname_key(self, key, value):
+        self.nickname_key = nickname_key(value)
+        return value
+
 class RaidEvent(Base):
     __tablename__ = "raid_events"
     id = Column(Integer, primary_key=True)
@@ -40,6 +69,12 @@ class RaidParticipation(Base):
     joined_at = Column(DateTime, default=datetime.utcnow)
     status = Column(String)
 
+    __table_args__ = (
+        Index("ux_raid_participation_raid_user", "raid_id", "user_id", unique=True),  # Одна запись на игрока в рейде
+        Index("ix_raid_participation_raid_status", "raid_id", "status"),             # Отчёты и напоминания по статусу
+        Index("ix_raid_participation_user", "user_id"),                              # Активность игрока
+    )
+
 class RaidReminder(Base):
     __tablename__ = "raid_reminders"
     id = Column(Integer, primary_key=True)
@@ -47,6 +82,17 @@ class RaidReminder(Base):
     user_id = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ux_raid_reminders_raid_user", "raid_id", "user_id", unique=True),  # Одно напоминание на игрока
+    )
+
+class PinMessage(Base):
+    __tablename__ = "pin_messages"
+    id = Column(Integer, primary_key=True)
+    text_hash = Column(String, unique=True)  # pin_text_hash(text)
+    text = Column(String)                    # Текст пина хранится один раз на все отправки
+
+
 class RaidPinSendLog(Base):
     __tablename__ = "raid_pin_send_logs"
     id = Column(Integer, primary_key=True)
@@ -54,7 +100,15 @@ class RaidPinSendLog(Base):
     target_id = Column(Integer, ForeignKey("users.id"))
     raid_id = Column(Integer, ForeignKey("raid_events.id", ondelete="CASCADE"), nullable=True)
     sent_at = Column(DateTime, default=datetime.utcnow)
-    pin_text = Column(String)
+    pin_message_id = Column(Integer, ForeignKey("pin_messages.id"))  # Текст пина
+    # Пакет отправки: все получатели одного пина (группировка в журнале пинов)
+    batch_id = Column(Integer, ForeignKey("outbox_batches.id", ondelete="SET NULL"), nullable=True)
+
+    __table_args__ = (
+        Index("ix_raid_pin_send_logs_raid_target", "raid_id", "target_id"),  # Приглашённые в рейд
+        # Журнал пинов: последние пакеты читаются с конца индекса, без сортировки
+        Index("ix_raid_pin_send_logs_batch_sent_at", "batch_id", "sent_at", "admin_id", "target_id"),
+    )
 
 class RaidPinData(Base):
     __tablename__ = "raid_pin_data"
@@ -107,6 +161,31 @@ class PlayerProfile(Base):
     raid_reward_other = Column(String)                  # Другие награды
 
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Дата последнего обновления
+    content_hash = Column(String)                       # Хеш последнего сохранённого пип-боя
+    last_seen_at = Column(DateTime)                     # Когда игрок последний раз присылал пип-бой
+
+
+class ProfileSnapshot(Base):
+    # История профиля: строка на каждый изменившийся пип-бой (только числовые показатели).
+    # Ключ (game_id, taken_at) и WITHOUT ROWID — таблица сама является индексом, без отдельной копии ключа
+    __tablename__ = "profile_snapshots"
+
+    game_id = Column(Integer, primary_key=True, autoincrement=False)
+    taken_at = Column(Integer, primary_key=True, autoincrement=False)  # Unix-время (UTC), секунды
+
+    health_max = Column(Integer)
+    damage = Column(Integer)
+    armor = Column(Integer)
+    strength = Column(Integer)
+    accuracy = Column(Integer)
+    charisma = Column(Integer)
+    agility = Column(Integer)
+    stamina_max = Column(Integer)
+    caps = Column(Integer)
+    materials = Column(Integer)
+    bobbleheads = Column(Integer)
+
+    __table_args__ = {"sqlite_with_rowid": False}
 
 
 class GuidePage(Base):
@@ -129,3 +208,70 @@ class LocationInfo(Base):
     km = Column(Integer, unique=True, index=True)       # Расстояние в километрах
     title = Column(String)                              # Название локации
     description = Column(String)                        # Описание локации
+
+
+class ChatInfo(Base):
+
+    __tablename__ = "chat_info"
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False)  # ID чата в Telegram
+    type = Column(String)                               # Тип чата: private, group, supergroup, channel
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Когда тип последний раз подтверждён
+
+
+class OutboxBatch(Base):
+
+    __tablename__ = "outbox_batches"
+
+    id = Column(Integer, primary_key=True)
+    purpose = Column(String)                            # Назначение: broadcast, pin, reminder
+    admin_chat_id = Column(Integer, nullable=True)      # Куда отправить отчёт о доставке
+    total = Column(Integer, default=0)                  # Количество сообщений в пакете
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)       # Когда доставка пакета завершена
+
+
+class OutboxMessage(Base):
+
+    __tablename__ = "outbox_messages"
+
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(Integer, ForeignKey("outbox_batches.id", ondelete="CASCADE"), index=True)
+    chat_id = Column(Integer)                           # Получатель
+    text = Column(String, nullable=True)                # Текст сообщения (или подпись к фото)
+    photo_id = Column(String, nullable=True)            # file_id фото, если это фото
+    reply_markup = Column(String, nullable=True)        # Клавиатура в JSON
+    parse_mode = Column(String, nullable=True)
+
+    admin_id = Column(Integer, nullable=True)           # Кто отправил (для журнала пинов)
+    raid_id = Column(Integer, nullable=True)            # Рейд (для журнала пинов)
+    target_user_id = Column(Integer, nullable=True)     # users.id получателя (для журнала пинов)
+
+    status = Column(String, default="pending", index=True)  # pending, sent, failed
+    attempts = Column(Integer, default=0)               # Сколько раз пробовали отправить
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)  # Не раньше какого времени пробовать снова
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class FSMState(Base):
+    # Состояния и данные FSM (aiogram) — переживают перезапуск бота, см. utils/fsm_storage.py
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)              # Ключ StorageKey: бот:чат:пользователь:...
+    state = Column(String, nullable=True)
+    data = Column(String, default="{}")                 # Данные FSM в JSON
+    updated_at = Column(Integer, index=True)            # Unix-время последней записи (для TTL)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class PendingGuideDeletion(Base):
+    # Гайд, ожидающий подтверждения удаления: строка на админа. Хранится в БД, а не в памяти,
+    # чтобы подтверждение работало одинаково при нескольких процессах бота
+    __tablename__ = "pending_guide_deletions"
+
+    admin_id = Column(Integer, primary_key=True, autoincrement=False)  # Telegram ID админа
+    code = Column(String)                                              # Код гайда
+    expires_at = Column(Integer, index=True)                           # Unix-время, до которого действует запрос
@@ -0,0 +1,25 @@
+from typing import Union, Dict, Any
+
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+
+from services.guide_tree import guide_tree
+
+
+class GuideCodeFilter(BaseFilter):
+    # Пропускает только команды вида "/код", где код — существующий гайд.
+    # Проверка идёт по дереву в памяти, поэтому чужие команды не стоят ни запроса, ни сброса FSM
+    async def __call__(self, message: Message, session) -> Union[bool, Dict[str, Any]]:
+        text = message.text
+        if not text or not text.startswith("/"):
+            return False
+
+        parts = text[1:].split()
+        if not parts:
+            return False
+        code = parts[0].split("@")[0]
+
+        guide = (await guide_tree.load(session)).get(code)
+        if guide is None:
+            return False
+        return {"guide": guide}  # Найденный узел передаётся в хендлер
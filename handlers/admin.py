@@ -1,34 +1,45 @@
-from aiogram import Router, F
+from aiogram import Bot, Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
+from sqlalchemy import select, func, tuple_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 
 from config import ADMIN_IDS
-from database.db import session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User, PlayerProfile
 from handlers.fsm_cancel import cancel_fsm
-from keyboards.admin_menu import user_admin_menu, full_admin_menu, guidepage_admin_menu
+from keyboards.admin_menu import user_admin_menu, full_admin_menu, guidepage_admin_menu, import_profiles_keyboard
 from keyboards.cancel import cancel_keyboard
 from keyboards.edit_user import skip_or_cancel_keyboard
 from keyboards.location_menu import location_admin_menu
 from keyboards.main_menu import main_menu_keyboard
 from keyboards.raid_menu import raid_admin_menu
+from services.navigation import is_user_admin
+from services.nickname_index import nickname_index
+from services.profile_import import import_profiles, split_import_file
+from services.profile_parser import parse_profile_text
 from services.profile_parser_full import parse_full_profile
-from states.user_states import AddUser, EditUser
+from services.users import nickname_owner
+from states.user_states import AddUser, EditUser, ImportProfiles
 from utils.safe_send import safe_answer
+from utils.user_cache import user_cache
 
 router = Router()
 
+# Максимальный размер файла для массового импорта профилей
+IMPORT_FILE_LIMIT = 5 * 1024 * 1024
+
 
 @router.message(F.text == "/access")
-async def access_menu(message: Message):
+async def access_menu(message: Message, session: AsyncSession):
     # Проверяем, является ли пользователь супер-админом
     if message.from_user.id not in ADMIN_IDS:
         await safe_answer(message, "❌ Только супер админ может управлять доступом.")
         return
 
     # Получаем список всех администраторов из базы данных
-    admins = session.query(User).filter_by(is_admin=True).order_by(User.nickname).all()
+    admins = (await session.scalars(select(User).filter_by(is_admin=True).order_by(User.nickname))).all()
 
     # Формируем текстовое представление списка администраторов
     if not admins:
@@ -48,11 +59,9 @@ async def access_menu(message: Message):
 
 
 @router.message(F.text.in_(["🛠 Админ-панель", "🛠 Админ панель", "/admins_menu"]))
-async def admin_panel(message: Message):
-    # Получаем ID пользователя и проверяем, есть ли у него права администратора
-    user_id = message.from_user.id
-    user = session.query(User).filter_by(game_id=user_id).first()
-    if user_id not in ADMIN_IDS and not (user and user.is_admin):
+async def admin_panel(message: Message, is_admin: bool):
+    # Проверяем, есть ли у пользователя права администратора
+    if not is_admin:
         await safe_answer(message, "❌ У вас нет доступа к админ-панели.")
         return
 
@@ -62,14 +71,14 @@ async def admin_panel(message: Message):
 
 
 @router.message(lambda m: m.text and m.text.startswith("/list_admins"))
-async def list_admins(message: Message):
+async def list_admins(message: Message, session: AsyncSession):
     # Проверка: только супер-админы могут просматривать список админов
     if message.from_user.id not in ADMIN_IDS:
         await safe_answer(message, "❌ Только супер админ может просматривать список админов.")
         return
 
     # Получаем список всех администраторов
-    admins = session.query(User).filter_by(is_admin=True).order_by(User.nickname).all()
+    admins = (await session.scalars(select(User).filter_by(is_admin=True).order_by(User.nickname))).all()
 
     # Если админов нет, отправляем соответствующее сообщение
     if not admins:
@@ -83,12 +92,9 @@ async def list_admins(message: Message):
 
 
 @router.message(lambda m: m.text and m.text.startswith("/admin_help"))
-async def admin_help(message: Message):
+async def admin_help(message: Message, is_admin: bool):
     # Проверка: только админы могут получить справку
-    user_id = message.from_user.id
-    user = session.query(User).filter_by(game_id=user_id).first()
-
-    if user_id not in ADMIN_IDS and not (user and user.is_admin):
+    if not is_admin:
         await safe_answer(message, "❌ У вас нет доступа к справке администратора.")
         return
 
@@ -98,10 +104,12 @@ async def admin_help(message: Message):
         "📌 <b>Управление пользователями:</b>\n"
         "• /add_user — добавить игрока вручную\n"
         "• /add_user_forward — добавить из пересланного сообщения\n"
+        "• /import_profiles — массовый импорт пип-боев\n"
         "• /edit_user &lt;id&gt; — изменить игрока\n"
         "• /remove_user &lt;id&gt; — удалить игрока\n"
         "• /list_users [страница] — список игроков\n"
-        "• /info [id/ник] — показать профиль игрока\n\n"
+        "• /info [id/ник] — показать профиль игрока\n"
+        "• /find &lt;часть ника&gt; — поиск игрока по нику\n\n"
         "📌 <b>Управление администраторами:</b>\n"
         "• /set_admin &lt;id&gt; — выдать права\n"
         "• /unset_admin &lt;id&gt; — снять права\n"
@@ -129,38 +137,50 @@ async def admin_help(message: Message):
 
 
 @router.message(F.text.startswith("/list_users"))
-async def list_users(message: Message):
-    # Разбиваем сообщение, чтобы определить номер страницы
+async def list_users(message: Message, session: AsyncSession):
+    # /list_users [страница] [курсор]: курсор — id последнего игрока предыдущей страницы.
+    # С курсором страница выбирается по ключу (ник, id) без OFFSET — глубокие страницы не медленнее первой
     parts = message.text.strip().split()
-    page = int(parts[1]) if len(parts) == 2 and parts[1].isdigit() else 1
+    page = int(parts[1]) if len(parts) >= 2 and parts[1].isdigit() else 1
+    after_id = int(parts[2]) if len(parts) == 3 and parts[2].isdigit() else None
     page_size = 20  # Размер страницы
-    offset = (page - 1) * page_size  # Сдвиг для пагинации
 
     # Получаем общее количество пользователей
-    total_users = session.query(User).count()
-
-    # Загружаем пользователей на текущей странице
-    users = session.query(User).order_by(User.nickname).offset(offset).limit(page_size).all()
+    total_users = await session.scalar(select(func.count()).select_from(User))
+
+    # Одним запросом: игроки страницы + отметка «добавлен админом» + ник этого админа
+    admin = aliased(User)
+    query = (
+        select(User.id, User.game_id, User.nickname, PlayerProfile.added_by_admin, admin.nickname)
+        .outerjoin(PlayerProfile, PlayerProfile.game_id == User.game_id)
+        .outerjoin(admin, admin.game_id == PlayerProfile.added_by_admin_id)
+        .order_by(User.list_order_key(), User.id)
+        .limit(page_size)
+    )
+    if after_id is not None:
+        cursor = select(User.list_order_key().label("nickname"), User.id).filter(User.id == after_id).subquery()
+        query = query.filter(
+            # Отдельное условие на ник: по сравнению кортежей с выражением SQLite не ищет в индексе
+            User.list_order_key() >= select(cursor.c.nickname).scalar_subquery(),
+            tuple_(User.list_order_key(), User.id) > select(cursor.c.nickname, cursor.c.id).scalar_subquery(),
+        )
+    else:
+        # Прямой переход на страницу без курсора
+        query = query.offset((page - 1) * page_size)
+    rows = (await session.execute(query)).all()
 
-    if not users:
+    if not rows:
         await safe_answer(message, "❌ Пользователи не найдены на этой странице.")
         return
 
     lines = []
-    for u in users:
+    for _, game_id, nickname, added_by_admin, admin_nickname in rows:
         # Проверяем, был ли пользователь добавлен админом
-        profile = session.query(PlayerProfile).filter_by(game_id=u.game_id).first()
         note = ""
-        if profile and profile.added_by_admin:
-            admin = None
-            if profile.added_by_admin_id:
-                admin = session.query(User).filter_by(game_id=profile.added_by_admin_id).first()
-            if admin:
-                note = f"⚠️ добавлен {admin.nickname}"
-            else:
-                note = "⚠️ добавлен админом"
+        if added_by_admin:
+            note = f"⚠️ добавлен {admin_nickname}" if admin_nickname else "⚠️ добавлен админом"
         # Формируем строку пользователя
-        lines.append(f"• {u.game_id} — {u.nickname} {note}".strip())
+        lines.append(f"• {game_id} — {nickname} {note}".strip())
 
     # Вычисляем общее количество страниц
     total_pages = (total_users + page_size - 1) // page_size
@@ -172,44 +192,117 @@ async def list_users(message: Message):
         parse_mode="HTML"
     )
 
-    # Если есть следующая страница — предлагаем переход
-    if page < total_pages:
-        await safe_answer(message, f"➡️ Для следующей страницы: /list_users {page + 1}")
+    # Если есть следующая страница — предлагаем переход (с курсором по последнему игроку)
+    if page < total_pages and len(rows) == page_size:
+        await safe_answer(message, f"➡️ Для следующей страницы: /list_users {page + 1} {rows[-1].id}")
 
 
 @router.message(F.text == "/add_user_forward")
-async def add_user_forward(message: Message):
+async def add_user_forward(message: Message, session: AsyncSession):
     # Проверяем, есть ли реплай на сообщение
     if not message.reply_to_message or not message.reply_to_message.text:
         await safe_answer(message, "ℹ️ Используйте эту команду в ответ на сообщение с пип-боем.")
         return
 
-    # Извлекаем никнейм и ID из реплая
-    from services.profile_parser_full import extract_nickname_and_game_id
-    result = extract_nickname_and_game_id(message.reply_to_message)
-    if not result:
+    # Разбираем пип-бой из реплая один раз — запись используется и для проверки, и для профиля
+    record = parse_profile_text(message.reply_to_message.text)
+    if not record.nickname or not record.game_id:
         await safe_answer(message, "❌ Не удалось распознать пип-бой.")
         return
 
-    nickname, game_id = result
+    nickname, game_id = record.nickname, record.game_id
 
     # Проверяем, не существует ли уже такой пользователь
-    existing = session.query(User).filter_by(game_id=game_id).first()
+    existing = await session.scalar(select(User).filter_by(game_id=game_id))
     if existing:
         await safe_answer(message, "❌ Пользователь уже добавлен.")
         return
 
+    owner = await nickname_owner(session, nickname, game_id)
+    if owner:
+        await safe_answer(message, f"❌ Ник {owner.nickname} уже занят игроком с ID {owner.game_id}.")
+        return
+
     # Создаём нового пользователя
     user = User(game_id=game_id, nickname=nickname)
     session.add(user)
-    session.commit()
+    await session.commit()
+    nickname_index.put(game_id, "user", nickname)
+    user_cache.invalidate(game_id)
 
     # Парсим полный профиль из реплая
-    await parse_full_profile(message.reply_to_message, added_by_admin=True)
+    await parse_full_profile(session, message.reply_to_message, added_by_admin=True, record=record)
 
     await safe_answer(message, f"✅ Пользователь {nickname} добавлен (ID: {game_id}).")
 
 
+@router.message(F.text == "/import_profiles")
+async def cmd_import_profiles(message: Message, state: FSMContext, session: AsyncSession):
+    # Массовый импорт доступен только админам
+    if not await is_user_admin(session, message.from_user.id, fresh=True):
+        await safe_answer(message, "❌ У вас нет доступа к импорту профилей.")
+        return
+
+    await state.clear()
+    await state.update_data(from_menu="admin_users", import_texts=[])
+    await safe_answer(message,
+                      "📥 <b>Импорт профилей</b>\n\n"
+                      "Перешлите сюда пип-бои игроков (сколько угодно) или отправьте файл:\n"
+                      "• <code>.txt</code> — пип-бои подряд или через строку <code>---</code>\n"
+                      "• <code>.json</code> — список текстов или экспорт чата Telegram\n\n"
+                      "Когда закончите, нажмите <b>✅ Импортировать</b>.",
+                      reply_markup=import_profiles_keyboard(),
+                      parse_mode="HTML"
+                      )
+    await state.set_state(ImportProfiles.collecting)
+
+
+@router.message(ImportProfiles.collecting)
+async def collect_import_profiles(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+    # Проверка на отмену
+    if (message.text or "").lower() in ["отмена", "/cancel"]:
+        await cancel_fsm(message, state)
+        return
+
+    data = await state.get_data()
+    texts = data.get("import_texts", [])
+
+    if message.text == "✅ Импортировать":
+        if not texts:
+            await safe_answer(message, "ℹ️ Пока нечего импортировать — перешлите пип-бои или отправьте файл.")
+            return
+
+        await safe_answer(message, f"⏳ Импортирую {len(texts)} сообщений...")
+        result = await import_profiles(session, texts, message.from_user.id)
+        await state.clear()
+        await safe_answer(message,
+                          f"✅ <b>Импорт завершён</b>\n"
+                          f"🆕 Новых игроков: {result.created}\n"
+                          f"🔄 Обновлено: {result.updated}\n"
+                          f"⚠️ Не распознано: {result.skipped}",
+                          reply_markup=user_admin_menu(),
+                          parse_mode="HTML"
+                          )
+        return
+
+    # Файл с пип-боями
+    if message.document:
+        if (message.document.file_size or 0) > IMPORT_FILE_LIMIT:
+            await safe_answer(message, "❌ Файл слишком большой (максимум 5 МБ).")
+            return
+        file = await bot.download(message.document)
+        received = split_import_file(file.read().decode("utf-8-sig", errors="replace"))
+    elif message.text:
+        received = [message.text]
+    else:
+        await safe_answer(message, "ℹ️ Отправьте пип-бой текстом или файлом .txt / .json.")
+        return
+
+    texts = texts + received
+    await state.update_data(import_texts=texts)
+    await safe_answer(message, f"📥 Получено сообщений: {len(texts)}. Пришлите ещё или нажмите ✅ Импортировать.")
+
+
 @router.message(F.text == "/add_user")
 async def cmd_add_user(message: Message, state: FSMContext):
     # Очищаем предыдущее состояние FSM
@@ -256,7 +349,7 @@ async def add_nickname(message: Message, state: FSMContext):
 
 
 @router.message(AddUser.role)
-async def add_role(message: Message, state: FSMContext):
+async def add_role(message: Message, state: FSMContext, session: AsyncSession):
     # Проверка на отмену ввода
     if (message.text or "").lower() in ["отмена", "/cancel"]:
         await cancel_fsm(message, state)
@@ -277,6 +370,13 @@ async def add_role(message: Message, state: FSMContext):
         await state.clear()
         return
 
+    # Ник должен быть уникальным без учёта регистра
+    owner = await nickname_owner(session, data["nickname"], data["game_id"])
+    if owner:
+        await safe_answer(message, f"❌ Ник {owner.nickname} уже занят игроком с ID {owner.game_id}.")
+        await state.clear()
+        return
+
     # Создаём нового пользователя
     user = User(
         game_id=data["game_id"],
@@ -287,7 +387,9 @@ async def add_role(message: Message, state: FSMContext):
 
     try:
         # Сохраняем пользователя в БД
-        session.commit()
+        await session.commit()
+        nickname_index.put(user.game_id, "user", user.nickname)
+        user_cache.invalidate(user.game_id)
         # Отправляем подтверждение о добавлении
         await safe_answer(message,
                           f"✅ Пользователь <b>{user.nickname}</b> добавлен.",
@@ -296,7 +398,7 @@ async def add_role(message: Message, state: FSMContext):
                           )
     except IntegrityError:
         # Обработка ошибки уникальности ID
-        session.rollback()
+        await session.rollback()
         await safe_answer(message, "❌ Ошибка: пользователь с таким ID уже существует.")
 
     # Очищаем состояние FSM
@@ -304,7 +406,7 @@ async def add_role(message: Message, state: FSMContext):
 
 
 @router.message(F.text.startswith("/edit_user"))
-async def cmd_edit_user(message: Message, state: FSMContext):
+async def cmd_edit_user(message: Message, state: FSMContext, session: AsyncSession):
     # Разбиваем команду, чтобы получить ID пользователя
     parts = message.text.strip().split()
     if len(parts) != 2 or not parts[1].isdigit():
@@ -313,7 +415,7 @@ async def cmd_edit_user(message: Message, state: FSMContext):
 
     game_id = int(parts[1])
     # Ищем пользователя по ID
-    user = session.query(User).filter_by(game_id=game_id).first()
+    user = await session.scalar(select(User).filter_by(game_id=game_id))
     if not user:
         await safe_answer(message, "Пользователь не найден.")
         return
@@ -375,7 +477,7 @@ async def edit_squad(message: Message, state: FSMContext):
 
 
 @router.message(EditUser.role)
-async def edit_role(message: Message, state: FSMContext):
+async def edit_role(message: Message, state: FSMContext, session: AsyncSession):
     # Проверка на отмену
     if (message.text or "").lower() in ["отмена", "/cancel"]:
         await cancel_fsm(message, state)
@@ -388,12 +490,21 @@ async def edit_role(message: Message, state: FSMContext):
     # Получаем все данные из FSM
     data = await state.get_data()
     # Ищем пользователя по ID
-    user = session.query(User).filter_by(game_id=data["game_id"]).first()
+    user = await session.scalar(select(User).filter_by(game_id=data["game_id"]))
     if not user:
         await safe_answer(message, "Ошибка: пользователь не найден.")
         await state.clear()
         return
 
+    # Новый ник не должен совпадать с ником другого игрока (без учёта регистра)
+    if "nickname" in data:
+        owner = await nickname_owner(session, data["nickname"], user.game_id)
+        if owner:
+            await safe_answer(message, f"❌ Ник {owner.nickname} уже занят игроком с ID {owner.game_id}.",
+                              reply_markup=full_admin_menu())
+            await state.clear()
+            return
+
     # Обновляем данные пользователя, если они были изменены
     if "nickname" in data:
         user.nickname = data["nickname"]
@@ -405,7 +516,9 @@ async def edit_role(message: Message, state: FSMContext):
         user.role = data["role"]
 
     # Сохраняем изменения в БД
-    session.commit()
+    await session.commit()
+    nickname_index.put(user.game_id, "user", user.nickname)
+    user_cache.invalidate(user.game_id)
     # Отправляем подтверждение об обновлении
     await safe_answer(message, "✅ Данные пользователя обновлены.", reply_markup=full_admin_menu())
     # Очищаем состояние FSM
@@ -413,7 +526,7 @@ async def edit_role(message: Message, state: FSMContext):
 
 
 @router.message(F.text.startswith("/remove_user"))
-async def cmd_remove_user(message: Message):
+async def cmd_remove_user(message: Message, session: AsyncSession):
     # Разбиваем команду, чтобы получить ID пользователя
     parts = message.text.strip().split()
     if len(parts) != 2 or not parts[1].isdigit():
@@ -422,20 +535,22 @@ async def cmd_remove_user(message: Message):
 
     game_id = int(parts[1])
     # Ищем пользователя по ID
-    user = session.query(User).filter_by(game_id=game_id).first()
+    user = await session.scalar(select(User).filter_by(game_id=game_id))
     if not user:
         await safe_answer(message, "Пользователь не найден.")
         return
 
     # Удаляем пользователя из БД
-    session.delete(user)
-    session.commit()
+    await session.delete(user)
+    await session.commit()
+    nickname_index.discard(game_id, "user")
+    user_cache.invalidate(game_id)
     # Отправляем подтверждение об удалении
     await safe_answer(message, "Пользователь удалён.")
 
 
 @router.message(F.text.startswith("/set_admin"))
-async def set_admin(message: Message):
+async def set_admin(message: Message, session: AsyncSession):
     # Проверка: только админ может использовать эту команду
     if message.from_user.id not in ADMIN_IDS:
         await safe_answer(message, "❌ Только админ может выдавать права.")
@@ -449,20 +564,21 @@ async def set_admin(message: Message):
 
     game_id = int(parts[1])
     # Ищем пользователя по ID
-    user = session.query(User).filter_by(game_id=game_id).first()
+    user = await session.scalar(select(User).filter_by(game_id=game_id))
     if not user:
         await safe_answer(message, "❌ Пользователь не найден.")
         return
 
     # Выдаем права администратора
     user.is_admin = True
-    session.commit()
+    await session.commit()
+    user_cache.invalidate(game_id)
     # Отправляем подтверждение
     await safe_answer(message, f"✅ {user.nickname} теперь админ.")
 
 
 @router.message(F.text.startswith("/unset_admin"))
-async def unset_admin(message: Message):
+async def unset_admin(message: Message, session: AsyncSession):
     # Проверка: только админ может использовать эту команду
     if message.from_user.id not in ADMIN_IDS:
         await safe_answer(message, "❌ Только главный админ может снимать права.")
@@ -476,14 +592,15 @@ async def unset_admin(message: Message):
 
     game_id = int(parts[1])
     # Ищем пользователя по ID
-    user = session.query(User).filter_by(game_id=game_id).first()
+    user = await session.scalar(select(User).filter_by(game_id=game_id))
     if not user:
         await safe_answer(message, "❌ Пользователь не найден.")
         return
 
     # Снимаем права администратора
     user.is_admin = False
-    session.commit()
+    await session.commit()
+    user_cache.invalidate(game_id)
     # Отправляем подтверждение
     await safe_answer(message, f"🚫 {user.nickname} больше не админ.")
 
@@ -519,12 +636,7 @@ async def back_to_admin_panel(message: Message):
 
 
 @router.message(F.text == "⬅️ Выйти в главное меню")
-async def back_to_main_menu(message: Message):
-    # Получаем пользователя
-    user_id = message.from_user.id
-    user = session.query(User).filter_by(game_id=user_id).first()
-    is_admin = user_id in ADMIN_IDS or (user and user.is_admin)
-
+async def back_to_main_menu(message: Message, is_admin: bool):
     # Открываем главное меню
     await safe_answer(message,
                       "🏠 Главное меню",
@@ -1,24 +1,18 @@
 from utils.safe_send import safe_answer
 import os
-import shutil
 from aiogram import Router
 from aiogram.types import Message, FSInputFile
-from database.db import session
-from database.models import User
+from database.db import DB_PATH
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.backup import BACKUP_PATH, TELEGRAM_FILE_LIMIT_MB, create_backup
+from utils.user_cache import user_cache
 
 router = Router()
 
-# Путь к основной базе данных
-DB_PATH = "db_data/bot.db"
-# Путь к резервной копии базы данных
-BACKUP_PATH = "db_data/bot_backup.db"
-
 @router.message(lambda m: m.text and m.text.split()[0].split("@")[0] == "/backup_db")
-async def backup_db(message: Message):
-    # Получаем пользователя по его Telegram ID
-    user = session.query(User).filter_by(game_id=message.from_user.id).first()
-
-    # Проверяем, существует ли пользователь и является ли он администратором
+async def backup_db(message: Message, session: AsyncSession):
+    # Проверяем, существует ли пользователь и является ли он администратором (флаг читаем из БД, не из кэша)
+    user = await user_cache.get(session, message.from_user.id, fresh=True)
     if not user or not user.is_admin:
         print(f"[DEBUG] Пользователь {message.from_user.id} не админ или не найден")
         await safe_answer(message, "❌ У вас нет доступа.")
@@ -30,25 +24,30 @@ async def backup_db(message: Message):
         return
 
     try:
-        # Копируем основную базу в резервную копию
-        shutil.copy2(DB_PATH, BACKUP_PATH)
+        # Онлайн-бэкап в отдельном потоке: бот продолжает отвечать, копия согласованная
+        await safe_answer(message, "⏳ Создаю бэкап базы...")
+        gz_path = await create_backup()
 
-        # Вычисляем размер резервной копии в мегабайтах
+        # Вычисляем размеры резервной копии и архива в мегабайтах
         file_size = os.path.getsize(BACKUP_PATH) / (1024 * 1024)
+        gz_size = os.path.getsize(gz_path) / (1024 * 1024)
 
         # Сообщаем пользователю о создании бэкапа
-        await safe_answer(message, f"✅ Бэкап базы создан: {BACKUP_PATH}\nРазмер: {file_size:.2f} МБ")
+        await safe_answer(
+            message,
+            f"✅ Бэкап базы создан: {BACKUP_PATH}\nРазмер: {file_size:.2f} МБ (в архиве {gz_size:.2f} МБ)",
+        )
 
-        # Если файл больше 50 МБ — сообщаем, что его нельзя отправить через Telegram
-        if file_size > 50:
+        # Если даже архив больше 50 МБ — сообщаем, что его нельзя отправить через Telegram
+        if gz_size > TELEGRAM_FILE_LIMIT_MB:
             await safe_answer(message, "⚠️ Бэкап слишком большой для отправки в Telegram (>50 МБ). "
                                        "Скачайте его напрямую с сервера.")
             return
 
         # Создаём объект файла для отправки
-        backup_file = FSInputFile(BACKUP_PATH)
+        backup_file = FSInputFile(gz_path)
         # Отправляем файл пользователю
-        await message.answer_document(document=backup_file, caption="📁 Резервная копия базы данных")
+        await message.answer_document(document=backup_file, caption="📁 Резервная копия базы данных (gzip)")
 
     except Exception as e:
         # Обрабатываем ошибки при копировании или отправке файла
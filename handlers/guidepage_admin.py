@@ -1,15 +1,23 @@
+import time
+
 from aiogram import Router, types, F
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 
-from database.db import session
-from database.models import GuidePage, LocationInfo
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import GuidePage, PendingGuideDeletion
 from keyboards.admin_menu import guidepage_admin_menu
 from keyboards.cancel import cancel_keyboard
 from keyboards.delete_confirm import delete_confirm_keyboard
 from states.guidepage_states import AddGuidePage, EditGuidePage, DeleteGuidePage, GuidePaginationState
 from utils.safe_send import safe_answer
+from services.guide_tree import guide_tree
+from services.location_index import location_index
+from filters.guide_code import GuideCodeFilter
 
 router = Router()
 
@@ -17,33 +25,26 @@ router = Router()
 ITEMS_PER_PAGE = 20  # Количество элементов на странице при отображении гайдов
 DELETE_PAGE_SIZE = 20  # Количество элементов для удаления за один раз
 
-# Глобальная переменная для хранения временных данных о гайдах, которые будут удалены
-pending_deletions = {}  # Словарь: ключ — ID пользователя, значение — код гайда, который будет удален
-
-# Построение дерева гайдов
-def render_guide_tree(parent_code=None, level=0):
-    # Запрашиваем все гайды, которые являются дочерними по отношению к указанному родителю
-    guides = (
-        session.query(GuidePage)
-        .filter_by(parent_code=parent_code)  # Фильтруем по коду родителя
-        .order_by(GuidePage.created_at)  # Сортируем по дате создания
-        .all()
-    )
+# Сколько секунд действует запрос на удаление гайда: позже кнопка подтверждения уже ничего не удалит
+DELETE_CONFIRM_TTL = 5 * 60
+
+# Построение дерева гайдов (из кэша в памяти, без запросов к БД)
+def render_guide_tree(tree, parent_code=None, level=0):
     lines = []
-    for guide in guides:
-        indent = "  " * level  # Уровень вложенности для отступа
+    for guide, depth in tree.walk(parent_code, level):
+        indent = "  " * depth  # Уровень вложенности для отступа
         icon = "📂" if guide.text is None else "📄"  # Иконка: папка (если текста нет) или файл
         lines.append(f"{indent}{icon} {guide.title} — /{guide.code}")  # Добавляем строку в дерево
-        lines += render_guide_tree(guide.code, level + 1)  # Рекурсивно добавляем вложенные гайды
     return lines  # Возвращаем список строк дерева
 
 
 @router.message(F.text == "📚 Гайды")
-async def show_guides_menu(message: Message, state: FSMContext):
+async def show_guides_menu(message: Message, state: FSMContext, session: AsyncSession):
     await state.clear()  # Очищаем состояние FSM
 
     # Получаем только корневые разделы гайдов (без родителей)
-    root_guides = session.query(GuidePage).filter_by(parent_code=None).order_by(GuidePage.created_at).all()
+    tree = await guide_tree.load(session)
+    root_guides = tree.children()
 
     if not root_guides:
         # Если корневых гайдов нет — сообщаем об этом
@@ -77,11 +78,11 @@ async def start_add_page(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(AddGuidePage.title))
-async def input_parent_code(message: Message, state: FSMContext):
+async def input_parent_code(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(title=message.text.strip())  # Сохраняем заголовок
 
     # Отображаем дерево существующих гайдов для выбора родителя
-    lines = render_guide_tree()
+    lines = render_guide_tree(await guide_tree.load(session))
     tree_text = "\n".join(lines)
 
     await safe_answer(message,
@@ -93,14 +94,14 @@ async def input_parent_code(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(AddGuidePage.parent_code))
-async def input_text(message: Message, state: FSMContext):
+async def input_text(message: Message, state: FSMContext, session: AsyncSession):
     raw = message.text.strip().lstrip("/").split("@")[0]
     parent = None if raw == "-" else raw  # Обрабатываем ввод родителя
 
     if parent is not None:
         # Проверяем, существует ли указанный родительский раздел
-        exists = session.query(GuidePage).filter_by(code=parent).first()
-        if not exists:
+        tree = await guide_tree.load(session)
+        if not tree.get(parent):
             await safe_answer(message, "❌ Родитель с таким кодом не найден. Повторите ввод.")
             return
 
@@ -111,20 +112,19 @@ async def input_text(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(AddGuidePage.text))
-async def suggest_code(message: Message, state: FSMContext):
+async def suggest_code(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(text=None if message.text.strip() == "-" else message.text.strip())  # Сохраняем текст
 
     data = await state.get_data()
     parent_code = data["parent_code"] or "root"  # Получаем родительский код
 
     # Генерируем уникальный код на основе родительского раздела
-    existing_codes = session.query(GuidePage.code).filter(
-        GuidePage.parent_code == data["parent_code"]
-    ).all()
+    tree = await guide_tree.load(session)
+    existing_codes = [child.code for child in tree.children(data["parent_code"])]
 
     suffixes = []
     for c in existing_codes:
-        parts = c[0].split("_")
+        parts = c.split("_")
         if len(parts) > 1 and parts[0] == parent_code and parts[-1].isdigit():
             suffixes.append(int(parts[-1]))
     next_suffix = max(suffixes) + 1 if suffixes else 0
@@ -141,13 +141,13 @@ async def suggest_code(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(AddGuidePage.code))
-async def save_page(message: Message, state: FSMContext):
+async def save_page(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     user_code = message.text.strip()
     code = data["suggested_code"] if user_code.lower() in ["пропустить",
                                                            "skip"] else user_code  # Используем введённый или предложенный код
 
-    if session.query(GuidePage).filter_by(code=code).first():
+    if (await guide_tree.load(session)).get(code):
         await safe_answer(message, "❌ Такой код уже существует. Введите другой:")
         return
 
@@ -159,7 +159,8 @@ async def save_page(message: Message, state: FSMContext):
         text=data["text"]
     )
     session.add(page)
-    session.commit()
+    await session.commit()
+    guide_tree.add(page)  # Добавляем узел в кэш дерева
     await safe_answer(message, f"✅ Гайд /{page.code} добавлен.")
     await state.clear()
     await safe_answer(message, "↩️ Возврат в меню гайдов:", reply_markup=guidepage_admin_menu())  # Возвращаемся в меню
@@ -168,12 +169,12 @@ async def save_page(message: Message, state: FSMContext):
 # Редактирование
 
 @router.message(lambda m: m.text and "Редактировать гайд" in m.text)
-async def start_edit(message: Message, state: FSMContext):
+async def start_edit(message: Message, state: FSMContext, session: AsyncSession):
     await state.clear()  # Очищаем состояние FSM
     await state.update_data(from_menu="admin_guides")  # Сохраняем источник вызова
 
     # Отображаем дерево гайдов для выбора редактируемого
-    lines = render_guide_tree()
+    lines = render_guide_tree(await guide_tree.load(session))
     if not lines:
         await safe_answer(message, "📭 Гайдов пока нет.")
         return
@@ -184,10 +185,10 @@ async def start_edit(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(EditGuidePage.target_code))
-async def input_new_title(message: Message, state: FSMContext):
+async def input_new_title(message: Message, state: FSMContext, session: AsyncSession):
     code = message.text.strip().lstrip("/").split("@")[0]
-    page = session.query(GuidePage).filter_by(code=code).first()
-    if not page:
+    tree = await guide_tree.load(session)
+    if not tree.get(code):
         await safe_answer(message, "❌ Гайд с таким кодом не найден. Повторите ввод.")
         return
 
@@ -204,10 +205,10 @@ async def input_new_text(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(EditGuidePage.new_text))
-async def save_edit(message: Message, state: FSMContext):
+async def save_edit(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     code = data.get("target_code")
-    page = session.query(GuidePage).filter_by(code=code).first()
+    page = await session.scalar(select(GuidePage).filter_by(code=code))
     if not page:
         await safe_answer(message, "❌ Гайд не найден.")
         await state.clear()
@@ -219,16 +220,17 @@ async def save_edit(message: Message, state: FSMContext):
     if message.text.strip() != "-":
         page.text = message.text.strip()
 
-    session.commit()
+    await session.commit()
+    guide_tree.update(page)  # Обновляем узел в кэше дерева
     await safe_answer(message, f"✅ Гайд /{code} обновлён.")
     await state.clear()
     await safe_answer(message, "↩️ Возврат в меню гайдов:", reply_markup=guidepage_admin_menu())  # Возвращаемся в меню
 
 
 # Функция для отображения дерева гайдов при удалении (с пагинацией)
-def render_delete_tree_page(page: int = 0) -> tuple[str, InlineKeyboardMarkup | None]:
+def render_delete_tree_page(tree, page: int = 0) -> tuple[str, InlineKeyboardMarkup | None]:
     # Получаем все корневые разделы гайдов (без родителей)
-    parents = session.query(GuidePage).filter_by(parent_code=None).order_by(GuidePage.created_at).all()
+    parents = tree.children()
 
     # Рассчитываем диапазон элементов на текущей странице
     start = page * DELETE_PAGE_SIZE
@@ -239,8 +241,7 @@ def render_delete_tree_page(page: int = 0) -> tuple[str, InlineKeyboardMarkup |
     for p in visible:
         # Отображаем корневой раздел и его вложенные подкатегории
         lines.append(f"🗂 <b>{p.title}</b> — /{p.code}")
-        children = session.query(GuidePage).filter_by(parent_code=p.code).order_by(GuidePage.created_at).all()
-        for ch in children:
+        for ch in p.children:
             lines.append(f"  📄 {ch.title} — /{ch.code}")
 
     # Формируем текстовое представление дерева
@@ -259,67 +260,93 @@ def render_delete_tree_page(page: int = 0) -> tuple[str, InlineKeyboardMarkup |
 
 # Обработчик команды "Удалить гайд"
 @router.message(lambda m: m.text and "Удалить гайд" in m.text)
-async def start_delete(message: Message, state: FSMContext):
+async def start_delete(message: Message, state: FSMContext, session: AsyncSession):
     await state.clear()  # Очищаем состояние FSM
     await state.update_data(from_menu="admin_guides")  # Сохраняем источник вызова
     await state.set_state(DeleteGuidePage.target_code)  # Переходим к следующему шагу FSM
-    text, kb = render_delete_tree_page(0)  # Получаем первую страницу дерева
+    text, kb = render_delete_tree_page(await guide_tree.load(session), 0)  # Получаем первую страницу дерева
     await safe_answer(message, text, parse_mode="HTML", reply_markup=kb)  # Отправляем пользователю
 
 
 # Обработчик пагинации при удалении гайдов
 @router.callback_query(StateFilter(DeleteGuidePage.target_code), lambda c: c.data.startswith("del_page:"))
-async def paginate_delete_tree(callback: CallbackQuery, state: FSMContext):
+async def paginate_delete_tree(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     # Извлекаем номер страницы из callback
     page = int(callback.data.split(":")[1])
-    text, kb = render_delete_tree_page(page)  # Получаем нужную страницу дерева
+    text, kb = render_delete_tree_page(await guide_tree.load(session), page)  # Получаем нужную страницу дерева
     await callback.message.edit_text(text, parse_mode="HTML", reply_markup=kb)  # Обновляем сообщение
     await callback.answer()  # Подтверждаем обработку callback
 
 
 # Подтверждение удаления гайда
 @router.message(StateFilter(DeleteGuidePage.target_code))
-async def confirm_delete_code(message: Message, state: FSMContext):
+async def confirm_delete_code(message: Message, state: FSMContext, session: AsyncSession):
     # Извлекаем код гайда из сообщения
     code = message.text.strip().lstrip("/").split("@")[0]
 
     # Ищем гайд по коду
-    page = session.query(GuidePage).filter_by(code=code).first()
+    page = (await guide_tree.load(session)).get(code)
     if not page:
         await safe_answer(message, "❌ Гайд с таким кодом не найден.")
         return
 
-    # Сохраняем код гайда в глобальной переменной для последующего удаления
-    pending_deletions[message.from_user.id] = code
+    # Сбрасываем шаг FSM и запоминаем запрос в pending_guide_deletions (общая таблица для всех
+    # процессов бота) вместе со сроком действия; заодно удаляем просроченные запросы
+    await state.clear()
+    now = int(time.time())
+    await session.execute(delete(PendingGuideDeletion).filter(PendingGuideDeletion.expires_at < now))
+    stmt = insert(PendingGuideDeletion).values(
+        admin_id=message.from_user.id, code=code, expires_at=now + DELETE_CONFIRM_TTL
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["admin_id"],
+        set_={"code": stmt.excluded.code, "expires_at": stmt.excluded.expires_at},
+    ))
+    await session.commit()
     await safe_answer(
         message,
         f"❗️ Вы уверены, что хотите удалить гайд <b>{page.title}</b> — /{code}?",
         parse_mode="HTML",
         reply_markup=delete_confirm_keyboard  # Отправляем клавиатуру подтверждения
     )
-    await state.clear()  # Сбрасываем FSM
 
 
 # Обработчик подтверждения удаления
 @router.message(lambda m: m.text == "✅ Подтвердить удаление")
-async def confirm_delete_reply(message: Message, state: FSMContext):
-    # Извлекаем код гайда из глобальной переменной
-    code = pending_deletions.pop(message.from_user.id, None)
-    if not code:
+async def confirm_delete_reply(message: Message, state: FSMContext, session: AsyncSession):
+    # Забираем запрос из БД одним DELETE ... RETURNING в одной транзакции с удалением гайда: если админ
+    # нажмёт кнопку дважды, гайд удалит только один апдейт (в каком бы процессе он ни обрабатывался).
+    # Просроченный запрос не выполняем
+    await state.clear()
+    pending = (await session.execute(
+        delete(PendingGuideDeletion)
+        .filter_by(admin_id=message.from_user.id)
+        .returning(PendingGuideDeletion.code, PendingGuideDeletion.expires_at)
+    )).first()
+    if not pending:
+        await session.commit()
         await safe_answer(message, "❌ Не удалось определить, что удалять.")
         return
+    code = pending.code
+    if pending.expires_at < time.time():
+        await session.commit()
+        await safe_answer(message, "⌛ Запрос на удаление устарел. Выберите гайд заново.",
+                          reply_markup=guidepage_admin_menu())
+        return
 
     # Ищем гайд по коду
-    page = session.query(GuidePage).filter_by(code=code).first()
+    page = await session.scalar(select(GuidePage).filter_by(code=code))
     if page:
-        session.delete(page)  # Удаляем гайд
-        session.commit()
+        await session.delete(page)  # Удаляем гайд
+        await session.commit()
+        guide_tree.invalidate()  # Дерево перечитается при следующем просмотре
         await safe_answer(
             message,
             f"🗑 Гайд <b>{page.title}</b> — /{code} удалён.",
             parse_mode="HTML"
         )
     else:
+        await session.commit()
         await safe_answer(message, f"❌ Гайд /{code} не найден.", parse_mode="HTML")
 
     await safe_answer(message, "↩️ Возврат в меню гайдов:", reply_markup=guidepage_admin_menu())  # Возвращаемся в меню
@@ -327,16 +354,18 @@ async def confirm_delete_reply(message: Message, state: FSMContext):
 
 # Обработчик отмены удаления
 @router.message(lambda m: m.text == "❌ Отмена удаления")
-async def cancel_delete_reply(message: Message, state: FSMContext):
-    # Удаляем данные из глобальной переменной
-    pending_deletions.pop(message.from_user.id, None)
+async def cancel_delete_reply(message: Message, state: FSMContext, session: AsyncSession):
+    # Забываем запрос на удаление
+    await state.clear()
+    await session.execute(delete(PendingGuideDeletion).filter_by(admin_id=message.from_user.id))
+    await session.commit()
     await safe_answer(message, "↩️ Удаление отменено.", reply_markup=guidepage_admin_menu())  # Возвращаемся в меню
 
 
 # Список всех гайдов
 @router.message(lambda m: m.text and "Список гайдов" in m.text)
-async def show_full_guide_list(message: Message):
-    text, kb = build_list_tree()  # Получаем список гайдов
+async def show_full_guide_list(message: Message, session: AsyncSession):
+    text, kb = build_list_tree(await guide_tree.load(session))  # Получаем список гайдов
     await safe_answer(message, text, parse_mode="HTML", reply_markup=kb)  # Отправляем пользователю
 
 
@@ -344,14 +373,9 @@ async def show_full_guide_list(message: Message):
 LIST_PAGE_SIZE = 20  # Количество элементов на странице
 
 
-def build_list_tree(page=0):
+def build_list_tree(tree, page=0):
     # Получаем корневые разделы
-    parents = (
-        session.query(GuidePage)
-        .filter_by(parent_code=None)
-        .order_by(GuidePage.created_at)
-        .all()
-    )
+    parents = tree.children()
 
     # Рассчитываем диапазон элементов на текущей странице
     start = page * LIST_PAGE_SIZE
@@ -362,13 +386,7 @@ def build_list_tree(page=0):
     for p in visible:
         # Отображаем корневой раздел и его вложенные подкатегории
         lines.append(f"📂 /{p.code} — {p.title}")
-        children = (
-            session.query(GuidePage)
-            .filter_by(parent_code=p.code)
-            .order_by(GuidePage.created_at)
-            .all()
-        )
-        for ch in children:
+        for ch in p.children:
             lines.append(f"  └ 📄 /{ch.code} — {ch.title}")
 
     # Создаём клавиатуру для пагинации
@@ -392,21 +410,21 @@ def build_guide_pagination_kb(page: int, total: int, parent_code: str):
     return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
 
-# Обработчик команд вида "/код"
-@router.message(lambda m: m.text and m.text.startswith("/"))
-async def handle_any_guide_command(message: Message, state: FSMContext):
+# Обработчик команд вида "/код" (срабатывает только для существующих гайдов)
+@router.message(GuideCodeFilter())
+async def handle_any_guide_command(message: Message, state: FSMContext, session: AsyncSession, guide):
     await state.clear()  # Очищаем состояние FSM
 
-    # Извлекаем код гайда из команды
-    code = message.text[1:].split()[0].split("@")[0]
-
-    # Ищем гайд по коду
-    page = session.query(GuidePage).filter_by(code=code).first()
-    if not page:
-        return  # Если гайд не найден, завершаем обработку
+    # Гайд уже найден фильтром в кэше дерева
+    page = guide
 
     # Получаем дочерние разделы
-    children = session.query(GuidePage).filter_by(parent_code=page.code).order_by(GuidePage.created_at).all()
+    children = page.children
+
+    # Дополнительно: для раздела "map" берём готовый блок из индекса локаций
+    map_section = ""
+    if page.code == "map":
+        map_section = (await location_index.load(session)).map_section()
 
     # Сохраняем текущий раздел и переходим к просмотру
     await state.set_state(GuidePaginationState.browsing)
@@ -427,15 +445,7 @@ async def handle_any_guide_command(message: Message, state: FSMContext):
             text += f"• /{child.code} — {child.title}\n"
 
     # Дополнительно: если это раздел "map", добавляем информацию о локациях
-    if page.code == "map":
-        locations = session.query(LocationInfo).order_by(LocationInfo.km).all()
-        if locations:
-            text += "\n<b>📍 Информация о локациях:</b>\n\n"
-            for loc in locations:
-                name = loc.title or f"{loc.km} км"
-                emoji = name.strip().split()[0] if name.startswith(("⚡️", "⚠️", "💀", "🏕", "❄️")) else ""
-                clean_name = name.replace(emoji, "").strip() if emoji else name
-                text += f"▪️ {emoji} {clean_name} ({loc.km} км) — /loc_{loc.km}\n"
+    text += map_section
 
     # Создаём клавиатуру пагинации
     kb = build_guide_pagination_kb(page_index, len(children), page.code)
@@ -444,15 +454,22 @@ async def handle_any_guide_command(message: Message, state: FSMContext):
 
 # Обработчик пагинации при просмотре гайдов
 @router.callback_query(StateFilter(GuidePaginationState.browsing))
-async def paginate_guides(callback: types.CallbackQuery, state: FSMContext):
+async def paginate_guides(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     # Извлекаем данные из callback
     _, parent_code, page_index_str = callback.data.split(":")
     page_index = int(page_index_str)
     await callback.answer()
 
     # Получаем текущий раздел и его дочерние подкатегории
-    page = session.query(GuidePage).filter_by(code=parent_code).first()
-    children = session.query(GuidePage).filter_by(parent_code=parent_code).order_by(GuidePage.created_at).all()
+    page = (await guide_tree.load(session)).get(parent_code)
+    if not page:
+        return  # Раздел успели удалить
+    children = page.children
+
+    # Дополнительно: для раздела "map" берём готовый блок из индекса локаций
+    map_section = ""
+    if page.code == "map":
+        map_section = (await location_index.load(session)).map_section()
 
     # Рассчитываем диапазон элементов на текущей странице
     start = page_index * ITEMS_PER_PAGE
@@ -467,15 +484,7 @@ async def paginate_guides(callback: types.CallbackQuery, state: FSMContext):
             text += f"• /{child.code} — {child.title}\n"
 
     # Дополнительно: если это раздел "map", добавляем информацию о локациях
-    if page.code == "map":
-        locations = session.query(LocationInfo).order_by(LocationInfo.km).all()
-        if locations:
-            text += "\n<b>📍 Информация о локациях:</b>\n\n"
-            for loc in locations:
-                name = loc.title or f"{loc.km} км"
-                emoji = name.strip().split()[0] if name.startswith(("⚡️", "⚠️", "💀", "🏕", "❄️")) else ""
-                clean_name = name.replace(emoji, "").strip() if emoji else name
-                text += f"▪️ {emoji} {clean_name} ({loc.km} км) — /loc_{loc.km}\n"
+    text += map_section
 
     # Создаём клавиатуру пагинации
     kb = build_guide_pagination_kb(page_index, len(children), parent_code)
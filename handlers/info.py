@@ -1,49 +1,101 @@
+import html
+
 from utils.safe_send import safe_answer, safe_send_message
 from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 from database.models import User, PlayerProfile
-from database.db import session
+from sqlalchemy.ext.asyncio import AsyncSession
 from zoneinfo import ZoneInfo
-from sqlalchemy import func
+from datetime import datetime
+from sqlalchemy import select
+
+from services.nickname_index import nickname_index
+from services.profile_history import progress_rows
+from services.users import find_user_by_nickname
 
 router = Router()
 
+# Сколько совпадений показывать в /find
+FIND_LIMIT = 10
+
 
 @router.message(F.text == "/me")
-async def show_own_profile(message: Message):
-    # Ищем пользователя в БД по его Telegram ID
-    user = session.query(User).filter_by(game_id=message.from_user.id).first()
+async def show_own_profile(message: Message, session: AsyncSession, user: User | None):
+    # Игрок уже загружен UserIdentityMiddleware по Telegram ID
     if not user:
         await safe_answer(message, "❌ Вы не зарегистрированы.")
         return
 
     try:
         # Отправляем информацию о профиле текущего пользователя
-        await safe_answer(message, format_user_info(user), parse_mode="HTML")
+        await safe_answer(message, await format_user_info(session, user), parse_mode="HTML")
     except Exception as e:
         print(f"[ERROR] /me: {e}")
         await safe_answer(message, "❌ Ошибка при выводе профиля.")
 
 
+@router.message(Command("find"))
+async def find_users(message: Message, command: CommandObject, session: AsyncSession):
+    # Нечёткий поиск игроков по фрагменту ника (триграммный индекс в памяти)
+    if not command.args:
+        await safe_answer(message, "ℹ️ Использование: <code>/find часть ника</code>", parse_mode="HTML")
+        return
+
+    index = await nickname_index.load(session)
+    matches = index.search(command.args, limit=FIND_LIMIT)
+    if not matches:
+        await safe_answer(message, "❌ Никого похожего не нашлось.")
+        return
+
+    lines = [f"{i}. {html.escape(name)} — /info_{game_id}" for i, (game_id, name, _) in enumerate(matches, 1)]
+    await safe_answer(message,
+                      "🔎 <b>Похожие игроки:</b>\n" + "\n".join(lines),
+                      parse_mode="HTML"
+                      )
+
+
+@router.message(F.text.startswith("/progress"))
+async def show_progress(message: Message, session: AsyncSession, user: User | None):
+    # /progress — свой прогресс, /progress ID или /progress Ник — прогресс другого игрока
+    parts = message.text.strip().split(maxsplit=1)
+    if len(parts) > 1:
+        user = await try_get_user_from_text(session, parts[1].strip())
+    if not user:
+        await safe_answer(message, "❌ Пользователь не найден.")
+        return
+
+    rows = await progress_rows(session, user.game_id, [name for name, _ in PROGRESS_FIELDS])
+    if not rows:
+        await safe_answer(message, "ℹ️ История профиля пока пуста — обновите профиль пип-боем.")
+        return
+
+    try:
+        await safe_answer(message, format_progress(user, rows), parse_mode="HTML")
+    except Exception as e:
+        print(f"[ERROR] /progress: {e}")
+        await safe_answer(message, "❌ Ошибка при выводе прогресса.")
+
+
 @router.message(F.text.regexp(r"^/info_(.+)$").as_("match"))
-async def show_profile_by_direct_command(message: Message, match):
+async def show_profile_by_direct_command(message: Message, match, session: AsyncSession):
     # Извлекаем никнейм или ID из команды вида /info_никнейм или /info_ID
     query = match.group(1).strip()
-    user = try_get_user_from_text(query)
+    user = await try_get_user_from_text(session, query)
     if not user:
-        await safe_answer(message, "❌ Пользователь не найден.")
+        await safe_answer(message, "❌ Пользователь не найден. Поиск по части ника: /find фрагмент")
         return
 
     try:
         # Отправляем информацию о найденном пользователе
-        await safe_answer(message, format_user_info(user), parse_mode="HTML")
+        await safe_answer(message, await format_user_info(session, user), parse_mode="HTML")
     except Exception as e:
         print(f"[ERROR] /info_<user>: {e}")
         await safe_answer(message, "❌ Ошибка при выводе профиля.")
 
 
 @router.message(lambda m: m.text and m.text.startswith("/info"))
-async def show_other_profile(message: Message):
+async def show_other_profile(message: Message, session: AsyncSession):
     text = message.text.strip()
     parts = text.split(maxsplit=1)
 
@@ -62,11 +114,11 @@ async def show_other_profile(message: Message):
 
     elif arg:
         # Если указан аргумент — ищем пользователя по нему
-        user = try_get_user_from_text(arg)
+        user = await try_get_user_from_text(session, arg)
         if not user:
-            await safe_answer(message, "❌ Пользователь не найден.")
+            await safe_answer(message, "❌ Пользователь не найден. Поиск по части ника: /find фрагмент")
             return
-        await safe_answer(message, format_user_info(user), parse_mode="HTML")
+        await safe_answer(message, await format_user_info(session, user), parse_mode="HTML")
         return
 
     # Если не было реплая и нет аргумента — показываем помощь
@@ -75,35 +127,36 @@ async def show_other_profile(message: Message):
             "ℹ️ Используйте:\n"
             "• <code>/info</code> в ответ на сообщение\n"
             "• <code>/info ID</code> или <code>/info Ник</code>\n"
-            "• <code>/info_Ник</code> или <code>/info_ID</code> — напрямую",
+            "• <code>/info_Ник</code> или <code>/info_ID</code> — напрямую\n"
+            "• <code>/find часть ника</code> — поиск похожих ников",
             parse_mode="HTML"
         )
         return
 
     # Ищем пользователя по найденному ID
-    user = session.query(User).filter_by(game_id=target_id).first()
+    user = await session.scalar(select(User).filter_by(game_id=target_id))
     if not user:
         await safe_answer(message, "❌ Пользователь не найден.")
         return
 
     try:
         # Отправляем информацию о найденном пользователе
-        await safe_answer(message, format_user_info(user), parse_mode="HTML")
+        await safe_answer(message, await format_user_info(session, user), parse_mode="HTML")
     except Exception as e:
         print(f"[ERROR] /info: {e}")
         await safe_answer(message, "❌ Ошибка при выводе профиля.")
 
 
-def try_get_user_from_text(text: str):
+async def try_get_user_from_text(session, text: str):
     # Пытаемся найти пользователя по тексту (ID или никнейму)
     if text.isdigit():
-        return session.query(User).filter_by(game_id=int(text)).first()
-    return session.query(User).filter(func.lower(User.nickname) == text.lower()).first()
+        return await session.scalar(select(User).filter_by(game_id=int(text)))
+    return await find_user_by_nickname(session, text)
 
 
-def format_user_info(user: User) -> str:
+async def format_user_info(session, user: User) -> str:
     # Получаем подробный профиль пользователя
-    profile = session.query(PlayerProfile).filter_by(game_id=user.game_id).first()
+    profile = await session.scalar(select(PlayerProfile).filter_by(game_id=user.game_id))
 
     # Формируем строку с базовой информацией
     faction = user.faction or (profile.faction if profile else None) or "-"
@@ -135,3 +188,44 @@ def format_user_info(user: User) -> str:
     )
 
     return base + detailed
+
+
+# Показатели в отчёте /progress: поле снимка -> подпись
+PROGRESS_FIELDS = (
+    ("health_max", "❤️"),
+    ("damage", "⚔️"),
+    ("armor", "🛡"),
+    ("strength", "💪"),
+    ("accuracy", "🎯"),
+    ("charisma", "🗣"),
+    ("agility", "🤸🏽‍♂️"),
+    ("stamina_max", "🔋"),
+)
+
+
+def format_progress(user: User, rows) -> str:
+    # rows — снимки от новых к старым с приростами, посчитанными в SQL (см. progress_rows)
+    def moscow(ts, fmt):
+        return datetime.fromtimestamp(ts, ZoneInfo("Europe/Moscow")).strftime(fmt)
+
+    def deltas(row, prefix):
+        parts = [
+            f"{label} {'+' if delta > 0 else ''}{delta}"
+            for name, label in PROGRESS_FIELDS
+            if (delta := getattr(row, f"{prefix}{name}"))
+        ]
+        return ", ".join(parts)
+
+    latest = rows[0]
+    text = (
+        f"📈 <b>Прогресс: {user.nickname}</b>\n"
+        f"С {moscow(latest.first_at, '%d.%m.%Y')}: {deltas(latest, 'total_') or 'без изменений'}\n\n"
+        f"<b>Последние изменения:</b>\n"
+    )
+    for row in rows:
+        if row.taken_at == row.first_at:
+            changes = "первый снимок"
+        else:
+            changes = deltas(row, "d_") or "без изменений статов"
+        text += f"• {moscow(row.taken_at, '%d.%m %H:%M')} — {changes}\n"
+    return text
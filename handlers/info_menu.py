@@ -3,13 +3,16 @@ from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
-from database.db import session
+from sqlalchemy import select
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User, PlayerProfile
 from handlers.info import format_user_info
 from keyboards.cancel import cancel_keyboard
 from keyboards.info_menu import info_menu_keyboard
 from keyboards.main_menu import main_menu_keyboard
-from services.profile_parser_full import parse_full_profile, extract_nickname_and_game_id
+from services.profile_parser import parse_profile_text
+from services.profile_parser_full import parse_full_profile
 from states.info_states import InfoUpdate
 from utils.safe_send import safe_answer
 
@@ -32,27 +35,28 @@ async def update_request(message: Message, state: FSMContext):
 
 
 @router.message(InfoUpdate.awaiting_profile)
-async def handle_profile_forward(message: Message, state: FSMContext):
+async def handle_profile_forward(message: Message, state: FSMContext, session: AsyncSession):
     # Обрабатывает пересланное сообщение с игровым профилем
     if message.text and (message.text or "").lower() in ["отмена", "/cancel"]:
         from handlers.fsm_cancel import cancel_fsm
         await cancel_fsm(message, state)
         return
 
-    extracted = extract_nickname_and_game_id(message)
-    if not extracted:
+    # Разбираем пип-бой один раз — запись используется и для проверки, и для профиля
+    record = parse_profile_text(message.text)
+    if not record.nickname or not record.game_id:
         await safe_answer(message, "❌ Не удалось распознать профиль. Попробуйте ещё раз или нажмите Отмена.")
         return
 
-    profile_nick, game_id = extracted
-    user = session.query(User).filter_by(game_id=game_id).first()
+    profile_nick, game_id = record.nickname, record.game_id
+    user = await session.scalar(select(User).filter_by(game_id=game_id))
 
     if not user:
         await safe_answer(message, "❌ Игрок с таким ID не зарегистрирован. Обратитесь к администратору.")
         await state.clear()
         return
 
-    await parse_full_profile(message, silent=True)
+    await parse_full_profile(session, message, silent=True, record=record)
 
     if user.nickname.strip().lower() != profile_nick.strip().lower():
         await safe_answer(message,
@@ -68,19 +72,18 @@ async def handle_profile_forward(message: Message, state: FSMContext):
 
 
 @router.message(F.text.in_(["👤 Мой профиль", "👤 Посмотреть мой профиль"]))
-async def show_my_profile(message: Message):
+async def show_my_profile(message: Message, session: AsyncSession, user: User | None):
     # Отображает личный профиль пользователя
-    user = session.query(User).filter_by(game_id=message.from_user.id).first()
     if not user:
         await safe_answer(message, "❌ Вы не зарегистрированы.")
         return
 
-    profile = session.query(PlayerProfile).filter_by(game_id=user.game_id).first()
+    profile = await session.scalar(select(PlayerProfile).filter_by(game_id=user.game_id))
     if not profile:
         await safe_answer(message, "ℹ️ Подробный профиль ещё не загружен.")
         return
 
-    await safe_answer(message, format_user_info(user), parse_mode="HTML")
+    await safe_answer(message, await format_user_info(session, user), parse_mode="HTML")
 
 
 @router.message(F.text == "⬅️ Назад")
@@ -3,22 +3,17 @@ import re
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
-from database.db import session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import LocationInfo
 from keyboards.cancel import cancel_keyboard
 from states.location_states import EditLocationState
+from services.location_index import location_index
 
 router = Router()
 
-def render_location(km: int, loc: LocationInfo | None) -> str:
-    # Формирует текстовое представление локации для вывода пользователю
-    if not loc:
-        return f"📍 <b>{km} км</b>\n\nℹ️ Информация пока не добавлена."
-    return f"📍 <b>{km} — {loc.title}</b>\n\n{loc.description}"
-
-
 @router.message(lambda m: m.text and m.text.startswith("/loc_"))
-async def cmd_loc_lookup(message: Message):
+async def cmd_loc_lookup(message: Message, session: AsyncSession):
     # Обрабатывает команду вида /loc_1234 и отображает информацию о локации
     try:
         code = message.text.lstrip("/").split("@")[0]  # Удаляем префикс "/" и имя бота (если есть)
@@ -29,16 +24,16 @@ async def cmd_loc_lookup(message: Message):
         await safe_answer(message, "❌ Неверный формат команды.")
         return
 
-    loc = session.query(LocationInfo).filter_by(km=km).first()
-    await safe_answer(message, render_location(km, loc), parse_mode="HTML")
+    index = await location_index.load(session)
+    await safe_answer(message, index.card(km), parse_mode="HTML")
 
 
 @router.message(F.text.regexp(r"^!\s*(\d+)$").as_("match"))
-async def exclam_loc_lookup(message: Message, match: re.Match):
+async def exclam_loc_lookup(message: Message, match: re.Match, session: AsyncSession):
     # Обрабатывает команду вида !1234 и отображает информацию о локации
     km = int(match.group(1))
-    loc = session.query(LocationInfo).filter_by(km=km).first()
-    await safe_answer(message, render_location(km, loc), parse_mode="HTML")
+    index = await location_index.load(session)
+    await safe_answer(message, index.card(km), parse_mode="HTML")
 
 
 @router.message(F.text == "✏️ Редактировать локацию")
@@ -50,14 +45,14 @@ async def edit_location_start(message: Message, state: FSMContext):
 
 
 @router.message(EditLocationState.input_km)
-async def edit_location_title(message: Message, state: FSMContext):
+async def edit_location_title(message: Message, state: FSMContext, session: AsyncSession):
     # Проверяет, что введён корректный номер километра и запрашивает новое название
     if not message.text.isdigit():
         await safe_answer(message, "❗ Введите число.")
         return
 
     km = int(message.text)
-    loc = session.query(LocationInfo).filter_by(km=km).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=km))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         await state.clear()
@@ -77,10 +72,10 @@ async def edit_location_description(message: Message, state: FSMContext):
 
 
 @router.message(EditLocationState.new_description)
-async def save_location_edits(message: Message, state: FSMContext):
+async def save_location_edits(message: Message, state: FSMContext, session: AsyncSession):
     # Сохраняет изменения и завершает редактирование
     data = await state.get_data()
-    loc = session.query(LocationInfo).filter_by(km=data["km"]).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=data["km"]))
 
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
@@ -92,7 +87,8 @@ async def save_location_edits(message: Message, state: FSMContext):
     if message.text != "-":
         loc.description = message.text
 
-    session.commit()
+    await session.commit()
+    await location_index.refresh(session)
     await safe_answer(message, f"✅ Локация {loc.km} км обновлена.")
     await state.clear()
 
@@ -106,19 +102,20 @@ async def delete_location(message: Message, state: FSMContext):
 
 
 @router.message(EditLocationState.input_km)
-async def confirm_delete_location(message: Message, state: FSMContext):
+async def confirm_delete_location(message: Message, state: FSMContext, session: AsyncSession):
     # Проверяет, что введён корректный номер километра и удаляет локацию
     if not message.text.isdigit():
         await safe_answer(message, "❗ Введите число.")
         return
 
     km = int(message.text)
-    loc = session.query(LocationInfo).filter_by(km=km).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=km))
 
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
     else:
-        session.delete(loc)
-        session.commit()
+        await session.delete(loc)
+        await session.commit()
+        await location_index.refresh(session)
         await safe_answer(message, f"🗑 Локация {km} км удалена.")
     await state.clear()
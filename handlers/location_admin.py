@@ -4,11 +4,13 @@ from aiogram import Router, F
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
-from database.db import session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import LocationInfo
 from keyboards.location_menu import location_admin_menu
 from states.location_states import AddLocationState
 from keyboards.cancel import cancel_keyboard
+from services.location_index import location_index
 
 router = Router()
 
@@ -52,12 +54,12 @@ async def manual_input_description(message: Message, state: FSMContext):
     await state.set_state(AddLocationState.manual_description)
 
 @router.message(AddLocationState.manual_description)
-async def manual_save(message: Message, state: FSMContext):
+async def manual_save(message: Message, state: FSMContext, session: AsyncSession):
     # Сохраняет данные о новой локации
     await state.update_data(description=message.text)
     data = await state.get_data()
 
-    existing = session.query(LocationInfo).filter_by(km=data["km"]).first()
+    existing = await session.scalar(select(LocationInfo).filter_by(km=data["km"]))
     if existing:
         await safe_answer(message, "❌ Локация на этом км уже есть. Используйте редактирование.")
         await state.clear()
@@ -69,7 +71,8 @@ async def manual_save(message: Message, state: FSMContext):
         description=data["description"]
     )
     session.add(loc)
-    session.commit()
+    await session.commit()
+    await location_index.refresh(session)
     await safe_answer(message, f"✅ Локация {data['km']} км добавлена.")
     await state.clear()
 
@@ -83,7 +86,7 @@ async def wait_forwarded_location(message: Message, state: FSMContext):
     await state.set_state(AddLocationState.forwarded_text)
 
 @router.message(AddLocationState.forwarded_text)
-async def handle_forwarded_location(message: Message, state: FSMContext):
+async def handle_forwarded_location(message: Message, state: FSMContext, session: AsyncSession):
     # Обрабатывает пересланное сообщение и извлекает данные о локации
     text = message.text or message.caption or ""
     cleaned = re.sub(r"#\S+", "", text)  # Удаляем хэштеги
@@ -99,7 +102,7 @@ async def handle_forwarded_location(message: Message, state: FSMContext):
     title = title_match.group(0).strip().split("\n")[0] if title_match else f"{km} км"
     description = cleaned.replace(title, "", 1).strip()
 
-    existing = session.query(LocationInfo).filter_by(km=km).first()
+    existing = await session.scalar(select(LocationInfo).filter_by(km=km))
     if existing:
         await state.update_data(from_menu="admin_locations")
         await safe_answer(message, "❌ Локация на этом км уже есть. Используйте редактирование.")
@@ -108,7 +111,8 @@ async def handle_forwarded_location(message: Message, state: FSMContext):
 
     loc = LocationInfo(km=km, title=title, description=description)
     session.add(loc)
-    session.commit()
+    await session.commit()
+    await location_index.refresh(session)
 
     await state.clear()
     await safe_answer(message,
@@ -118,26 +122,28 @@ async def handle_forwarded_location(message: Message, state: FSMContext):
 
 # Отображение списка локаций
 @router.message(F.text == "📄 Список локаций")
-async def list_locations(message: Message):
+async def list_locations(message: Message, session: AsyncSession):
     # Отображает список всех сохранённых локаций
-    locations = session.query(LocationInfo).order_by(LocationInfo.km).all()
+    locations = (await location_index.load(session)).titles()
     if not locations:
         await safe_answer(message, "📭 Локации не найдены.")
         return
 
-    lines = [f"{loc.km} км — {loc.title}" for loc in locations]
+    lines = [f"{km} км — {title}" for km, title in locations]
     await safe_answer(message, "<b>📍 Список локаций:</b>\n\n" + "\n".join(lines), parse_mode="HTML")
 
 # Редактирование локации
 from states.location_states import EditLocationState
 
 @router.message(F.text == "✏️ Редактировать локацию")
-async def start_edit_location(message: Message, state: FSMContext):
+async def start_edit_location(message: Message, state: FSMContext, session: AsyncSession):
     # Начинает процесс редактирования локации
     await state.clear()
     await state.update_data(from_menu="admin_locations")
 
-    locations = session.query(LocationInfo).order_by(LocationInfo.km.desc()).limit(10).all()
+    locations = (await session.scalars(
+        select(LocationInfo).order_by(LocationInfo.km.desc()).limit(10)
+    )).all()
     if not locations:
         await safe_answer(message, "📭 Локаций пока нет.")
         return
@@ -150,10 +156,10 @@ async def start_edit_location(message: Message, state: FSMContext):
     await state.set_state(EditLocationState.input_km)
 
 @router.message(F.text.regexp(r"^/edit_loc_(\d{1,3})$").as_("match"))
-async def trigger_edit_by_command(message: Message, match: re.Match, state: FSMContext):
+async def trigger_edit_by_command(message: Message, match: re.Match, state: FSMContext, session: AsyncSession):
     # Обрабатывает команду /edit_loc_... и открывает меню редактирования
     km = int(match.group(1))
-    loc = session.query(LocationInfo).filter_by(km=km).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=km))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         return
@@ -177,11 +183,11 @@ async def trigger_edit_by_command(message: Message, match: re.Match, state: FSMC
     )
 
 @router.message(EditLocationState.choose_field)
-async def handle_field_choice(message: Message, state: FSMContext):
+async def handle_field_choice(message: Message, state: FSMContext, session: AsyncSession):
     # Обрабатывает выбор поля для редактирования
     text = message.text.strip()
     data = await state.get_data()
-    loc = session.query(LocationInfo).filter_by(km=data["km"]).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=data["km"]))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         await state.clear()
@@ -208,11 +214,11 @@ async def handle_field_choice(message: Message, state: FSMContext):
         await safe_answer(message, "Пожалуйста, выберите действие кнопкой.")
 
 @router.message(EditLocationState.new_title)
-async def save_new_title(message: Message, state: FSMContext):
+async def save_new_title(message: Message, state: FSMContext, session: AsyncSession):
     # Сохраняет новый заголовок локации
     title = message.text.strip()
     data = await state.get_data()
-    loc = session.query(LocationInfo).filter_by(km=data["km"]).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=data["km"]))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         await state.clear()
@@ -220,20 +226,21 @@ async def save_new_title(message: Message, state: FSMContext):
 
     if title != "-":
         loc.title = title
-        session.commit()
+        await session.commit()
+        await location_index.refresh(session)
 
     await state.clear()
     await safe_answer(message, f"✅ Заголовок локации {loc.km} км обновлён.", reply_markup=location_admin_menu())
 
 @router.message(EditLocationState.input_km)
-async def ask_new_description(message: Message, state: FSMContext):
+async def ask_new_description(message: Message, state: FSMContext, session: AsyncSession):
     # Проверяет корректность введённого номера км и запрашивает описание
     if not message.text.isdigit():
         await safe_answer(message, "Введите число.")
         return
 
     km = int(message.text)
-    loc = session.query(LocationInfo).filter_by(km=km).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=km))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         await state.clear()
@@ -250,10 +257,10 @@ async def ask_new_description(message: Message, state: FSMContext):
     await state.set_state(EditLocationState.new_description)
 
 @router.message(EditLocationState.new_description)
-async def save_new_description(message: Message, state: FSMContext):
+async def save_new_description(message: Message, state: FSMContext, session: AsyncSession):
     # Сохраняет новое описание локации
     data = await state.get_data()
-    loc = session.query(LocationInfo).filter_by(km=data["km"]).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=data["km"]))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         await state.clear()
@@ -261,7 +268,8 @@ async def save_new_description(message: Message, state: FSMContext):
 
     if message.text.strip() != "-":
         loc.description = message.text.strip()
-        session.commit()
+        await session.commit()
+        await location_index.refresh(session)
 
     await state.clear()
     await safe_answer(message, f"✅ Локация {loc.km} км обновлена.", reply_markup=location_admin_menu())
@@ -279,20 +287,21 @@ async def start_delete_location(message: Message, state: FSMContext):
     await state.set_state(DeleteLocationState.km)
 
 @router.message(DeleteLocationState.km)
-async def confirm_delete_location(message: Message, state: FSMContext):
+async def confirm_delete_location(message: Message, state: FSMContext, session: AsyncSession):
     # Подтверждает удаление локации по указанному км
     if not message.text.isdigit():
         await safe_answer(message, "Введите число.")
         return
 
     km = int(message.text)
-    loc = session.query(LocationInfo).filter_by(km=km).first()
+    loc = await session.scalar(select(LocationInfo).filter_by(km=km))
     if not loc:
         await safe_answer(message, "❌ Локация не найдена.")
         await state.clear()
         return
 
-    session.delete(loc)
-    session.commit()
+    await session.delete(loc)
+    await session.commit()
+    await location_index.refresh(session)
     await state.clear()
     await safe_answer(message, f"🗑 Локация {km} км удалена.", reply_markup=location_admin_menu())
@@ -1,14 +1,17 @@
-from utils.safe_send import safe_answer, safe_send_message
+from utils.safe_send import safe_answer
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 from aiogram.filters import StateFilter
 
 from states.raid_states import RaidAlert
-from database.db import session
+from sqlalchemy import select
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User
 from keyboards.cancel import cancel_keyboard
 from services.navigation import return_to_raid_admin_menu
+from utils.outbox import enqueue
 
 router = Router()
 
@@ -28,7 +31,7 @@ async def start_broadcast(message: Message, state: FSMContext):
 
 # Обработчик ввода текста/изображения для рассылки
 @router.message(StateFilter(RaidAlert.text))
-async def input_broadcast_content(message: Message, state: FSMContext):
+async def input_broadcast_content(message: Message, state: FSMContext, session: AsyncSession):
     content = {}
 
     # Проверяем тип сообщения (текст или фото)
@@ -44,8 +47,8 @@ async def input_broadcast_content(message: Message, state: FSMContext):
     await state.update_data(content=content)  # Сохраняем контент
 
     # Получаем все уникальные банды из БД
-    squads = session.query(User.squad).distinct().filter(User.squad.isnot(None)).all()
-    squads = [s[0] for s in squads if s[0]]  # Преобразуем результат в список
+    squads = (await session.scalars(select(User.squad).distinct().filter(User.squad.isnot(None)))).all()
+    squads = [s for s in squads if s]  # Преобразуем результат в список
 
     await state.update_data(squad_choices=squads)  # Сохраняем список банд
 
@@ -60,7 +63,7 @@ async def input_broadcast_content(message: Message, state: FSMContext):
 
 # Обработчик выбора целевой аудитории
 @router.message(StateFilter(RaidAlert.target))
-async def send_broadcast(message: Message, state: FSMContext):
+async def send_broadcast(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     content = data.get("content", {})
     squads = data.get("squad_choices", [])
@@ -69,46 +72,30 @@ async def send_broadcast(message: Message, state: FSMContext):
 
     # Определяем целевую аудиторию на основе ввода пользователя
     if raw == "*":
-        users = session.query(User).all()  # Все пользователи
+        query = select(User)  # Все пользователи
     elif raw == "0":
-        users = session.query(User).filter(User.squad.isnot(None)).all()  # Все с бандой
+        query = select(User).filter(User.squad.isnot(None))  # Все с бандой
     else:
         try:
             indexes = [int(x) for x in raw.split(",")]  # Парсим номера банд
             selected = [squads[i - 1] for i in indexes if 0 < i <= len(squads)]  # Выбираем нужные банды
             if not selected:
                 raise ValueError
-            users = session.query(User).filter(User.squad.in_(selected)).all()  # Пользователи выбранных банд
+            query = select(User).filter(User.squad.in_(selected))  # Пользователи выбранных банд
         except:
             await safe_answer(message, "⚠️ Неверный ввод. Используй номера через запятую (например: 1,3)")
             return
 
-    count = 0
-    # Отправляем сообщение всем пользователям в списке
-    for user in users:
-        if user.game_id:
-            try:
-                if "photo_id" in content:
-                    # Если это фото — отправляем его
-                    await message.bot.send_photo(
-                        chat_id=user.game_id,
-                        photo=content["photo_id"],
-                        caption=content.get("caption", ""),
-                        parse_mode="HTML"
-                    )
-                else:
-                    # Если это текст — отправляем его
-                    await safe_send_message(
-                        bot=message.bot,
-                        chat_id=user.game_id,
-                        text=content["text"],
-                        parse_mode="HTML"
-                    )
-                count += 1  # Увеличиваем счётчик успешных отправок
-            except Exception as e:
-                print(f"[ERROR] Рассылка {user.nickname}: {e}")  # Логируем ошибки
-
-    # Сообщаем о результатах рассылки
-    await safe_answer(message, f"✅ Рассылка отправлена {count} игрокам.")
+    users = (await session.scalars(query)).all()
+
+    # Ставим сообщения в очередь — доставит фоновый воркер, итоги придут отдельным сообщением
+    if "photo_id" in content:
+        payload = {"photo_id": content["photo_id"], "text": content.get("caption", ""), "parse_mode": "HTML"}
+    else:
+        payload = {"text": content["text"], "parse_mode": "HTML"}
+    messages = [{"chat_id": user.game_id, **payload} for user in users if user.game_id]
+    await enqueue(session, "broadcast", messages, admin_chat_id=message.chat.id)
+
+    await safe_answer(message, f"📤 Рассылка поставлена в очередь: {len(messages)} получателей. Итоги пришлю по завершении.")
     await state.clear()  # Очищаем состояние
     await return_to_raid_admin_menu(message)  # Возвращаемся в меню администратора
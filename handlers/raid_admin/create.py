@@ -6,9 +6,12 @@ from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from pytz import timezone
 
 from states.raid_states import RaidEventCreate
+from sqlalchemy import select
+
 from database.models import RaidEvent, User
-from database.db import session
+from sqlalchemy.ext.asyncio import AsyncSession
 from keyboards.cancel import cancel_keyboard
+from utils.scheduler import raid_scheduler
 from datetime import datetime, timedelta
 
 router = Router()
@@ -23,13 +26,13 @@ async def start_create_raid(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(RaidEventCreate.name))
-async def input_name(message: Message, state: FSMContext):
+async def input_name(message: Message, state: FSMContext, session: AsyncSession):
     # Сохраняем введённое название
     await state.update_data(name=message.text.strip())
 
     # Получаем все уникальные банды из базы данных
-    squads = session.query(User.squad).distinct().filter(User.squad.isnot(None)).all()
-    squads = [s[0] for s in squads if s[0]]
+    squads = (await session.scalars(select(User.squad).distinct().filter(User.squad.isnot(None)))).all()
+    squads = [s for s in squads if s]
 
     # Если банд нет — завершаем процесс
     if not squads:
@@ -87,7 +90,7 @@ async def input_squad(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(RaidEventCreate.time))
-async def input_time(message: Message, state: FSMContext):
+async def input_time(message: Message, state: FSMContext, session: AsyncSession):
     try:
         # Парсим дату и время
         user_input = message.text.strip()
@@ -109,7 +112,10 @@ async def input_time(message: Message, state: FSMContext):
         status="active"
     )
     session.add(new_raid)
-    session.commit()
+    await session.commit()
+
+    # Ставим напоминания и завершение рейда в очередь планировщика
+    raid_scheduler.schedule_raid(new_raid)
 
     # Сохраняем ID созданного рейда в FSM для пина
     await state.update_data(raid_id=new_raid.id)
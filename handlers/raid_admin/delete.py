@@ -3,19 +3,22 @@ from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
-from database.db import session
+from sqlalchemy import select
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import RaidEvent
 from states.raid_states import DeleteRaid
 from keyboards.cancel import cancel_keyboard
 from services.navigation import return_to_raid_admin_menu
+from utils.scheduler import raid_scheduler
 
 router = Router()
 
 
 @router.message(F.text == "🗑 Удалить рейд")
-async def delete_raid_start(message: Message, state: FSMContext):
+async def delete_raid_start(message: Message, state: FSMContext, session: AsyncSession):
     # Получаем последние 10 рейдов из БД, отсортированных по времени (сначала новые)
-    raids = session.query(RaidEvent).order_by(RaidEvent.start_time.desc()).limit(10).all()
+    raids = (await session.scalars(select(RaidEvent).order_by(RaidEvent.start_time.desc()).limit(10))).all()
 
     if not raids:
         # Если рейдов нет — сообщаем об этом
@@ -56,7 +59,7 @@ async def cancel_deletion(message: Message, state: FSMContext):
 
 
 @router.message(DeleteRaid.awaiting_raid_id)
-async def delete_raid_by_id(message: Message, state: FSMContext):
+async def delete_raid_by_id(message: Message, state: FSMContext, session: AsyncSession):
     # Проверяем, что введённый текст — число
     text = message.text.strip()
     if not text.isdigit():
@@ -66,7 +69,7 @@ async def delete_raid_by_id(message: Message, state: FSMContext):
     # Преобразуем введённый ID в целое число
     raid_id = int(text)
     # Ищем рейд в БД
-    raid = session.query(RaidEvent).filter_by(id=raid_id).first()
+    raid = await session.scalar(select(RaidEvent).filter_by(id=raid_id))
 
     if not raid:
         # Если рейд не найден — сообщаем об этом
@@ -75,8 +78,10 @@ async def delete_raid_by_id(message: Message, state: FSMContext):
         return
 
     # Удаляем рейд из БД
-    session.delete(raid)
-    session.commit()
+    await session.delete(raid)
+    await session.commit()
+    # Снимаем события рейда из очереди планировщика
+    raid_scheduler.cancel_raid(raid_id)
 
     # Сообщаем об успешном удалении
     await safe_answer(message, f"🗑 Рейд <b>{raid.name}</b> успешно удалён.", parse_mode="HTML")
@@ -1,33 +1,41 @@
 from utils.safe_send import safe_answer
 from aiogram import Router, F
 from aiogram.types import Message
-from sqlalchemy import func
-from database.db import session
-from database.models import RaidPinSendLog, User
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import PinMessage, RaidPinSendLog, User
 
 router = Router()
 
 
 @router.message(F.text == "📒 Журнал пинов")
-async def view_pin_send_log(message: Message):
-    # Выполняем группировку записей из таблицы RaidPinSendLog:
-    # - Группируем по админу и тексту пина
-    # - Для каждой группы получаем минимальную дату отправки (время первой отправки)
-    # - Считаем количество получателей
-    # - Сортируем по времени в обратном порядке (сначала самые новые)
-    # - Ограничиваем результат 10 записями
-    grouped_logs = (
-        session.query(
-            RaidPinSendLog.admin_id,
-            RaidPinSendLog.pin_text,
+async def view_pin_send_log(message: Message, session: AsyncSession):
+    # Последние 10 пакетов отправки одним запросом:
+    # - Группируем записи RaidPinSendLog по пакету (batch_id); id пакетов растут со временем,
+    #   поэтому SQLite читает индекс ix_raid_pin_send_logs_batch_sent_at с конца и
+    #   останавливается после 10 пакетов, не трогая тексты пинов
+    # - Для каждого пакета: время первой отправки, количество получателей и первая запись
+    # - Текст пина берём из pin_messages по первой записи пакета, ник админа — через join с users
+    batches = (
+        select(
+            RaidPinSendLog.batch_id,
+            func.min(RaidPinSendLog.admin_id).label("admin_id"),  # В пакете один отправитель
             func.min(RaidPinSendLog.sent_at).label("sent_at"),
-            func.count(RaidPinSendLog.target_id).label("recipients_count")
+            func.count(RaidPinSendLog.target_id).label("recipients_count"),
+            func.min(RaidPinSendLog.id).label("first_log_id"),
         )
-        .group_by(RaidPinSendLog.admin_id, RaidPinSendLog.pin_text)
-        .order_by(func.min(RaidPinSendLog.sent_at).desc())
+        .group_by(RaidPinSendLog.batch_id)
+        .order_by(RaidPinSendLog.batch_id.desc())
         .limit(10)
-        .all()
+        .subquery()
     )
+    grouped_logs = (await session.execute(
+        select(batches, PinMessage.text.label("pin_text"), User.nickname.label("admin_name"))
+        .join(RaidPinSendLog, RaidPinSendLog.id == batches.c.first_log_id)
+        .outerjoin(PinMessage, PinMessage.id == RaidPinSendLog.pin_message_id)
+        .outerjoin(User, User.game_id == batches.c.admin_id)
+        .order_by(batches.c.batch_id.desc())
+    )).all()
 
     if not grouped_logs:
         # Если журнал пуст — сообщаем об этом
@@ -48,15 +56,13 @@ async def view_pin_send_log(message: Message):
 
     # Проходимся по каждой записи из результата запроса
     for i, log in enumerate(grouped_logs, start=1):
-        # Получаем администратора по его ID
-        admin = session.query(User).filter_by(game_id=log.admin_id).first()
-        admin_name = admin.nickname if admin else f"id:{log.admin_id}"
+        admin_name = log.admin_name or f"id:{log.admin_id}"
 
         # Форматируем дату отправки
         time = log.sent_at.strftime('%d.%m %H:%M')
 
         # Разбиваем текст пина на строки и очищаем от лишних пробелов
-        pin_lines = [line.strip() for line in log.pin_text.splitlines() if line.strip()]
+        pin_lines = [line.strip() for line in (log.pin_text or "").splitlines() if line.strip()]
         title = pin_lines[0] if len(pin_lines) > 0 else "-"  # Заголовок
         location = pin_lines[1] if len(pin_lines) > 1 else "-"  # Локация
         body = " ".join(pin_lines[2:]) if len(pin_lines) > 2 else "-"  # Основной текст
@@ -1,29 +1,31 @@
-from utils.safe_send import safe_answer, safe_send_message
+from utils.safe_send import safe_answer
 from aiogram import Router, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import StateFilter
-from datetime import datetime
 from pytz import timezone
 
 from states.pin_states import PinFSM
-from database.models import User, RaidEvent, RaidPinSendLog, RaidPinData
-from database.db import session
+from sqlalchemy import select
+
+from database.models import User, RaidEvent, RaidPinData
+from sqlalchemy.ext.asyncio import AsyncSession
 from keyboards.cancel import cancel_keyboard
 from keyboards.raid_menu import raid_admin_menu
+from utils.outbox import enqueue
 
 router = Router()
 
 # 📍 Старт выдачи пина: выбор рейда
 @router.message(F.text == "📍 Выдать пин для рейда")
-async def start_pin_select_raid(message: Message, state: FSMContext):
+async def start_pin_select_raid(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     raid_id = data.get("raid_id")
 
     await state.update_data(from_menu="raid_admin")  # Для кнопки Отмена
 
     if raid_id:
-        raid = session.query(RaidEvent).filter_by(id=raid_id).first()
+        raid = await session.scalar(select(RaidEvent).filter_by(id=raid_id))
         if raid:
             await state.update_data(raid_id=raid.id)
             await state.set_state(PinFSM.km)
@@ -31,12 +33,11 @@ async def start_pin_select_raid(message: Message, state: FSMContext):
             return
 
     # Если raid_id нет — выводим список активных рейдов
-    raids = (
-        session.query(RaidEvent)
+    raids = (await session.scalars(
+        select(RaidEvent)
         .filter(RaidEvent.status == "active")
         .order_by(RaidEvent.start_time.asc())
-        .all()
-    )
+    )).all()
 
     if not raids:
         await safe_answer(message, "❌ Нет активных рейдов для выдачи пина.")
@@ -127,10 +128,10 @@ async def pin_enter_title(message: Message, state: FSMContext):
 
 # 📍 Ввод описания и предпросмотр
 @router.message(StateFilter(PinFSM.text))
-async def pin_enter_description(message: Message, state: FSMContext):
+async def pin_enter_description(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(description=message.text.strip())
     data = await state.get_data()
-    raid = session.query(RaidEvent).filter_by(id=data.get("raid_id")).first()
+    raid = await session.scalar(select(RaidEvent).filter_by(id=data.get("raid_id")))
 
     if not raid:
         await safe_answer(message, "❌ Рейд не найден.")
@@ -170,9 +171,9 @@ async def pin_editing(message: Message, state: FSMContext):
 
 # 📍 Отправка пина
 @router.message(StateFilter(PinFSM.confirm), F.text == "✅ Отправить пин")
-async def pin_send(message: Message, state: FSMContext):
+async def pin_send(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
-    raid = session.query(RaidEvent).filter_by(id=data.get("raid_id")).first()
+    raid = await session.scalar(select(RaidEvent).filter_by(id=data.get("raid_id")))
 
     if not raid:
         await safe_answer(message, "❌ Рейд не найден.")
@@ -180,7 +181,7 @@ async def pin_send(message: Message, state: FSMContext):
         return
 
     # Сохраняем или обновляем данные пина для рейда
-    existing = session.query(RaidPinData).filter_by(raid_id=raid.id).first()
+    existing = await session.scalar(select(RaidPinData).filter_by(raid_id=raid.id))
     if existing:
         existing.title = data["title"]
         existing.km = data["km"]
@@ -192,15 +193,16 @@ async def pin_send(message: Message, state: FSMContext):
             km=data["km"],
             description=data["description"]
         ))
-    session.commit()
+    await session.commit()
 
     squad = raid.squad
     if squad == "ALL_USERS":
-        users = session.query(User).all()
+        query = select(User)
     elif squad == "ALL_SQUADS":
-        users = session.query(User).filter(User.squad.isnot(None)).all()
+        query = select(User).filter(User.squad.isnot(None))
     else:
-        users = session.query(User).filter(User.squad.in_([s.strip() for s in squad.split(",")])).all()
+        query = select(User).filter(User.squad.in_([s.strip() for s in squad.split(",")]))
+    users = (await session.scalars(query)).all()
 
     pin_text = (
         f"<b>{data['title']}</b>\n"
@@ -214,30 +216,21 @@ async def pin_send(message: Message, state: FSMContext):
         [InlineKeyboardButton(text="🔔 Напомнить", callback_data=f"remind_{raid.id}")]
     ])
 
-    count = 0
-    for user in users:
-        if user.game_id:
-            try:
-                await safe_send_message(
-                    bot=message.bot,
-                    chat_id=user.game_id,
-                    text=pin_text,
-                    reply_markup=markup,
-                    parse_mode="HTML"
-                )
-                log = RaidPinSendLog(
-                    admin_id=message.from_user.id,
-                    raid_id=raid.id,
-                    target_id=user.id,
-                    pin_text=pin_text,
-                    sent_at=datetime.utcnow(),
-                )
-                session.add(log)
-                count += 1
-            except Exception as e:
-                print(f"Ошибка отправки пина: {e}")
-                continue
-
-    session.commit()
-    await safe_answer(message, f"✅ Пин отправлен {count} игрокам.", reply_markup=raid_admin_menu())
+    # Ставим пины в очередь; воркер отправит их и запишет в журнал отправок
+    reply_markup = markup.model_dump_json(exclude_none=True)
+    messages = [
+        {
+            "chat_id": user.game_id,
+            "text": pin_text,
+            "reply_markup": reply_markup,
+            "parse_mode": "HTML",
+            "admin_id": message.from_user.id,
+            "raid_id": raid.id,
+            "target_user_id": user.id,
+        }
+        for user in users if user.game_id
+    ]
+    await enqueue(session, "pin", messages, admin_chat_id=message.chat.id)
+
+    await safe_answer(message, f"📤 Пин поставлен в очередь: {len(messages)} игрокам.", reply_markup=raid_admin_menu())
     await state.clear()
@@ -2,13 +2,25 @@ from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 
-from database.db import session
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User, RaidEvent, RaidParticipation, RaidReminder, RaidPinData
 from utils.safe_send import safe_answer
 
 router = Router()
 
 
+# Записывает или обновляет участие игрока в рейде (upsert по уникальному индексу)
+async def upsert_participation(session, raid_id: int, user_id: int, status: str, joined_at: datetime):
+    stmt = insert(RaidParticipation).values(raid_id=raid_id, user_id=user_id, status=status, joined_at=joined_at)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["raid_id", "user_id"],
+        set_={"status": stmt.excluded.status, "joined_at": stmt.excluded.joined_at},
+    ))
+
+
 # Функция для построения клавиатуры рейда (кнопки "Записаться", "Отменить", "Напомнить")
 def build_raid_markup(raid_id: int, user_participates: bool) -> InlineKeyboardMarkup:
     first_row = []
@@ -36,27 +48,23 @@ def build_raid_markup(raid_id: int, user_participates: bool) -> InlineKeyboardMa
 
 # Обработчик для отображения ближайших активных рейдов
 @router.callback_query(F.data == "raid_upcoming")
-async def raid_upcoming_handler(callback: CallbackQuery):
+async def raid_upcoming_handler(callback: CallbackQuery, session: AsyncSession, user: User | None):
     await callback.answer()  # Подтверждение получения запроса
     now = datetime.utcnow()  # Текущее время (UTC)
 
     # Получаем до 5 активных будущих рейдов
-    events = (
-        session.query(RaidEvent)
+    events = (await session.scalars(
+        select(RaidEvent)
         .filter(RaidEvent.start_time >= now, RaidEvent.status == "active")  # Только будущие и активные
         .order_by(RaidEvent.start_time.asc())  # Сортируем по времени (сначала ближайшие)
         .limit(5)  # Ограничиваем до 5
-        .all()
-    )
+    )).all()
 
     if not events:
         # Если рейдов нет — сообщаем об этом
         await safe_answer(callback.message, "❌ Нет запланированных рейдов.")
         return
 
-    # Получаем пользователя из БД
-    user = session.query(User).filter_by(game_id=callback.from_user.id).first()
-
     for ev in events:
         dt = ev.start_time.strftime("%d.%m %H:%M")  # Форматируем дату старта
         # Словарь для иконок статуса
@@ -69,11 +77,11 @@ async def raid_upcoming_handler(callback: CallbackQuery):
 
         participates = False
         if user:
-            # Проверяем, записан ли пользователь на этот рейд
+            # Проверяем, записан ли пользователь на этот рейд (отказ тоже хранится в raid_participation)
             participates = (
-                session.query(RaidParticipation)
-                .filter_by(raid_id=ev.id, user_id=user.id)
-                .first()
+                await session.scalar(
+                    select(RaidParticipation).filter_by(raid_id=ev.id, user_id=user.id, status="записался")
+                )
                 is not None
             )
 
@@ -88,36 +96,24 @@ async def raid_upcoming_handler(callback: CallbackQuery):
 
 # Обработчик для записи на рейд
 @router.callback_query(F.data.startswith("raid_join_"))
-async def raid_join_handler(callback: CallbackQuery):
+async def raid_join_handler(callback: CallbackQuery, session: AsyncSession, user: User | None):
     _, _, sid = callback.data.split("_")
     raid_id = int(sid)  # Извлекаем ID рейда
 
-    # Получаем пользователя и рейд
-    user = session.query(User).filter_by(game_id=callback.from_user.id).first()
-    raid = session.query(RaidEvent).filter_by(id=raid_id).first()
+    # Получаем рейд (игрок уже загружен UserIdentityMiddleware)
+    raid = await session.scalar(select(RaidEvent).filter_by(id=raid_id))
     if not user or not raid:
         await callback.answer("❌ Пользователь или рейд не найдены.", show_alert=True)
         return
 
     now = datetime.utcnow()
 
-    # Проверяем участие пользователя в этом рейде
-    part = session.query(RaidParticipation).filter_by(raid_id=raid_id, user_id=user.id).first()
-    if part:
-        part.status = "записался"
-        part.joined_at = now
-    else:
-        # Добавляем новую запись участия
-        session.add(RaidParticipation(
-            raid_id=raid_id,
-            user_id=user.id,
-            status="записался",
-            joined_at=now,
-        ))
-    session.commit()
+    # Записываем участие одним upsert по уникальному индексу (raid_id, user_id)
+    await upsert_participation(session, raid_id, user.id, "записался", now)
+    await session.commit()
 
     # Получаем данные пина
-    pin_data = session.query(RaidPinData).filter_by(raid_id=raid.id).first()
+    pin_data = await session.scalar(select(RaidPinData).filter_by(raid_id=raid.id))
 
     title = pin_data.title if pin_data else raid.name
     km = pin_data.km if pin_data else "Не указан"
@@ -148,29 +144,49 @@ async def raid_join_handler(callback: CallbackQuery):
     await callback.answer("✅ Вы успешно записались на рейд!")
 
 
+# Обработчик отказа от участия в рейде
+@router.callback_query(F.data.startswith("raid_leave_"))
+async def raid_leave_handler(callback: CallbackQuery, session: AsyncSession, user: User | None):
+    _, _, sid = callback.data.split("_")
+    raid_id = int(sid)  # Извлекаем ID рейда
+
+    # Получаем рейд (игрок уже загружен UserIdentityMiddleware)
+    raid = await session.scalar(select(RaidEvent).filter_by(id=raid_id))
+    if not user or not raid:
+        await callback.answer("❌ Пользователь или рейд не найдены.", show_alert=True)
+        return
+
+    await upsert_participation(session, raid_id, user.id, "отказался", datetime.utcnow())
+    await session.commit()
+
+    # Обновляем кнопки под сообщением рейда
+    try:
+        await callback.message.edit_reply_markup(reply_markup=build_raid_markup(raid_id, False))
+    except Exception:
+        pass  # Сообщение могло быть уже изменено или удалено
+    await callback.answer("🚫 Вы отказались от участия в рейде.")
+
+
 # Обработчик установки напоминания о рейде
 @router.callback_query(F.data.startswith("remind_"))
-async def remind_user(callback: CallbackQuery):
+async def remind_user(callback: CallbackQuery, session: AsyncSession, user: User | None):
     _, sid = callback.data.split("_")
     raid_id = int(sid)  # Извлекаем ID рейда
 
-    # Получаем пользователя
-    user = session.query(User).filter_by(game_id=callback.from_user.id).first()
     if not user:
         await callback.answer("⚠️ Пользователь не найден.", show_alert=True)
         return
 
-    # Проверяем, установлено ли уже напоминание
-    exists = (
-        session.query(RaidReminder)
-        .filter_by(raid_id=raid_id, user_id=user.id)
-        .first()
+    # Создаём напоминание; при повторном нажатии уникальный индекс не даст вставить дубль
+    created = await session.scalar(
+        insert(RaidReminder)
+        .values(raid_id=raid_id, user_id=user.id, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["raid_id", "user_id"])
+        .returning(RaidReminder.id)
     )
-    if exists:
+    if created is None:
         await callback.answer("🔔 Напоминание уже установлено!")
         return
 
-    # Создаём новое напоминание
-    session.add(RaidReminder(raid_id=raid_id, user_id=user.id))
-    session.commit()
+    await session.commit()
     await callback.answer("✅ Напомним за час до рейда.")
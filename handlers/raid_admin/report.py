@@ -3,8 +3,8 @@ from states.report_states import ReportBuilder
 from utils.safe_send import safe_answer
 from aiogram import Router, F
 from aiogram.types import Message
-from sqlalchemy import func
-from database.db import session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User, RaidEvent, RaidParticipation, RaidPinSendLog
 from aiogram.fsm.context import FSMContext
 from datetime import datetime, timedelta
@@ -15,24 +15,23 @@ router = Router()
 
 
 @router.message(F.text == "📊 Отчёт по участию")
-async def participation_report(message: Message):
+async def participation_report(message: Message, session: AsyncSession):
     now = datetime.utcnow()  # Текущее время
     week_ago = now - timedelta(days=7)  # Время неделю назад
 
     # Запрос: Получаем пользователей и количество их участий за последние 7 дней
-    report = (
-        session.query(User.nickname, func.count(RaidParticipation.id))
+    report = (await session.execute(
+        select(User.nickname, func.count(RaidParticipation.id))
         .join(RaidParticipation, User.id == RaidParticipation.user_id)
         .join(RaidEvent, RaidEvent.id == RaidParticipation.raid_id)
         .filter(RaidEvent.start_time >= week_ago)  # Только рейды за последние 7 дней
         .group_by(User.nickname)  # Группируем по пользователям
         .order_by(func.count(RaidParticipation.id).desc())  # Сортируем по количеству участий (убывание)
-        .all()
-    )
+    )).all()
 
     if not report:
         await safe_answer(message, "Нет данных за неделю.")
-        await return_to_raid_menu(message)  # Возвращаемся в меню
+        await return_to_raid_menu(message, session)  # Возвращаемся в меню
         return
 
     # Формируем текст отчёта
@@ -42,22 +41,21 @@ async def participation_report(message: Message):
         "<b>📊 Активность за 7 дней:</b>\n" + "\n".join(lines),
         parse_mode="HTML"
     )
-    await return_to_raid_menu(message)  # Возвращаемся в меню
+    await return_to_raid_menu(message, session)  # Возвращаемся в меню
 
 
 @router.message(F.text == "👥 Участники рейда")
-async def raid_participant_report(message: Message, state: FSMContext):
+async def raid_participant_report(message: Message, state: FSMContext, session: AsyncSession):
     # Получаем последние 10 рейдов из БД
-    raids = (
-        session.query(RaidEvent)
+    raids = (await session.scalars(
+        select(RaidEvent)
         .order_by(RaidEvent.start_time.desc())
         .limit(10)
-        .all()
-    )
+    )).all()
 
     if not raids:
         await safe_answer(message, "📭 Нет рейдов.")
-        await return_to_raid_menu(message)
+        await return_to_raid_menu(message, session)
         return
 
     # Формируем список ID рейдов
@@ -83,12 +81,12 @@ async def raid_participant_report(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(ReportBuilder.filter_value), F.text.regexp(r"^\d+$").as_("match"))
-async def raid_number_choice(message: Message, state: FSMContext, match):
+async def raid_number_choice(message: Message, state: FSMContext, match, session: AsyncSession):
     data = await state.get_data()
     raid_list = data.get("raid_list")  # Получаем список ID рейдов
     if not raid_list:
         await safe_answer(message, "⚠️ Нет активного выбора рейда.")
-        await return_to_raid_menu(message)
+        await return_to_raid_menu(message, session)
         return
 
     idx = int(message.text.strip()) - 1  # Получаем индекс выбранного рейда
@@ -97,19 +95,18 @@ async def raid_number_choice(message: Message, state: FSMContext, match):
         return
 
     raid_id = raid_list[idx]  # Получаем ID выбранного рейда
-    raid = session.query(RaidEvent).filter_by(id=raid_id).first()
+    raid = await session.scalar(select(RaidEvent).filter_by(id=raid_id))
     if not raid:
         await safe_answer(message, "❌ Рейд не найден.")
-        await return_to_raid_menu(message)
+        await return_to_raid_menu(message, session)
         return
 
     # Получаем участников этого рейда
-    parts = (
-        session.query(User.nickname, User.id, RaidParticipation.status, RaidParticipation.joined_at)
+    parts = (await session.execute(
+        select(User.nickname, User.id, RaidParticipation.status, RaidParticipation.joined_at)
         .join(User, User.id == RaidParticipation.user_id)
         .filter(RaidParticipation.raid_id == raid_id)
-        .all()
-    )
+    )).all()
 
     # Разделяем участников по статусам
     signed = [(n, t) for n, uid, s, t in parts if s == "записался"]
@@ -118,16 +115,17 @@ async def raid_number_choice(message: Message, state: FSMContext, match):
     refused_ids = [uid for _, uid, s, _ in parts if s == "отказался"]
 
     # Получаем список всех приглашённых
-    invited_ids = [
-        r.target_id for r in session.query(RaidPinSendLog.target_id)
+    invited_ids = (await session.scalars(
+        select(RaidPinSendLog.target_id)
         .filter_by(raid_id=raid_id)
         .distinct()
-        .all()
-    ]
+    )).all()
 
     # Вычисляем тех, кто не подтвердил участие
     not_responded_ids = set(invited_ids) - set(signed_ids) - set(refused_ids)
-    not_responded = session.query(User.nickname).filter(User.id.in_(not_responded_ids)).all()
+    not_responded = (await session.execute(
+        select(User.nickname).filter(User.id.in_(not_responded_ids))
+    )).all()
 
     # Вспомогательные функции для форматирования списков
     def format_list(users):
@@ -146,10 +144,10 @@ async def raid_number_choice(message: Message, state: FSMContext, match):
         f"❔ Не подтвердили ({len(not_responded)}):\n{format_simple(not_responded)}",
         parse_mode="HTML"
     )
-    await return_to_raid_menu(message)  # Возвращаемся в меню
+    await return_to_raid_menu(message, session)  # Возвращаемся в меню
 
 
 @router.message(F.text == "Отмена")
-async def cancel_raid_selection(message: Message, state: FSMContext):
+async def cancel_raid_selection(message: Message, state: FSMContext, session: AsyncSession):
     await state.clear()  # Очищаем состояние
-    await return_to_raid_menu(message)  # Возвращаемся в меню
+    await return_to_raid_menu(message, session)  # Возвращаемся в меню
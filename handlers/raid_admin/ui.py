@@ -1,13 +1,13 @@
 from datetime import datetime, timedelta
 
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from utils.safe_send import safe_answer, safe_send_message
 from aiogram import Router, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from services.navigation import return_to_main_menu
 from keyboards.admin_menu import full_admin_menu
-from database.db import session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import RaidEvent, RaidParticipation, User, RaidPinData
 
 router = Router()
@@ -35,20 +35,19 @@ async def back_to_admin_from_raid(message: Message):
 
 
 @router.message(F.text == "⬅️ Назад")
-async def back_from_anywhere(message: Message):
+async def back_from_anywhere(message: Message, session: AsyncSession):
     # Общая обработка кнопки "Назад" — возвращаем в главное меню
-    await return_to_main_menu(message)
+    await return_to_main_menu(message, session)
 
 
 @router.message(F.text == "📋 Список рейдов")
-async def list_recent_raids(message: Message):
+async def list_recent_raids(message: Message, session: AsyncSession):
     # Получаем последние 10 рейдов из БД, отсортированных по дате (сначала новые)
-    raids = (
-        session.query(RaidEvent)
+    raids = (await session.scalars(
+        select(RaidEvent)
         .order_by(RaidEvent.start_time.desc())
         .limit(10)
-        .all()
-    )
+    )).all()
 
     if not raids:
         # Если рейдов нет — сообщаем об этом
@@ -66,24 +65,21 @@ async def list_recent_raids(message: Message):
 
 
 @router.message(F.text == "📅 Предстоящие рейды")
-async def show_upcoming_raids(message: Message):
+async def show_upcoming_raids(message: Message, session: AsyncSession, user: User | None):
     now = datetime.utcnow()  # Текущее время
     # Получаем до 10 активных будущих рейдов
-    raids = (
-        session.query(RaidEvent)
+    raids = (await session.scalars(
+        select(RaidEvent)
         .filter(RaidEvent.start_time >= now, RaidEvent.status == "active")  # Только будущие и активные
         .order_by(RaidEvent.start_time.asc())  # Сортируем по времени (сначала ближайшие)
         .limit(10)  # Ограничиваем до 10
-        .all()
-    )
+    )).all()
 
     if not raids:
         # Если рейдов нет — сообщаем об этом
         await safe_answer(message, "❌ Нет запланированных рейдов.")
         return
 
-    user = session.query(User).filter_by(game_id=message.from_user.id).first()
-
     for raid in raids:
         dt = raid.start_time.strftime("%d.%m %H:%M")
 
@@ -94,7 +90,7 @@ async def show_upcoming_raids(message: Message):
 
         # Проверяем участие пользователя
         if user:
-            part = session.query(RaidParticipation).filter_by(raid_id=raid.id, user_id=user.id).first()
+            part = await session.scalar(select(RaidParticipation).filter_by(raid_id=raid.id, user_id=user.id))
             if part:
                 if part.status == "записался":
                     part_status = "⚔ Записался"
@@ -106,7 +102,7 @@ async def show_upcoming_raids(message: Message):
                     leave_text = "🚫 Вы отказались"
 
         # Получаем данные пина
-        pin_data = session.query(RaidPinData).filter_by(raid_id=raid.id).first()
+        pin_data = await session.scalar(select(RaidPinData).filter_by(raid_id=raid.id))
 
         title = pin_data.title if pin_data else raid.name
         km = pin_data.km if pin_data else "Не указан"
@@ -139,9 +135,7 @@ async def show_upcoming_raids(message: Message):
 
 
 @router.message(F.text == "📊 Моя активность")
-async def my_raid_stats(message: Message):
-    # Получаем пользователя из БД
-    user = session.query(User).filter_by(game_id=message.from_user.id).first()
+async def my_raid_stats(message: Message, session: AsyncSession, user: User | None):
     if not user:
         await safe_answer(message, "❌ Вы не зарегистрированы.")
         return
@@ -150,12 +144,11 @@ async def my_raid_stats(message: Message):
     week_ago = now - timedelta(days=7)  # Время неделю назад
 
     # Считаем количество участий пользователя за последние 7 дней
-    count = (
-        session.query(func.count(RaidParticipation.id))
+    count = await session.scalar(
+        select(func.count(RaidParticipation.id))
         .join(RaidEvent, RaidParticipation.raid_id == RaidEvent.id)
         .filter(RaidParticipation.user_id == user.id)
         .filter(RaidEvent.start_time >= week_ago)
-        .scalar()
     )
 
     # Отправляем статистику
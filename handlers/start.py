@@ -1,19 +1,14 @@
 from utils.safe_send import safe_answer, safe_send_message
 from aiogram import Router, types, F
 from aiogram.filters import CommandStart
-from config import ADMIN_IDS
 from database.models import User
-from database.db import session
 from keyboards.main_menu import main_menu_keyboard
 
 router = Router()
 
 @router.message(CommandStart())  # Обработчик команды /start
-async def cmd_start(message: types.Message):
-    user_id = message.from_user.id  # Получаем ID пользователя из Telegram
-
-    # Проверяем, есть ли пользователь в базе данных
-    user = session.query(User).filter_by(game_id=user_id).first()
+async def cmd_start(message: types.Message, user: User | None, is_admin: bool):
+    # Проверяем, есть ли пользователь в базе данных (игрока загружает UserIdentityMiddleware)
     if not user:
         # Если пользователя нет — сообщаем об этом и завершаем выполнение
         await safe_answer(message,
@@ -22,9 +17,6 @@ async def cmd_start(message: types.Message):
         )
         return
 
-    # Проверяем, является ли пользователь администратором
-    is_admin = user_id in ADMIN_IDS or user.is_admin
-
     # Отправляем приветственное сообщение и главное меню
     await safe_answer(message,
         "👋 Добро пожаловать! Выберите действие:",
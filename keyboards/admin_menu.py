@@ -19,12 +19,23 @@ def user_admin_menu():
             [KeyboardButton(text="/add_user"), KeyboardButton(text="/add_user_forward")],
             [KeyboardButton(text="/edit_user <ID>"), KeyboardButton(text="/remove_user <ID>")],
             [KeyboardButton(text="/list_users"), KeyboardButton(text="/access")],
+            [KeyboardButton(text="/import_profiles")],
             [KeyboardButton(text="⬅️ Назад в админ-панель")]
         ],
         resize_keyboard=True
     )
 
 
+def import_profiles_keyboard():
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="✅ Импортировать")],
+            [KeyboardButton(text="Отмена")]
+        ],
+        resize_keyboard=True
+    )
+
+
 def guidepage_admin_menu():
     return ReplyKeyboardMarkup(
         keyboard=[
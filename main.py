@@ -3,16 +3,23 @@ import logging
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 
 from config import BOT_TOKEN
 from handlers import register_handlers
 
 from database.models import Base
-from database.db import engine
+from database.db import async_engine, AsyncSessionLocal
+from database.migrations import run_migrations, vacuum
 
-from utils.scheduler import raid_reminder_loop
+from middlewares.db_session import DbSessionMiddleware
+from middlewares.chat_type import ChatTypeMiddleware
+from middlewares.user_identity import UserIdentityMiddleware
+
+from utils.scheduler import raid_scheduler
+from utils.outbox import outbox_worker
+from utils.backup import backup_scheduler
+from utils.fsm_storage import fsm_storage
 
 
 # Логирование
@@ -24,7 +31,15 @@ logging.basicConfig(
 
 async def main():
     # Создание таблиц БД, если их ещё нет
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        compacted = await conn.run_sync(run_migrations)
+    if compacted:
+        # VACUUM не работает внутри транзакции — отдельное соединение в режиме autocommit
+        async with async_engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.run_sync(vacuum)
+        print("[INIT] Журнал пинов сжат")
     print("[INIT] Таблицы базы данных созданы")
 
     # Инициализация бота
@@ -34,14 +49,30 @@ async def main():
     )
 
     # Инициализация диспетчера с хранилищем состояний
-    dp = Dispatcher(storage=MemoryStorage())
+    dp = Dispatcher(storage=fsm_storage)
+
+    # Сессия БД на каждый апдейт (commit/rollback по завершении обработки)
+    dp.update.outer_middleware(DbSessionMiddleware(AsyncSessionLocal))
+    # Кэш типов чатов для отправки без лишнего get_chat
+    dp.update.outer_middleware(ChatTypeMiddleware())
+    # Игрок и признак админа на каждый апдейт (аргументы хендлеров `user` и `is_admin`)
+    dp.update.outer_middleware(UserIdentityMiddleware())
 
     # Регистрация обработчиков
     register_handlers(dp)
     print("[INIT] Хендлеры зарегистрированы")
 
-    # Запуск фоновой задачи напоминаний
-    asyncio.create_task(raid_reminder_loop(bot))
+    # Запуск планировщика напоминаний и завершения рейдов
+    asyncio.create_task(raid_scheduler.run())
+
+    # Запуск воркера очереди исходящих сообщений (рассылки, пины, напоминания)
+    asyncio.create_task(outbox_worker.run(bot))
+
+    # Запуск фоновой записи состояний FSM в базу
+    asyncio.create_task(fsm_storage.run())
+
+    # Запуск ежечасных точек восстановления базы (инкрементальные бэкапы с ротацией)
+    asyncio.create_task(backup_scheduler.run())
 
     # Удаление вебхука перед запуском пулинга
     await bot.delete_webhook(drop_pending_updates=True)
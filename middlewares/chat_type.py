@@ -0,0 +1,26 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils.chat_cache import chat_cache
+
+
+class ChatTypeMiddleware(BaseMiddleware):
+    # Запоминает тип чата из каждого входящего апдейта, чтобы рассылки не вызывали get_chat
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        if chat is not None:
+            try:
+                session = data["session"]
+                if await chat_cache.remember(session, chat.id, chat.type):
+                    # Коммитим сразу, чтобы не держать блокировку записи всё время обработки апдейта
+                    await session.commit()
+            except Exception as e:
+                print(f"[ERROR] Не удалось сохранить тип чата {chat.id}: {e}")
+        return await handler(event, data)
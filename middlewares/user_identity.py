@@ -0,0 +1,24 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils.user_cache import is_admin_user, user_cache
+
+
+class UserIdentityMiddleware(BaseMiddleware):
+    # Загружает игрока (users) один раз на апдейт и передаёт его в хендлеры как `user`,
+    # а признак администратора — как `is_admin`. Требует сессию от DbSessionMiddleware
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        user = None
+        if from_user is not None:
+            user = await user_cache.get(data["session"], from_user.id)
+        data["user"] = user
+        data["is_admin"] = from_user is not None and is_admin_user(from_user.id, user)
+        return await handler(event, data)
@@ -0,0 +1,103 @@
+import asyncio
+from bisect import insort
+
+from sqlalchemy import select
+
+from database.models import GuidePage
+
+
+class GuideNode:
+    # Узел дерева гайдов — копия строки GuidePage, не привязанная к сессии
+    __slots__ = ("code", "title", "text", "parent_code", "created_at", "id", "children")
+
+    def __init__(self, page: GuidePage):
+        self.code = page.code
+        self.title = page.title
+        self.text = page.text
+        self.parent_code = page.parent_code
+        self.created_at = page.created_at
+        self.id = page.id
+        self.children = []  # Дочерние узлы, отсортированные по created_at
+
+    @property
+    def sort_key(self):
+        return self.created_at, self.id
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+
+class GuideTree:
+    # Дерево гайдов в памяти: загружается одним запросом, обновляется при изменениях из админки
+    def __init__(self):
+        self._nodes = {}   # code -> GuideNode
+        self._roots = []   # Корневые разделы (parent_code = None)
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self, session) -> "GuideTree":
+        # Загружаем дерево при первом обращении (или после сброса)
+        if self._loaded:
+            return self
+        async with self._lock:
+            if not self._loaded:
+                pages = (await session.scalars(
+                    select(GuidePage).order_by(GuidePage.created_at, GuidePage.id)
+                )).all()
+                self._build(pages)
+        return self
+
+    def _build(self, pages):
+        self._nodes = {page.code: GuideNode(page) for page in pages}
+        self._roots = []
+        for node in self._nodes.values():
+            self._siblings(node.parent_code).append(node)  # Страницы уже отсортированы по created_at
+        self._loaded = True
+
+    def _siblings(self, parent_code):
+        # Список, в котором лежит узел: корни или дети родителя.
+        # Узлы с несуществующим родителем никуда не попадают — как и в выборке по parent_code
+        if parent_code is None:
+            return self._roots
+        parent = self._nodes.get(parent_code)
+        return parent.children if parent else []
+
+    def invalidate(self):
+        # Полный сброс — дерево перечитается при следующем обращении
+        self._loaded = False
+
+    def get(self, code: str):
+        return self._nodes.get(code)
+
+    def children(self, parent_code=None) -> list:
+        if parent_code is None:
+            return self._roots
+        node = self._nodes.get(parent_code)
+        return node.children if node else []
+
+    def walk(self, parent_code=None, level=0):
+        # Обход в глубину: (узел, уровень вложенности)
+        for node in self.children(parent_code):
+            yield node, level
+            yield from self.walk(node.code, level + 1)
+
+    def add(self, page: GuidePage):
+        # Новый гайд после commit
+        if not self._loaded:
+            return
+        node = GuideNode(page)
+        # Подхватываем «осиротевшие» гайды, чей родитель когда-то был удалён и теперь создан заново
+        node.children = sorted(n for n in self._nodes.values() if n.parent_code == node.code)
+        self._nodes[node.code] = node
+        insort(self._siblings(node.parent_code), node)
+
+    def update(self, page: GuidePage):
+        # Изменились заголовок или текст гайда
+        node = self._nodes.get(page.code)
+        if node:
+            node.title = page.title
+            node.text = page.text
+
+
+# Общий экземпляр дерева гайдов
+guide_tree = GuideTree()
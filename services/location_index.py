@@ -0,0 +1,90 @@
+import asyncio
+
+from sqlalchemy import select
+
+from database.models import LocationInfo
+
+# Километры до этого значения хранятся в плотном массиве, остальные — в словаре
+DENSE_KM_LIMIT = 10000
+
+# Эмодзи-префиксы, которые выносятся вперёд в списке локаций на странице "map"
+MAP_EMOJI = ("⚡️", "⚠️", "💀", "🏕", "❄️")
+
+
+def render_location(km: int, loc: LocationInfo | None) -> str:
+    # Формирует текстовое представление локации для вывода пользователю
+    if not loc:
+        return f"📍 <b>{km} км</b>\n\nℹ️ Информация пока не добавлена."
+    return f"📍 <b>{km} — {loc.title}</b>\n\n{loc.description}"
+
+
+def render_map_line(loc: LocationInfo) -> str:
+    # Строка локации для раздела гайдов "map"
+    name = loc.title or f"{loc.km} км"
+    emoji = name.strip().split()[0] if name.startswith(MAP_EMOJI) else ""
+    clean_name = name.replace(emoji, "").strip() if emoji else name
+    return f"▪️ {emoji} {clean_name} ({loc.km} км) — /loc_{loc.km}\n"
+
+
+class LocationIndex:
+    # Таблица локаций в памяти: карточка по км за O(1) и готовый блок для страницы "map"
+    def __init__(self):
+        self._dense = []      # km -> готовая HTML-карточка (или None)
+        self._sparse = {}     # Карточки для км за пределами DENSE_KM_LIMIT
+        self._titles = []     # (km, title) по возрастанию км
+        self._map_section = ""
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self, session) -> "LocationIndex":
+        # Загружаем при первом обращении
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.refresh(session)
+        return self
+
+    async def refresh(self, session):
+        # Полностью перечитываем локации (вызывается после каждого изменения из админки)
+        locations = (await session.scalars(
+            select(LocationInfo).filter(LocationInfo.km.isnot(None)).order_by(LocationInfo.km)
+        )).all()
+
+        dense_size = max((loc.km + 1 for loc in locations if 0 <= loc.km < DENSE_KM_LIMIT), default=0)
+        dense = [None] * dense_size
+        sparse = {}
+        for loc in locations:
+            card = render_location(loc.km, loc)
+            if 0 <= loc.km < DENSE_KM_LIMIT:
+                dense[loc.km] = card
+            else:
+                sparse[loc.km] = card
+
+        map_section = ""
+        if locations:
+            map_section = "\n<b>📍 Информация о локациях:</b>\n\n" + "".join(render_map_line(loc) for loc in locations)
+
+        # Подменяем всё разом, чтобы читатели не увидели наполовину обновлённый индекс
+        self._dense, self._sparse = dense, sparse
+        self._titles = [(loc.km, loc.title) for loc in locations]
+        self._map_section = map_section
+        self._loaded = True
+
+    def card(self, km: int) -> str:
+        # Карточка локации (или заглушка, если локации нет)
+        if 0 <= km < len(self._dense):
+            card = self._dense[km]
+        else:
+            card = self._sparse.get(km)
+        return card or render_location(km, None)
+
+    def titles(self) -> list:
+        return self._titles
+
+    def map_section(self) -> str:
+        # Блок со всеми локациями для раздела "map"
+        return self._map_section
+
+
+# Общий индекс локаций
+location_index = LocationIndex()
@@ -5,25 +5,25 @@ from aiogram.types import Message
 from keyboards.admin_menu import full_admin_menu
 from keyboards.main_menu import main_menu_keyboard
 from keyboards.raid_menu import raid_main_menu, raid_admin_menu
-from config import ADMIN_IDS
-from database.db import session
-from database.models import User
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.user_cache import is_admin_user, user_cache
 
 # Вспомогательная функция для проверки: является ли пользователь админом
-def is_user_admin(user_id: int) -> bool:
-    user = session.query(User).filter_by(game_id=user_id).first()
-    return user_id in ADMIN_IDS or (user and user.is_admin)
+# (игрок берётся из кэша, который уже заполнил UserIdentityMiddleware для текущего апдейта;
+# fresh=True — перед действиями, доступными только админам, флаг читается из БД)
+async def is_user_admin(session: AsyncSession, user_id: int, fresh: bool = False) -> bool:
+    return is_admin_user(user_id, await user_cache.get(session, user_id, fresh=fresh))
 
 # Возвращает пользователя в главное меню с соответствующим сообщением и клавиатурой
-async def return_to_main_menu(message: Message):
+async def return_to_main_menu(message: Message, session: AsyncSession):
     # Определяем, админ ли пользователь
-    is_admin = is_user_admin(message.from_user.id)
+    is_admin = await is_user_admin(session, message.from_user.id)
     await safe_answer(message, "🔙 Возврат в главное меню.", reply_markup=main_menu_keyboard(is_admin=is_admin))
 
 # Возвращает пользователя в меню рейдов, учитывая статус администратора
-async def return_to_raid_menu(message: Message):
+async def return_to_raid_menu(message: Message, session: AsyncSession):
     # Определяем, админ ли пользователь
-    is_admin = is_user_admin(message.from_user.id)
+    is_admin = await is_user_admin(session, message.from_user.id)
     await safe_answer(message, "⬅️ Назад в меню рейдов.", reply_markup=raid_main_menu(is_admin=is_admin))
 
 # Возвращает пользователя в админское меню управления рейдами
@@ -31,13 +31,13 @@ async def return_to_raid_admin_menu(message: Message):
     await safe_answer(message, "⬅️ Назад в управление рейдами.", reply_markup=raid_admin_menu())
 
 # Сообщает пользователю, что невозможно определить предыдущее меню и предлагает использовать /start
-async def return_to_unknown(message: Message):
+async def return_to_unknown(message: Message, session: AsyncSession):
     # Определяем, админ ли пользователь
-    is_admin = is_user_admin(message.from_user.id)
+    is_admin = await is_user_admin(session, message.from_user.id)
     await safe_answer(message, "Я не знаю, куда вас вернуть 😅 Используйте /start", reply_markup=main_menu_keyboard(is_admin=is_admin))
 
 # Возвращает пользователя в предыдущее меню на основе данных из FSMContext
-async def return_to_previous_menu(message: Message, state: FSMContext):
+async def return_to_previous_menu(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     await state.clear()
 
@@ -49,5 +49,5 @@ async def return_to_previous_menu(message: Message, state: FSMContext):
         await safe_answer(message, "↩️ Возврат в главное админ-меню.", reply_markup=full_admin_menu())
     else:
         # Определяем, админ ли пользователь
-        is_admin = is_user_admin(message.from_user.id)
+        is_admin = await is_user_admin(session, message.from_user.id)
         await safe_answer(message, "↩️ Возврат в главное меню.", reply_markup=main_menu_keyboard(is_admin=is_admin))
@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+from collections import Counter
+from operator import itemgetter
+
+from sqlalchemy import select
+
+from database.models import PlayerProfile, User, nickname_key
+
+# Короче этого фрагмента триграммы не работают — ищем простым вхождением подстроки
+MIN_TRIGRAM_QUERY = 3
+
+# Сколько кандидатов (на одно место в выдаче) оцениваем точно после отбора по общим триграммам
+CANDIDATE_FACTOR = 20
+
+
+def trigrams(text: str) -> set:
+    # Триграммы строки с отступами по краям (как в pg_trgm): "  ab " -> {"  a", " ab", "ab "}
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NicknameIndex:
+    # Триграммный индекс ников в памяти (users.nickname и player_profiles.nickname) для /find
+    def __init__(self):
+        self._names = {}      # game_id -> {"user": ник, "profile": ник}
+        self._keys = {}       # game_id -> {casefold-ник: набор триграмм}
+        self._postings = {}   # триграмма -> множество game_id
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self, session) -> "NicknameIndex":
+        # Загружаем при первом обращении
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    users = (await session.execute(select(User.game_id, User.nickname))).all()
+                    profiles = (await session.execute(select(PlayerProfile.game_id, PlayerProfile.nickname))).all()
+                    self._names, self._keys, self._postings = {}, {}, {}
+                    for game_id, nickname in profiles:
+                        self._put(game_id, "profile", nickname)
+                    for game_id, nickname in users:
+                        self._put(game_id, "user", nickname)
+                    self._loaded = True
+        return self
+
+    def put(self, game_id: int, source: str, nickname: str | None):
+        # Ник игрока изменился (source — "user" или "profile"); до загрузки индекса ничего не делаем
+        if self._loaded:
+            self._put(game_id, source, nickname)
+
+    def discard(self, game_id: int, source: str):
+        # Запись удалена (например, игрок удалён из users, а профиль остался)
+        if self._loaded:
+            self._put(game_id, source, None)
+
+    def _put(self, game_id, source, nickname):
+        names = self._names.setdefault(game_id, {})
+        if nickname:
+            names[source] = nickname
+        else:
+            names.pop(source, None)
+
+        # Пересчитываем триграммы игрока: снимаем старые и добавляем новые
+        old = self._keys.pop(game_id, {})
+        new = {key: trigrams(key) for key in filter(None, map(nickname_key, names.values()))}
+        for gram in set().union(*old.values()) - set().union(*new.values()):
+            bucket = self._postings.get(gram)
+            if bucket:
+                bucket.discard(game_id)
+                if not bucket:
+                    del self._postings[gram]
+        for gram in set().union(*new.values()):
+            self._postings.setdefault(gram, set()).add(game_id)
+
+        if new:
+            self._keys[game_id] = new
+        else:
+            self._names.pop(game_id, None)
+
+    def display_name(self, game_id: int) -> str:
+        names = self._names.get(game_id, {})
+        return names.get("user") or names.get("profile") or str(game_id)
+
+    def search(self, fragment: str, limit: int = 10) -> list:
+        # Лучшие совпадения: [(game_id, ник, оценка)] по убыванию оценки
+        query = nickname_key(fragment)
+        if not query:
+            return []
+
+        if len(query) < MIN_TRIGRAM_QUERY:
+            # Короткий запрос: кандидаты — игроки с триграммами, содержащими фрагмент
+            query_grams = None
+            candidates = set().union(*(ids for gram, ids in self._postings.items() if query in gram))
+        else:
+            # Кандидаты с наибольшим числом общих триграмм — точную оценку считаем только для них
+            query_grams = trigrams(query)
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self._postings.get(gram, ()))
+            candidates = [game_id for game_id, _ in shared.most_common(limit * CANDIDATE_FACTOR)]
+
+        scored = (
+            (game_id, max(self._score(query, key, grams, query_grams) for key, grams in self._keys[game_id].items()))
+            for game_id in candidates
+        )
+        best = heapq.nlargest(limit, (item for item in scored if item[1] > 0), key=itemgetter(1))
+        return [(game_id, self.display_name(game_id), score) for game_id, score in best]
+
+    @staticmethod
+    def _score(query, key, grams, query_grams) -> float:
+        # Сходство Жаккара по триграммам (для коротких запросов — доля ника, занятая фрагментом)
+        # плюс бонус за точное совпадение, начало ника или вхождение
+        if query_grams is None:
+            similarity = len(query) / len(key) if query in key else 0.0
+        else:
+            common = len(query_grams & grams)
+            similarity = common / (len(query_grams) + len(grams) - common)
+        if key == query:
+            return similarity + 3
+        if key.startswith(query):
+            return similarity + 2
+        if query in key:
+            return similarity + 1
+        return similarity
+
+
+# Общий индекс ников
+nickname_index = NicknameIndex()
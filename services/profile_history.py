@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+
+from database.models import ProfileSnapshot
+from services.profile_parser import ProfileRecord
+
+DAY = 24 * 60 * 60
+
+# Показатели, которые попадают в историю профиля
+SNAPSHOT_FIELDS = (
+    "health_max", "damage", "armor",
+    "strength", "accuracy", "charisma", "agility", "stamina_max",
+    "caps", "materials", "bobbleheads",
+)
+
+# Прореживание старых снимков: (старше N секунд, оставить один снимок на интервал)
+DOWNSAMPLE_RULES = (
+    (7 * DAY, DAY),        # Старше недели — последний снимок за сутки
+    (90 * DAY, 7 * DAY),   # Старше трёх месяцев — последний снимок за неделю
+)
+
+
+def to_timestamp(dt: datetime) -> int:
+    # Наивное UTC-время -> Unix-время в секундах
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+async def record_snapshots(session, records: list[ProfileRecord], taken_at: datetime):
+    # Добавляет снимки профилей; повтор в ту же секунду заменяет предыдущий снимок
+    if not records:
+        return
+    ts = to_timestamp(taken_at)
+    stmt = insert(ProfileSnapshot)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["game_id", "taken_at"],
+        set_={name: getattr(stmt.excluded, name) for name in SNAPSHOT_FIELDS},
+    )
+    await session.execute(stmt, [
+        {"game_id": r.game_id, "taken_at": ts, **{name: getattr(r, name) for name in SNAPSHOT_FIELDS}}
+        for r in records
+    ])
+    await downsample(session, [r.game_id for r in records], ts)
+
+
+async def downsample(session, game_ids: list[int], now_ts: int):
+    # Удаляет лишние старые снимки игроков: в каждом интервале у каждого игрока остаётся самый поздний.
+    # Один DELETE на правило прореживания для всех игроков сразу
+    for age, bucket in DOWNSAMPLE_RULES:
+        ranked = (
+            select(
+                ProfileSnapshot.game_id,
+                ProfileSnapshot.taken_at,
+                func.row_number().over(
+                    partition_by=(ProfileSnapshot.game_id, ProfileSnapshot.taken_at // bucket),
+                    order_by=ProfileSnapshot.taken_at.desc(),
+                ).label("rn"),
+            )
+            .filter(ProfileSnapshot.game_id.in_(game_ids), ProfileSnapshot.taken_at < now_ts - age)
+            .subquery()
+        )
+        await session.execute(
+            delete(ProfileSnapshot).filter(
+                tuple_(ProfileSnapshot.game_id, ProfileSnapshot.taken_at).in_(
+                    select(ranked.c.game_id, ranked.c.taken_at).filter(ranked.c.rn > 1)
+                ),
+            )
+        )
+
+
+async def progress_rows(session, game_id: int, fields, limit: int = 10):
+    # Последние снимки игрока с приростом к предыдущему снимку (d_<поле>)
+    # и к самому первому снимку (total_<поле>) — всё считается в SQL оконными функциями
+    window = {"order_by": ProfileSnapshot.taken_at}
+    columns = [ProfileSnapshot.taken_at, func.min(ProfileSnapshot.taken_at).over().label("first_at")]
+    for name in fields:
+        column = getattr(ProfileSnapshot, name)
+        columns += [
+            column,
+            (column - func.lag(column).over(**window)).label(f"d_{name}"),
+            (column - func.first_value(column).over(**window)).label(f"total_{name}"),
+        ]
+    return (await session.execute(
+        select(*columns)
+        .filter(ProfileSnapshot.game_id == game_id)
+        .order_by(ProfileSnapshot.taken_at.desc())
+        .limit(limit)
+    )).all()
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import case, select, func
+from sqlalchemy.dialects.sqlite import insert
+
+from database.models import PlayerProfile, User, nickname_key
+from services.nickname_index import nickname_index
+from services.profile_history import record_snapshots
+from services.profile_parser import PROFILE_FIELDS, ProfileRecord, parse_profile_text
+from utils.user_cache import user_cache
+
+# Разделители пип-боев в текстовом файле: строка из дефисов или начало нового "📟Пип-бой"
+TEXT_SEPARATOR = re.compile(r"(?m)^-{3,}\s*$|^(?=📟)")
+
+
+@dataclass(slots=True)
+class ImportResult:
+    created: int = 0   # Новые игроки
+    updated: int = 0   # Обновлённые игроки
+    skipped: int = 0   # Нераспознанные сообщения
+
+
+def _json_text(item) -> str:
+    # Текст сообщения из JSON: строка, {"text": ...} или экспорт Telegram, где text — список фрагментов
+    if isinstance(item, dict):
+        item = item.get("text", "")
+    if isinstance(item, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in item)
+    return item if isinstance(item, str) else ""
+
+
+def split_import_file(content: str) -> list[str]:
+    # Разбивает файл импорта на отдельные пип-бои (JSON или обычный текст)
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return [part.strip() for part in TEXT_SEPARATOR.split(content) if part.strip()]
+
+    if isinstance(data, dict):
+        data = data.get("messages", [])
+    if not isinstance(data, list):
+        return []
+    return [text for text in map(_json_text, data) if text.strip()]
+
+
+def parse_many(texts: list[str]) -> tuple[dict[int, ProfileRecord], int]:
+    # Разбирает пачку пип-боев; для одного игрока остаётся последний
+    records = {}
+    skipped = 0
+    for text in texts:
+        record = parse_profile_text(text)
+        if record.nickname and record.game_id:
+            records[record.game_id] = record
+        else:
+            skipped += 1
+    return records, skipped
+
+
+async def import_profiles(session, texts: list[str], admin_id: int) -> ImportResult:
+    # Массовый импорт: разбор в отдельном потоке, затем upsert игроков и профилей одной транзакцией
+    records, skipped = await asyncio.to_thread(parse_many, texts)
+    result = ImportResult(skipped=skipped)
+    if not records:
+        return result
+
+    existing = set((await session.scalars(
+        select(User.game_id).filter(User.game_id.in_(list(records)))
+    )).all())
+    result.created = len(records) - len(existing)
+    result.updated = len(existing)
+
+    # Хеши сохранённых профилей — чтобы писать в историю только изменившиеся
+    known_hashes = dict((await session.execute(
+        select(PlayerProfile.game_id, PlayerProfile.content_hash).filter(PlayerProfile.game_id.in_(list(records)))
+    )).all())
+
+    hashes = {game_id: r.content_hash() for game_id, r in records.items()}
+    now = datetime.utcnow()
+
+    # Ники уникальны без учёта регистра: занятый другим игроком ник не переносим
+    keys = {game_id: nickname_key(r.nickname) for game_id, r in records.items()}
+    owners = dict((await session.execute(
+        select(User.nickname_key, User.game_id).filter(User.nickname_key.in_(set(keys.values())))
+    )).all())
+    nicknames = {}
+    for game_id, r in records.items():
+        owner = owners.setdefault(keys[game_id], game_id)
+        if owner == game_id:
+            nicknames[game_id] = r.nickname
+        else:
+            print(f"[WARN] Импорт: ник {r.nickname} из пип-боя {game_id} уже занят игроком {owner}")
+            # Новому игроку нужен хоть какой-то ник, у существующего остаётся прежний
+            nicknames[game_id] = None if game_id in existing else f"user_{game_id}"
+
+    # Игроки: ник берём из пип-боя, фракцию и банду — только если они указаны
+    user_stmt = insert(User)
+    user_stmt = user_stmt.on_conflict_do_update(
+        index_elements=["game_id"],
+        set_={
+            "nickname": func.coalesce(user_stmt.excluded.nickname, User.nickname),
+            "nickname_key": func.coalesce(user_stmt.excluded.nickname_key, User.nickname_key),
+            "faction": func.coalesce(user_stmt.excluded.faction, User.faction),
+            "squad": func.coalesce(user_stmt.excluded.squad, User.squad),
+        },
+    )
+    await session.execute(user_stmt, [
+        {
+            "game_id": game_id,
+            "nickname": nicknames[game_id],
+            "nickname_key": nickname_key(nicknames[game_id]),
+            "faction": r.faction or None,
+            "squad": r.squad or None,
+            "created_at": now,
+            "is_admin": False,
+        }
+        for game_id, r in records.items()
+    ])
+
+    # Профили: поля, которых нет в пип-бое, сохраняют прежние значения (как в parse_full_profile)
+    profile_stmt = insert(PlayerProfile)
+    set_ = {
+        name: func.coalesce(getattr(profile_stmt.excluded, name), getattr(PlayerProfile, name))
+        for name in PROFILE_FIELDS
+        if name != "game_id"
+    }
+    set_.update(
+        added_by_admin=profile_stmt.excluded.added_by_admin,
+        added_by_admin_id=profile_stmt.excluded.added_by_admin_id,
+        content_hash=profile_stmt.excluded.content_hash,
+        last_seen_at=profile_stmt.excluded.last_seen_at,
+        # Тот же пип-бой, что уже сохранён, не считается обновлением профиля
+        updated_at=case(
+            (PlayerProfile.content_hash == profile_stmt.excluded.content_hash, PlayerProfile.updated_at),
+            else_=profile_stmt.excluded.updated_at,
+        ),
+    )
+    await session.execute(profile_stmt.on_conflict_do_update(index_elements=["game_id"], set_=set_), [
+        {
+            **{name: getattr(r, name) for name in PROFILE_FIELDS},
+            # Свой пип-бой админ импортирует как обычный игрок
+            "added_by_admin": game_id != admin_id,
+            "added_by_admin_id": admin_id if game_id != admin_id else None,
+            "content_hash": hashes[game_id],
+            "updated_at": now,
+            "last_seen_at": now,
+        }
+        for game_id, r in records.items()
+    ])
+
+    await record_snapshots(
+        session,
+        [r for game_id, r in records.items() if known_hashes.get(game_id) != hashes[game_id]],
+        now,
+    )
+
+    await session.commit()
+
+    # Обновляем индекс ников для /find и сбрасываем закэшированных игроков
+    for game_id, r in records.items():
+        user_cache.invalidate(game_id)
+        if nicknames[game_id]:
+            nickname_index.put(game_id, "user", nicknames[game_id])
+        nickname_index.put(game_id, "profile", r.nickname)
+    return result
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field, fields
+
+NICK_RE = re.compile(r"(.+),\s+⚛️(.+)")
+NUMBERS_RE = re.compile(r"\d+")
+HUNGER_RE = re.compile(r"(\d+)%")
+DAMAGE_RE = re.compile(r"⚔️Урон: (\d+)")
+ARMOR_RE = re.compile(r"🛡Броня: (\d+)")
+LOCATION_RE = re.compile(r"📍(.+?),")
+DISTANCE_RE = re.compile(r"(\d+)км")
+CAPS_RE = re.compile(r"Крышки:\s*(\d+)")
+MATERIALS_RE = re.compile(r"Материалы:\s*(\d+)")
+BOBBLEHEADS_RE = re.compile(r"Пупсы:\s*(\d+)")
+GAME_ID_RE = re.compile(r"ID(\d+)")
+RAID_CAPS_RE = re.compile(r"🕳\+(\d+)")
+RAID_MATERIALS_RE = re.compile(r"📦\+(\d+)")
+RAID_REWARDS_RE = re.compile(r"🕳\+\d+|📦\+\d+")
+
+# Характеристики в одной строке: поле профиля -> шаблон
+STATS = (
+    ("strength", re.compile(r"💪Сила: (\d+)")),
+    ("accuracy", re.compile(r"🎯Меткость: (\d+)")),
+    ("charisma", re.compile(r"🗣Харизма: (\d+)")),
+    ("agility", re.compile(r"🤸🏽‍♂️Ловкость: (\d+)")),
+)
+
+# Строки, которыми заканчивается блок "Экипировка"
+GEAR_END = ("Ресурсы", "Репутация", "ID", "Рейд в")
+
+
+@dataclass(slots=True)
+class ProfileRecord:
+    # Данные, извлечённые из пип-боя; None — поле в тексте не найдено
+    nickname: str | None = None
+    faction: str | None = None
+    squad: str | None = None
+    game_id: int | None = None
+
+    health_current: int | None = None
+    health_max: int | None = None
+    hunger: int | None = None
+    damage: int | None = None
+    armor: int | None = None
+
+    strength: int | None = None
+    accuracy: int | None = None
+    charisma: int | None = None
+    agility: int | None = None
+    stamina_current: int | None = None
+    stamina_max: int | None = None
+
+    location: str | None = None
+    distance_km: int | None = None
+    gear: str | None = None
+
+    caps: int | None = None
+    materials: int | None = None
+    bobbleheads: int | None = None
+
+    reputation: str | None = None
+
+    raid_time: str | None = None
+    raid_location: str | None = None
+    raid_reward_caps: int | None = None
+    raid_reward_materials: int | None = None
+    raid_reward_other: str | None = None
+
+    gear_lines: list = field(default_factory=list, repr=False)
+
+    def as_dict(self) -> dict:
+        # Только найденные поля — в формате колонок PlayerProfile
+        return {name: value for name in PROFILE_FIELDS if (value := getattr(self, name)) is not None}
+
+    def content_hash(self) -> str:
+        # Отпечаток нормализованного профиля: одинаковые пип-бои дают одинаковый хеш
+        payload = json.dumps(self.as_dict(), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+# Поля записи, совпадающие с колонками PlayerProfile
+PROFILE_FIELDS = tuple(f.name for f in fields(ProfileRecord) if f.name != "gear_lines")
+
+
+def _int(regex, line):
+    match = regex.search(line)
+    return int(match.group(1)) if match else None
+
+
+def _pair(line):
+    # Два числа в строке: "150/200"
+    nums = NUMBERS_RE.findall(line)
+    return map(int, nums) if len(nums) == 2 else None
+
+
+def _int_rule(name, regex):
+    # Правило вида "ключевое слово -> число из шаблона"
+    def rule(record, line, lines, idx):
+        if (value := _int(regex, line)) is not None:
+            setattr(record, name, value)
+    return rule
+
+
+def _nickname(record, line, lines, idx):
+    if match := NICK_RE.match(line):
+        record.nickname, record.faction = match.groups()
+
+
+def _squad(record, line, lines, idx):
+    record.squad = line.split(":", 1)[-1].strip()
+
+
+def _health(record, line, lines, idx):
+    if pair := _pair(line):
+        record.health_current, record.health_max = pair
+
+
+def _stats(record, line, lines, idx):
+    for name, regex in STATS:
+        if (value := _int(regex, line)) is not None:
+            setattr(record, name, value)
+
+
+def _stamina(record, line, lines, idx):
+    if pair := _pair(line):
+        record.stamina_current, record.stamina_max = pair
+
+
+def _location(record, line, lines, idx):
+    if match := LOCATION_RE.search(line):
+        record.location = match.group(1).strip()
+    if (value := _int(DISTANCE_RE, line)) is not None:
+        record.distance_km = value
+
+
+def _reputation(record, line, lines, idx):
+    # Репутация — на следующей строке
+    if line.startswith("Репутация") and idx + 1 < len(lines):
+        rep_line = lines[idx + 1]
+        if not rep_line.startswith("ID") and not rep_line.startswith("🏵"):
+            record.reputation = rep_line
+
+
+def _raid(record, line, lines, idx):
+    # Время рейда, а на следующей строке — локация и награды
+    record.raid_time = line.split(":", 1)[-1].strip()
+    if idx + 1 < len(lines):
+        raid_line = lines[idx + 1]
+        record.raid_location = raid_line
+        if (value := _int(RAID_CAPS_RE, raid_line)) is not None:
+            record.raid_reward_caps = value
+        if (value := _int(RAID_MATERIALS_RE, raid_line)) is not None:
+            record.raid_reward_materials = value
+        extra = RAID_REWARDS_RE.sub("", raid_line).strip()
+        if extra:
+            record.raid_reward_other = extra
+
+
+# Таблицы разбора: (ключевое слово, правило). Правило вызывается, только если слово есть в строке —
+# дешёвая проверка подстрокой отсекает почти все шаблоны до запуска регулярок.
+# Правила до блока "Экипировка"
+HEAD_RULES = (
+    ("⚛️", _nickname),
+    ("Банда:", _squad),
+    ("Здоровье", _health),
+    ("Голод", _int_rule("hunger", HUNGER_RE)),
+    ("⚔️Урон", _int_rule("damage", DAMAGE_RE)),
+    ("🛡Броня", _int_rule("armor", ARMOR_RE)),
+    ("Сила:", _stats),
+    ("Меткость:", _stats),
+    ("Харизма:", _stats),
+    ("Ловкость:", _stats),
+    ("Выносливость", _stamina),
+    ("📍", _location),
+)
+
+# Правила после блока "Экипировка" (строка-заголовок блока их пропускает)
+TAIL_RULES = (
+    ("Крышки", _int_rule("caps", CAPS_RE)),
+    ("Материалы", _int_rule("materials", MATERIALS_RE)),
+    ("Пупсы", _int_rule("bobbleheads", BOBBLEHEADS_RE)),
+    ("Репутация", _reputation),
+    ("ID", _int_rule("game_id", GAME_ID_RE)),
+    ("Рейд в", _raid),
+)
+
+
+def parse_profile_text(text: str) -> ProfileRecord:
+    # Разбор пип-боя за один проход по строкам
+    record = ProfileRecord()
+    if not text:
+        return record
+
+    lines = [line for line in map(str.strip, text.splitlines()) if line]
+    in_gear_block = False  # Флаг для определения блока "Экипировка"
+
+    for idx, line in enumerate(lines):
+        applied = None
+        for keyword, rule in HEAD_RULES:
+            # Характеристики стоят по две в строке — правило для них запускаем один раз
+            if keyword in line and rule is not applied:
+                rule(record, line, lines, idx)
+                applied = rule
+
+        # Блок "Экипировка"
+        if line.startswith("Экипировка"):
+            in_gear_block = True
+            continue
+        if in_gear_block:
+            if line.startswith(GEAR_END):
+                in_gear_block = False
+            else:
+                record.gear_lines.append(line)
+
+        for keyword, rule in TAIL_RULES:
+            if keyword in line:
+                rule(record, line, lines, idx)
+
+    if record.gear_lines:
+        record.gear = "\n".join(record.gear_lines)
+    return record
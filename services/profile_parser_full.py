@@ -1,131 +1,23 @@
 from utils.safe_send import safe_answer
-import re
 from aiogram.types import Message
 from datetime import datetime
-from database.db import session
+from sqlalchemy import select, update
 from database.models import PlayerProfile, User
+from services.nickname_index import nickname_index
+from services.profile_history import record_snapshots
+from services.profile_parser import ProfileRecord, parse_profile_text
+from services.users import nickname_owner
+from utils.user_cache import user_cache
 
 
-async def parse_full_profile(message: Message, silent: bool = False, added_by_admin: bool = False):
-    # Получаем текст сообщения и разбиваем его на строки
-    text = message.text
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
+async def parse_full_profile(session, message: Message, silent: bool = False, added_by_admin: bool = False,
+                             record: ProfileRecord | None = None):
+    # Разбираем пип-бой, если вызывающий код ещё не сделал этого сам
+    if record is None:
+        record = parse_profile_text(message.text)
 
-    # Словарь для хранения извлечённых данных профиля
-    data = {}
-    gear_lines = []
-    in_gear_block = False  # Флаг для определения блока "Экипировка"
-
-    # Парсим каждую строку
-    for idx, line in enumerate(lines):
-        # Извлекаем никнейм и фракцию
-        if re.search(r",\s+⚛️", line):
-            match = re.match(r"(.+),\s+⚛️(.+)", line)
-            if match:
-                data["nickname"], data["faction"] = match.groups()
-
-        # Извлекаем банду (сquad)
-        if "Банда:" in line:
-            data["squad"] = line.split(":", 1)[-1].strip()
-
-        # Извлекаем здоровье (текущее и максимальное)
-        if "Здоровье" in line:
-            nums = re.findall(r"\d+", line)
-            if len(nums) == 2:
-                data["health_current"], data["health_max"] = map(int, nums)
-
-        # Извлекаем уровень голода
-        if "Голод" in line:
-            if match := re.search(r"(\d+)%", line):
-                data["hunger"] = int(match.group(1))
-
-        # Урон
-        if "⚔️Урон" in line:
-            if match := re.search(r"⚔️Урон: (\d+)", line):
-                data["damage"] = int(match.group(1))
-
-        # Броня
-        if "🛡Броня" in line:
-            if match := re.search(r"🛡Броня: (\d+)", line):
-                data["armor"] = int(match.group(1))
-
-        # Характеристики: Сила, Меткость, Харизма, Ловкость
-        if "Сила:" in line or "Меткость:" in line or "Харизма:" in line or "Ловкость:" in line:
-            if match := re.search(r"💪Сила: (\d+)", line):
-                data["strength"] = int(match.group(1))
-            if match := re.search(r"🎯Меткость: (\d+)", line):
-                data["accuracy"] = int(match.group(1))
-            if match := re.search(r"🗣Харизма: (\d+)", line):
-                data["charisma"] = int(match.group(1))
-            if match := re.search(r"🤸🏽‍♂️Ловкость: (\d+)", line):
-                data["agility"] = int(match.group(1))
-
-        # Выносливость
-        if "Выносливость" in line:
-            nums = re.findall(r"\d+", line)
-            if len(nums) == 2:
-                data["stamina_current"], data["stamina_max"] = map(int, nums)
-
-        # Локация и расстояние
-        if "📍" in line:
-            if match := re.search(r"📍(.+?),", line):
-                data["location"] = match.group(1).strip()
-            if match := re.search(r"(\d+)км", line):
-                data["distance_km"] = int(match.group(1))
-
-        # Начало блока "Экипировка"
-        if line.startswith("Экипировка"):
-            in_gear_block = True
-            continue
-        if in_gear_block:
-            if any(line.startswith(x) for x in ("Ресурсы", "Репутация", "ID", "Рейд в")):
-                in_gear_block = False
-            else:
-                gear_lines.append(line)
-
-        # Крышки
-        if "Крышки" in line:
-            if match := re.search(r"Крышки:\s*(\d+)", line):
-                data["caps"] = int(match.group(1))
-
-        # Материалы
-        if "Материалы" in line:
-            if match := re.search(r"Материалы:\s*(\d+)", line):
-                data["materials"] = int(match.group(1))
-
-        # Пупсы
-        if "Пупсы" in line:
-            if match := re.search(r"Пупсы:\s*(\d+)", line):
-                data["bobbleheads"] = int(match.group(1))
-
-        # Репутация
-        if line.startswith("Репутация"):
-            if idx + 1 < len(lines):
-                rep_line = lines[idx + 1]
-                if not rep_line.startswith("ID") and not rep_line.startswith("🏵"):
-                    data["reputation"] = rep_line.strip()
-
-        # Game ID
-        if match := re.search(r"ID(\d+)", line):
-            data["game_id"] = int(match.group(1))
-
-        # Информация о рейде
-        if "Рейд в" in line:
-            data["raid_time"] = line.split(":", 1)[-1].strip()
-            if idx + 1 < len(lines):
-                raid_line = lines[idx + 1]
-                data["raid_location"] = raid_line.strip()
-                if match := re.search(r"🕳\+(\d+)", raid_line):
-                    data["raid_reward_caps"] = int(match.group(1))
-                if match := re.search(r"📦\+(\d+)", raid_line):
-                    data["raid_reward_materials"] = int(match.group(1))
-                extra = re.sub(r"🕳\+\d+|📦\+\d+", "", raid_line).strip()
-                if extra:
-                    data["raid_reward_other"] = extra
-
-    # Сохраняем экипировку
-    if gear_lines:
-        data["gear"] = "\n".join(gear_lines)
+    # Словарь с извлечёнными данными профиля (только найденные поля)
+    data = record.as_dict()
 
     # Проверка наличия game_id
     if not data.get("game_id"):
@@ -133,16 +25,33 @@ async def parse_full_profile(message: Message, silent: bool = False, added_by_ad
             await safe_answer(message, "❌ Не удалось извлечь ID.")
         return
 
+    now = datetime.utcnow()
+    content_hash = record.content_hash()
+
     # Поиск или создание профиля игрока
-    profile = session.query(PlayerProfile).filter_by(game_id=data["game_id"]).first()
-    if not profile:
-        profile = PlayerProfile(game_id=data["game_id"])
-        session.add(profile)
+    profile = await session.scalar(select(PlayerProfile).filter_by(game_id=data["game_id"]))
+    if profile and profile.content_hash == content_hash:
+        # Тот же пип-бой, что уже сохранён: отмечаем только время, строку профиля не переписываем
+        # (updated_at передаём явно, иначе сработает onupdate)
+        await session.execute(
+            update(PlayerProfile)
+            .filter_by(id=profile.id)
+            .values(last_seen_at=now, updated_at=PlayerProfile.updated_at)
+        )
+    else:
+        if not profile:
+            profile = PlayerProfile(game_id=data["game_id"])
+            session.add(profile)
 
-    # Обновление полей профиля
-    for k, v in data.items():
-        setattr(profile, k, v)
-    profile.updated_at = datetime.utcnow()
+        # Обновление полей профиля
+        for k, v in data.items():
+            setattr(profile, k, v)
+        profile.content_hash = content_hash
+        profile.updated_at = now
+        profile.last_seen_at = now
+
+        # Профиль изменился — добавляем снимок в историю
+        await record_snapshots(session, [record], now)
 
     # Устанавливаем, кто добавил профиль
     if message.from_user.id == data["game_id"]:
@@ -152,19 +61,25 @@ async def parse_full_profile(message: Message, silent: bool = False, added_by_ad
         profile.added_by_admin = True
         profile.added_by_admin_id = message.from_user.id
 
+    # Ник из пип-боя, если он не занят другим игроком (ники уникальны без учёта регистра)
+    nickname = data.get("nickname")
+    if nickname and (owner := await nickname_owner(session, nickname, data["game_id"])):
+        print(f"[WARN] Ник {nickname} из пип-боя {data['game_id']} уже занят игроком {owner.game_id}")
+        nickname = None
+
     # Поиск или создание пользователя
-    user = session.query(User).filter_by(game_id=data["game_id"]).first()
+    user = await session.scalar(select(User).filter_by(game_id=data["game_id"]))
     if not user:
         user = User(
             game_id=data["game_id"],
-            nickname=data.get("nickname") or f"user_{data['game_id']}",
+            nickname=nickname or f"user_{data['game_id']}",
             faction=data.get("faction"),
             squad=data.get("squad"),
         )
         session.add(user)
     else:
-        if data.get("nickname"):
-            user.nickname = data["nickname"]
+        if nickname:
+            user.nickname = nickname
         if data.get("faction"):
             user.faction = data["faction"]
         if data.get("squad"):
@@ -172,7 +87,10 @@ async def parse_full_profile(message: Message, silent: bool = False, added_by_ad
         if data.get("role"):
             user.role = data["role"]
 
-    session.commit()
+    await session.commit()
+    nickname_index.put(user.game_id, "user", user.nickname)
+    user_cache.invalidate(user.game_id)
+    nickname_index.put(profile.game_id, "profile", profile.nickname)
 
     # Отправляем ответ пользователю, если не требуется молчать
     if not silent:
@@ -181,28 +99,7 @@ async def parse_full_profile(message: Message, silent: bool = False, added_by_ad
 
 def extract_nickname_and_game_id(message: Message) -> tuple[str, int] | None:
     # Извлечение никнейма и game_id из сообщения
-    text = message.text
-    if not text:
-        return None
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    nickname = None
-    game_id = None
-
-    for line in lines:
-        # Извлечение никнейма и фракции
-        if not nickname and re.search(r",\s+⚛️", line):
-            match = re.match(r"(.+),\s+⚛️(.+)", line)
-            if match:
-                nickname = match.group(1)
-
-        # Извлечение game_id
-        if not game_id:
-            match = re.search(r"ID(\d+)", line)
-            if match:
-                game_id = int(match.group(1))
-
-        # Если оба найдены — выходим
-        if nickname and game_id:
-            return nickname, game_id
-
+    record = parse_profile_text(message.text)
+    if record.nickname and record.game_id:
+        return record.nickname, record.game_id
     return None
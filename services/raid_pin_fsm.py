@@ -3,8 +3,9 @@ from utils.safe_send import safe_answer, safe_send_message
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
 from states.raid_states import RaidAlert
+from sqlalchemy import select
 from database.models import User
-from database.db import session
+from sqlalchemy.ext.asyncio import AsyncSession
 from keyboards.cancel import cancel_keyboard
 
 # Начало процесса создания ПИН-сообщения (начальное состояние)
@@ -16,7 +17,7 @@ async def start_pin_fsm(message: Message, state: FSMContext, from_menu: str = "r
 
 
 # Обработка шагов ввода данных для ПИН-сообщения
-async def process_pin_step(state: FSMContext, step: str, message: Message) -> bool:
+async def process_pin_step(state: FSMContext, step: str, message: Message, session: AsyncSession) -> bool:
     # Проверка на отмену действия
     if (message.text or "").lower() == "отмена":
         await state.clear()
@@ -42,8 +43,8 @@ async def process_pin_step(state: FSMContext, step: str, message: Message) -> bo
         await state.update_data(dop_text=dop_text)
 
         # Получаем уникальные названия отрядов из базы данных
-        squads = session.query(User.squad).distinct().all()
-        buttons = [[KeyboardButton(text=s[0])] for s in squads if s[0]]
+        squads = (await session.scalars(select(User.squad).distinct())).all()
+        buttons = [[KeyboardButton(text=s)] for s in squads if s]
         buttons.append([KeyboardButton(text="Отправить всем")])
         keyboard = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
@@ -0,0 +1,23 @@
+from sqlalchemy import select
+
+from database.models import User, nickname_key
+
+
+async def find_user_by_nickname(session, nickname: str):
+    # Поиск игрока по нику без учёта регистра — по уникальному индексу nickname_key
+    key = nickname_key(nickname)
+    if not key:
+        return None
+    user = await session.scalar(select(User).filter_by(nickname_key=key))
+    if user is None or user.nickname != nickname.strip():
+        # В старых базах встречаются ники, отличающиеся только регистром: у таких игроков ключ
+        # с суффиксом (см. backfill_nickname_keys), поэтому точное совпадение ника важнее
+        exact = await session.scalar(select(User).filter_by(nickname=nickname.strip()).limit(1))
+        return exact or user
+    return user
+
+
+async def nickname_owner(session, nickname: str, game_id: int):
+    # Другой игрок, который уже носит этот ник (без учёта регистра), или None
+    owner = await find_user_by_nickname(session, nickname)
+    return owner if owner and owner.game_id != game_id else None
@@ -33,3 +33,8 @@ class EditUser(StatesGroup):
 
     # Состояние для ввода новой роли пользователя
     role = State()
+
+
+class ImportProfiles(StatesGroup):
+    # Состояние для сбора пересланных пип-боев и файлов перед массовым импортом
+    collecting = State()
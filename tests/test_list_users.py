@@ -0,0 +1,71 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from database.models import Base, PlayerProfile, User
+from handlers.admin import list_users
+
+# /list_users: на каждую страницу ровно два запроса (число игроков + страница),
+# и на первой странице, и на страницах по курсору; игроки без ника не обрывают листание
+
+
+class FakeMessage(SimpleNamespace):
+    async def answer(self, text, **kwargs):
+        self.replies.append(text)
+
+
+async def open_session():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session = AsyncSession(engine, expire_on_commit=False)
+    session.add(User(game_id=1, nickname="Админ"))
+    for game_id in range(100, 145):
+        # Половина игроков без ника (курсор первой страницы — игрок без ника), каждого третьего добавил админ
+        nickname = None if game_id % 2 == 0 else f"Игрок{game_id * 7 % 45:02d}"
+        session.add(User(game_id=game_id, nickname=nickname))
+        session.add(PlayerProfile(game_id=game_id, added_by_admin=game_id % 3 == 0, added_by_admin_id=1))
+    await session.commit()
+    return engine, session
+
+
+async def walk_pages():
+    engine, session = await open_session()
+    queries = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    pages = []
+    command = "/list_users"
+    while command:
+        queries.clear()
+        message = FakeMessage(text=command, chat=SimpleNamespace(type="private"), replies=[])
+        await list_users(message, session)
+        pages.append((len(queries), message.replies))
+        next_page = re.search(r"/list_users \d+ \d+", message.replies[-1])
+        command = next_page.group(0) if next_page else None
+
+    await session.close()
+    await engine.dispose()
+    return pages
+
+
+def test_list_users_query_count_and_order():
+    pages = asyncio.run(walk_pages())
+
+    assert len(pages) == 3
+    assert [query_count for query_count, _ in pages] == [2, 2, 2]
+
+    game_ids = [
+        int(line.split()[1])
+        for _, replies in pages
+        for line in replies[0].splitlines()[1:]
+    ]
+    assert sorted(game_ids) == [1] + list(range(100, 145))
+    # Игроки без ника идут первыми, затем по нику и id
+    assert game_ids[:23] == list(range(100, 145, 2))
+    assert "⚠️ добавлен Админ" in pages[0][1][0]
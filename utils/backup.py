@@ -0,0 +1,315 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import uuid
+from datetime import datetime
+
+from database.db import DB_PATH
+
+# Полная резервная копия базы и её сжатая версия для отправки в Telegram
+BACKUP_PATH = "db_data/bot_backup.db"
+BACKUP_GZ_PATH = BACKUP_PATH + ".gz"
+
+# Ограничение Telegram на размер отправляемого ботом файла (МБ)
+TELEGRAM_FILE_LIMIT_MB = 50
+
+# Сколько ждать бэкап (секунды): дольше — считаем, что он завис, и освобождаем очередь бэкапов
+BACKUP_TIMEOUT = 10 * 60
+
+# Одновременно выполняется только один бэкап (см. run_locked)
+_backup_lock = asyncio.Lock()
+
+
+def _tmp_path(path: str) -> str:
+    # Уникальный временный файл: поток бэкапа, брошенный по таймауту, не пишет в один файл со следующим
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+def backup_sqlite(src_path: str, dest_path: str):
+    # Согласованная копия живой базы через SQLite Online Backup API.
+    # Копируем за один шаг (pages=-1): пошаговый бэкап SQLite начинает заново после каждой записи
+    # в базу и при частых записях не завершается. В WAL один шаг — это одна транзакция чтения,
+    # запись в базу на это время не блокируется.
+    # Пишем во временный файл и подменяем готовый бэкап только после успешного завершения
+    tmp_path = _tmp_path(dest_path)
+    src = sqlite3.connect(src_path)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dest, pages=-1)
+    finally:
+        dest.close()
+        src.close()
+    os.replace(tmp_path, dest_path)
+
+
+def gzip_file(path: str, gz_path: str):
+    # Сжимает файл в gzip (через временный файл, чтобы не оставить обрезанный архив)
+    tmp_path = _tmp_path(gz_path)
+    with open(path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+    os.replace(tmp_path, gz_path)
+
+
+def _make_backup(src_path: str, dest_path: str, gz_path: str):
+    backup_sqlite(src_path, dest_path)
+    gzip_file(dest_path, gz_path)
+
+
+async def run_locked(func, *args):
+    # Выполняет бэкап в потоке под _backup_lock и ждёт не дольше BACKUP_TIMEOUT.
+    # Поток по таймауту не остановить, поэтому вызывающий сразу получает TimeoutError, а блокировка
+    # освобождается, только когда поток действительно завершится: второй бэкап параллельно не начнётся
+    await _backup_lock.acquire()
+    thread = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    timed_out = False
+
+    def finished(future):
+        _backup_lock.release()
+        error = None if future.cancelled() else future.exception()
+        if timed_out:
+            print(f"[WARN] Бэкап, прерванный по таймауту, завершился{f' с ошибкой: {error}' if error else ''}")
+
+    thread.add_done_callback(finished)
+    try:
+        return await asyncio.wait_for(asyncio.shield(thread), BACKUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        timed_out = True
+        raise TimeoutError(f"бэкап не завершился за {BACKUP_TIMEOUT} с")
+
+
+async def create_backup(src_path: str = DB_PATH, dest_path: str = BACKUP_PATH, gz_path: str = BACKUP_GZ_PATH) -> str:
+    # Бэкап и сжатие выполняются в отдельном потоке и не блокируют цикл событий.
+    # Возвращает путь к сжатой копии
+    await run_locked(_make_backup, src_path, dest_path, gz_path)
+    return gz_path
+
+
+# Точки восстановления по расписанию: раз в сутки полная копия, каждый час — только изменённые страницы.
+# Полная копия и идущие за ней инкременты образуют цепочку
+BACKUP_DIR = "db_data/backups"
+BACKUP_INTERVAL = 60 * 60       # Интервал между точками восстановления (секунды)
+BACKUP_RETRY_DELAY = 5 * 60     # Пауза после неудачного бэкапа
+FULL_BACKUP_EVERY = 24          # Каждая 24-я точка — полная копия (начало новой цепочки)
+
+# Ротация: последние KEEP_HOURLY_CHAINS цепочки хранятся целиком (почасовые точки за двое суток),
+# у более старых остаётся только полная копия (ежедневные точки), старше KEEP_DAILY_CHAINS — удаляются
+KEEP_HOURLY_CHAINS = 2
+KEEP_DAILY_CHAINS = 14
+
+POINT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+FULL_SUFFIX = "-full.db.gz"
+INCREMENT_SUFFIX = "-incr.gz"
+
+# Формат инкремента (внутри gzip): заголовок (размер страницы, число страниц),
+# затем записи (номер страницы, содержимое страницы) только для изменившихся страниц
+PAGES_HEADER = struct.Struct(">II")
+PAGE_NUMBER = struct.Struct(">I")
+PAGE_DIGEST_SIZE = 8
+
+
+def list_points(backup_dir: str = BACKUP_DIR) -> list[str]:
+    # Имена точек восстановления по возрастанию времени
+    if not os.path.isdir(backup_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(backup_dir)
+        if name.endswith(FULL_SUFFIX) or name.endswith(INCREMENT_SUFFIX)
+    )
+
+
+def point_time(name: str) -> datetime:
+    return datetime.strptime(name[:15], POINT_TIME_FORMAT)
+
+
+def _snapshot(src_path: str) -> tuple[int, memoryview]:
+    # Согласованный снимок живой базы в памяти: онлайн-бэкап за один шаг — одна транзакция чтения,
+    # как в backup_sqlite, — и сырые страницы через serialize. Полную копию на диск не пишем
+    src = sqlite3.connect(src_path)
+    mem = sqlite3.connect(":memory:")
+    try:
+        src.backup(mem, pages=-1)
+        page_size = mem.execute("PRAGMA page_size").fetchone()[0]
+        data = mem.serialize()
+    finally:
+        mem.close()
+        src.close()
+    return page_size, memoryview(data)
+
+
+def _load_digests(path: str) -> tuple[int | None, list[bytes]]:
+    # Хеши страниц последнего снимка: (размер страницы, [хеш страницы])
+    if not os.path.exists(path):
+        return None, []
+    with open(path, "rb") as f:
+        page_size, count = PAGES_HEADER.unpack(f.read(PAGES_HEADER.size))
+        data = f.read()
+    return page_size, [data[i:i + PAGE_DIGEST_SIZE] for i in range(0, count * PAGE_DIGEST_SIZE, PAGE_DIGEST_SIZE)]
+
+
+def _save_digests(path: str, page_size: int, digests: list[bytes]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PAGES_HEADER.pack(page_size, len(digests)))
+        f.write(b"".join(digests))
+    os.replace(tmp_path, path)
+
+
+def _pages(data: memoryview, page_size: int):
+    for pgno in range(len(data) // page_size):
+        page = data[pgno * page_size:(pgno + 1) * page_size]
+        yield pgno, page, hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest()
+
+
+def _write_full(data: memoryview, page_size: int, out_path: str) -> list[bytes]:
+    # Полная копия: файл базы целиком в gzip
+    tmp_path = _tmp_path(out_path)
+    digests = []
+    with gzip.open(tmp_path, "wb", compresslevel=6) as dest:
+        for _, page, digest in _pages(data, page_size):
+            dest.write(page)
+            digests.append(digest)
+    os.replace(tmp_path, out_path)
+    return digests
+
+
+def _write_changed_pages(data: memoryview, page_size: int, old_digests: list[bytes], out_path: str) -> tuple[list[bytes], int]:
+    # Сравнивает страницы снимка с хешами предыдущей точки и пишет в инкремент только изменившиеся
+    digests = []
+    changed = 0
+    tmp_path = _tmp_path(out_path)
+    with gzip.open(tmp_path, "wb", compresslevel=6) as dest:
+        dest.write(PAGES_HEADER.pack(page_size, len(data) // page_size))
+        for pgno, page, digest in _pages(data, page_size):
+            if pgno >= len(old_digests) or old_digests[pgno] != digest:
+                dest.write(PAGE_NUMBER.pack(pgno))
+                dest.write(page)
+                changed += 1
+            digests.append(digest)
+    os.replace(tmp_path, out_path)
+    return digests, changed
+
+
+def make_restore_point(src_path: str = DB_PATH, backup_dir: str = BACKUP_DIR, now: datetime = None) -> tuple[str, int, int]:
+    # Создаёт точку восстановления: полную копию или инкремент с изменёнными с прошлого раза страницами.
+    # База читается один раз, на диск пишутся только изменившиеся страницы и их хеши.
+    # Возвращает (имя точки, записано страниц, всего страниц)
+    os.makedirs(backup_dir, exist_ok=True)
+    digests_path = os.path.join(backup_dir, "mirror.digests")    # Хеши страниц последней точки
+    stamp = (now or datetime.utcnow()).strftime(POINT_TIME_FORMAT)
+
+    page_size, data = _snapshot(src_path)
+    old_page_size, old_digests = _load_digests(digests_path)
+
+    points = list_points(backup_dir)
+    fulls = [i for i, name in enumerate(points) if name.endswith(FULL_SUFFIX)]
+    chain_length = len(points) - fulls[-1] if fulls else 0
+    need_full = not fulls or chain_length >= FULL_BACKUP_EVERY or old_page_size != page_size
+
+    if need_full:
+        name = stamp + FULL_SUFFIX
+        digests = _write_full(data, page_size, os.path.join(backup_dir, name))
+        changed = len(digests)
+    else:
+        name = stamp + INCREMENT_SUFFIX
+        digests, changed = _write_changed_pages(data, page_size, old_digests, os.path.join(backup_dir, name))
+
+    # Хеши сохраняем только после того, как точка записана: при сбое следующий инкремент просто будет больше
+    _save_digests(digests_path, page_size, digests)
+
+    # Полный снимок mirror.db больше не ведётся — удаляем оставшийся от прежних версий
+    mirror_path = os.path.join(backup_dir, "mirror.db")
+    if os.path.exists(mirror_path):
+        os.remove(mirror_path)
+
+    apply_retention(backup_dir)
+    return name, changed, len(digests)
+
+
+def apply_retention(backup_dir: str = BACKUP_DIR):
+    # Ротация точек восстановления по цепочкам (полная копия + её инкременты)
+    chains = []
+    for name in list_points(backup_dir):
+        if name.endswith(FULL_SUFFIX):
+            chains.append([name])
+        elif chains:
+            chains[-1].append(name)
+        else:
+            # Инкремент без полной копии восстановить нельзя
+            os.remove(os.path.join(backup_dir, name))
+
+    for age, chain in enumerate(reversed(chains)):
+        if age >= KEEP_DAILY_CHAINS:
+            expired = chain
+        elif age >= KEEP_HOURLY_CHAINS:
+            expired = chain[1:]
+        else:
+            continue
+        for name in expired:
+            os.remove(os.path.join(backup_dir, name))
+
+
+def restore_point(name: str, dest_path: str, backup_dir: str = BACKUP_DIR):
+    # Собирает базу на момент точки name: полная копия цепочки + её инкременты по порядку
+    points = list_points(backup_dir)
+    if name not in points:
+        raise FileNotFoundError(f"Точка восстановления {name} не найдена")
+    end = points.index(name)
+    start = max(i for i, point in enumerate(points[:end + 1]) if point.endswith(FULL_SUFFIX))
+
+    tmp_path = dest_path + ".tmp"
+    with gzip.open(os.path.join(backup_dir, points[start]), "rb") as src, open(tmp_path, "wb") as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+
+    with open(tmp_path, "r+b") as dest:
+        for point in points[start + 1:end + 1]:
+            with gzip.open(os.path.join(backup_dir, point), "rb") as src:
+                page_size, page_count = PAGES_HEADER.unpack(src.read(PAGES_HEADER.size))
+                dest.truncate(page_size * page_count)
+                while header := src.read(PAGE_NUMBER.size):
+                    (pgno,) = PAGE_NUMBER.unpack(header)
+                    dest.seek(pgno * page_size)
+                    dest.write(src.read(page_size))
+    os.replace(tmp_path, dest_path)
+
+
+class BackupScheduler:
+    # Фоновые точки восстановления раз в BACKUP_INTERVAL (запускается в main.py)
+    def _delay(self) -> float:
+        # Сколько ждать до следующей точки, считая от последней сохранённой (в том числе до перезапуска)
+        points = list_points()
+        if not points:
+            return 0
+        elapsed = (datetime.utcnow() - point_time(points[-1])).total_seconds()
+        return max(BACKUP_INTERVAL - elapsed, 0)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self._delay())
+            try:
+                name, changed, total = await run_locked(make_restore_point)
+                print(f"[BACKUP] Точка восстановления {name}: записано страниц {changed} из {total}")
+            except Exception as e:
+                print(f"[ERROR] Не удалось создать точку восстановления: {e}")
+                await asyncio.sleep(BACKUP_RETRY_DELAY)
+
+
+# Общий планировщик резервных копий
+backup_scheduler = BackupScheduler()
+
+
+if __name__ == "__main__":
+    # Восстановление вручную (бот должен быть остановлен):
+    #   python -m utils.backup list
+    #   python -m utils.backup restore 20250101-120000-incr.gz db_data/bot.db
+    if len(sys.argv) >= 2 and sys.argv[1] == "list":
+        print("\n".join(list_points()))
+    elif len(sys.argv) == 4 and sys.argv[1] == "restore":
+        restore_point(sys.argv[2], sys.argv[3])
+        print(f"Восстановлено в {sys.argv[3]}")
+    else:
+        print("Использование: python -m utils.backup list | restore <точка> <файл базы>")
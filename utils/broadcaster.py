@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import BROADCAST_RATE, BROADCAST_WORKERS
+
+# Минимальный интервал между сообщениями в один чат (лимит Telegram — около 1 сообщения в секунду)
+PER_CHAT_INTERVAL = 1.0
+
+# Сколько раз повторяем отправку после TelegramRetryAfter
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    # Глобальное ограничение скорости: не больше `rate` сообщений в секунду с запасом `capacity`
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        # Flood control распространяется на весь бот — приостанавливаем все отправки
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                # Пополняем токены пропорционально прошедшему времени
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastStats:
+    # Итоги доставки: сколько отправлено, сколько ошибок и с какой скоростью
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.delivered = []  # Доставленные элементы
+        self.errors = []     # (элемент, исключение) для недоставленных
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"📨 Отправлено: {self.sent}, ошибок: {self.failed}\n"
+            f"⏱ {self.elapsed:.1f} с ({self.rate:.1f} сообщ./с)"
+        )
+
+
+class Broadcaster:
+    # Движок доставки: пул воркеров, общий token bucket и ограничение на чат
+    def __init__(self, rate: float = BROADCAST_RATE, workers: int = BROADCAST_WORKERS):
+        self.bucket = TokenBucket(rate, capacity=max(1, int(rate)))
+        self.workers = workers
+        self._chat_next = {}  # chat_id -> время, раньше которого в чат писать нельзя
+
+    async def _wait_chat(self, chat_id: int):
+        # Сначала резервируем слот для чата, потом ждём — так параллельные воркеры не отправят в чат одновременно
+        now = time.monotonic()
+        slot = max(now, self._chat_next.get(chat_id, 0))
+        self._chat_next[chat_id] = slot + PER_CHAT_INTERVAL
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+        # Периодически чистим устаревшие записи
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+
+    async def _send_one(self, item, chat_id: int, send, stats: BroadcastStats):
+        error = None
+        for attempt in range(MAX_RETRIES + 1):
+            await self._wait_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                await send(item)
+                stats.sent += 1
+                stats.delivered.append(item)
+                return
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать — тормозим весь движок и пробуем снова
+                self.bucket.pause(e.retry_after)
+                stats.retries += 1
+                error = e
+                print(f"[WARN] Flood control, пауза {e.retry_after} с (чат {chat_id})")
+            except Exception as e:
+                print(f"[ERROR] Не удалось отправить сообщение в чат {chat_id}: {e}")
+                error = e
+                break
+        stats.failed += 1
+        stats.errors.append((item, error))
+
+    async def deliver(self, items, send, key=None) -> BroadcastStats:
+        # Доставляет все элементы: `send(item)` — корутина одной отправки,
+        # `key(item)` — chat_id элемента (по умолчанию сам элемент и есть chat_id)
+        stats = BroadcastStats()
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._send_one(item, key(item) if key else item, send, stats)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, queue.qsize()))))
+        stats.elapsed = time.monotonic() - stats.started
+        return stats
+
+
+# Общий экземпляр — все рассылки делят один лимит скорости
+broadcaster = Broadcaster()
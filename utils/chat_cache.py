@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from datetime import datetime
+
+from aiogram import Bot
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import AsyncSessionLocal
+from database.models import ChatInfo
+
+# Сколько чатов держим в памяти
+CHAT_CACHE_SIZE = 10000
+
+
+class ChatTypeCache:
+    # LRU-кэш типов чатов в памяти поверх таблицы chat_info
+    def __init__(self, maxsize: int = CHAT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._types = OrderedDict()  # chat_id -> тип чата
+
+    def get(self, chat_id: int):
+        chat_type = self._types.get(chat_id)
+        if chat_type is not None:
+            self._types.move_to_end(chat_id)
+        return chat_type
+
+    def put(self, chat_id: int, chat_type: str):
+        self._types[chat_id] = chat_type
+        self._types.move_to_end(chat_id)
+        if len(self._types) > self.maxsize:
+            self._types.popitem(last=False)  # Вытесняем самый давно использованный чат
+
+    async def remember(self, session, chat_id: int, chat_type: str) -> bool:
+        # Вызывается для входящих апдейтов: пишем в БД только новые или изменившиеся чаты
+        if self.get(chat_id) == chat_type:
+            return False
+        await self._store(session, chat_id, chat_type)
+        self.put(chat_id, chat_type)
+        return True
+
+    async def resolve(self, bot: Bot, chat_id: int) -> str:
+        # 1. Память
+        chat_type = self.get(chat_id)
+        if chat_type is not None:
+            return chat_type
+
+        async with AsyncSessionLocal() as session:
+            # 2. Таблица chat_info
+            chat_type = await session.scalar(select(ChatInfo.type).filter_by(chat_id=chat_id))
+
+            # 3. Запрос к Telegram — только для чатов, которых мы ещё не видели
+            if chat_type is None:
+                chat = await bot.get_chat(chat_id)
+                chat_type = chat.type
+                await self._store(session, chat_id, chat_type)
+                await session.commit()
+
+        self.put(chat_id, chat_type)
+        return chat_type
+
+    @staticmethod
+    async def _store(session, chat_id: int, chat_type: str):
+        stmt = insert(ChatInfo).values(chat_id=chat_id, type=chat_type, updated_at=datetime.utcnow())
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[ChatInfo.chat_id],
+            set_={"type": stmt.excluded.type, "updated_at": stmt.excluded.updated_at},
+        ))
+
+
+# Общий кэш для всех отправок
+chat_cache = ChatTypeCache()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import AsyncSessionLocal
+from database.models import FSMState
+
+# Сколько ключей FSM держим в памяти (остальные читаются из fsm_states по запросу)
+FSM_CACHE_SIZE = 10000
+
+# Как часто изменённые состояния сбрасываются в БД одной транзакцией (секунды)
+FSM_FLUSH_INTERVAL = 1.0
+
+# Состояние, которое не менялось дольше FSM_STATE_TTL, считается брошенным и удаляется
+FSM_STATE_TTL = 3 * 24 * 60 * 60
+FSM_PURGE_INTERVAL = 60 * 60
+
+
+@dataclass(slots=True)
+class FSMRecord:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    # Хранилище FSM в таблице fsm_states: горячие ключи в LRU-кэше, запись в БД пачками (write-behind).
+    # Рассчитано на один процесс бота: он единственный писатель, поэтому кэш (включая отсутствующие
+    # в БД ключи) всегда актуален. Второй процесс с тем же fsm_states увидел бы устаревшие данные
+    def __init__(self, session_factory=AsyncSessionLocal, cache_size: int = FSM_CACHE_SIZE, ttl: int = FSM_STATE_TTL):
+        self._session_factory = session_factory
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache = OrderedDict()   # ключ -> FSMRecord
+        self._dirty = {}              # ключ -> FSMRecord, ещё не записанные в БД
+        self._flushing = {}           # ключ -> FSMRecord, которые сейчас записываются (до commit)
+        self._flushes = 0             # Счётчик завершённых сбросов
+        self._flush_lock = asyncio.Lock()
+
+    async def _record(self, key: StorageKey) -> tuple[str, FSMRecord]:
+        k = self._key_builder.build(key)
+        record = self._pending(k)
+        while record is None:
+            flushes = self._flushes
+            async with self._session_factory() as session:
+                row = (await session.execute(
+                    select(FSMState.state, FSMState.data, FSMState.updated_at).filter_by(key=k)
+                )).first()
+            # Пока ждали БД, ключ мог появиться в кэше — тогда берём его. Если за это время завершился
+            # сброс, прочитанная строка могла устареть — читаем заново
+            record = self._pending(k)
+            if record is None and flushes == self._flushes:
+                record = FSMRecord(row.state, json.loads(row.data or "{}"), row.updated_at) if row else FSMRecord()
+
+        # Брошенное состояние: сбрасываем, строка удалится при следующей записи
+        if not record.is_empty() and record.updated_at < time.time() - self.ttl:
+            record = FSMRecord(updated_at=time.time())
+            self._dirty[k] = record
+
+        self._remember(k, record)
+        return k, record
+
+    def _pending(self, k: str) -> Optional[FSMRecord]:
+        # Запись из памяти: кэш, ещё не сброшенные и сбрасываемые прямо сейчас
+        # (вытесненная из кэша запись до commit есть только в _dirty или _flushing)
+        return self._cache.get(k) or self._dirty.get(k) or self._flushing.get(k)
+
+    def _remember(self, k: str, record: FSMRecord):
+        self._cache[k] = record
+        self._cache.move_to_end(k)
+        if len(self._cache) > self.cache_size:
+            # Вытесненная запись, ещё не записанная в БД, остаётся в _dirty до сброса
+            self._cache.popitem(last=False)
+
+    def _touch(self, k: str, record: FSMRecord):
+        record.updated_at = time.time()
+        self._dirty[k] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(k, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k, record = await self._record(key)
+        record.data = data.copy()
+        self._touch(k, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def flush(self):
+        # Записывает накопленные изменения одной транзакцией; пустые записи удаляются из БД
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            # До commit записи остаются видны _record через _flushing
+            dirty = self._flushing = self._dirty
+            self._dirty = {}
+            upserts = [
+                {
+                    "key": k,
+                    "state": record.state,
+                    "data": json.dumps(record.data, ensure_ascii=False),
+                    "updated_at": int(record.updated_at),
+                }
+                for k, record in dirty.items() if not record.is_empty()
+            ]
+            deletes = [k for k, record in dirty.items() if record.is_empty()]
+
+            try:
+                async with self._session_factory() as session:
+                    if upserts:
+                        stmt = insert(FSMState)
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=["key"],
+                            set_={name: getattr(stmt.excluded, name) for name in ("state", "data", "updated_at")},
+                        )
+                        await session.execute(stmt, upserts)
+                    if deletes:
+                        await session.execute(delete(FSMState).filter(FSMState.key.in_(deletes)))
+                    await session.commit()
+                self._flushes += 1
+            except Exception as e:
+                # Возвращаем несохранённое (не затирая более свежие изменения) и пробуем в следующий раз
+                for k, record in dirty.items():
+                    self._dirty.setdefault(k, record)
+                print(f"[ERROR] FSM: не удалось сохранить состояния ({len(dirty)}): {e}")
+            finally:
+                self._flushing = {}
+
+    async def purge_expired(self):
+        # Удаляет из БД брошенные состояния
+        async with self._session_factory() as session:
+            await session.execute(delete(FSMState).filter(FSMState.updated_at < time.time() - self.ttl))
+            await session.commit()
+
+    async def run(self):
+        # Фоновый сброс изменений в БД и чистка брошенных состояний (запускается в main.py)
+        next_purge = 0.0
+        while True:
+            await asyncio.sleep(FSM_FLUSH_INTERVAL)
+            await self.flush()
+            if time.monotonic() >= next_purge:
+                try:
+                    await self.purge_expired()
+                except Exception as e:
+                    print(f"[ERROR] FSM: не удалось удалить брошенные состояния: {e}")
+                next_purge = time.monotonic() + FSM_PURGE_INTERVAL
+
+    async def close(self) -> None:
+        # Вызывается aiogram при остановке диспетчера — сохраняем всё, что не успели записать
+        await self.flush()
+
+
+# Общее хранилище FSM для диспетчера
+fsm_storage = SQLiteStorage()
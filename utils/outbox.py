@@ -0,0 +1,203 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.db import AsyncSessionLocal
+from database.models import OutboxBatch, OutboxMessage, PinMessage, RaidPinSendLog, pin_text_hash
+from utils.broadcaster import broadcaster
+from utils.safe_send import safe_send_message
+
+# Сколько сообщений воркер забирает из очереди за один проход
+OUTBOX_BATCH_SIZE = 200
+
+# Повторные попытки: не больше MAX_ATTEMPTS, пауза удваивается начиная с RETRY_BASE_DELAY секунд
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30
+
+# Как часто проверять очередь, если никто не разбудил воркер
+IDLE_INTERVAL = 60
+
+# Ошибки, после которых повторять отправку бессмысленно (бот заблокирован, чат не найден и т.п.)
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+# Заголовки отчётов администратору по типу пакета
+REPORT_TITLES = {
+    "broadcast": "✅ Рассылка отправлена",
+    "pin": "✅ Пин отправлен",
+}
+
+
+async def enqueue(session, purpose: str, messages: list, admin_chat_id: int = None) -> OutboxBatch:
+    # Сохраняет пакет сообщений в очередь и будит воркер.
+    # messages — словари с полями OutboxMessage (chat_id, text, photo_id, reply_markup, ...)
+    batch = OutboxBatch(purpose=purpose, admin_chat_id=admin_chat_id, total=len(messages))
+    session.add(batch)
+    await session.flush()
+
+    if messages:
+        await session.execute(insert(OutboxMessage), [{"batch_id": batch.id, **m} for m in messages])
+
+    # Коммитим сразу, чтобы воркер увидел сообщения, как только проснётся
+    await session.commit()
+    outbox_worker.notify()
+    return batch
+
+
+async def pin_message_ids(session, texts) -> dict:
+    # Сохраняет тексты пинов в pin_messages (каждый текст один раз) и возвращает {текст: id}
+    hashes = {pin_text_hash(text): text for text in texts}
+    await session.execute(
+        sqlite_insert(PinMessage)
+        .values([{"text_hash": h, "text": text} for h, text in hashes.items()])
+        .on_conflict_do_nothing(index_elements=["text_hash"])
+    )
+    rows = await session.execute(select(PinMessage.text_hash, PinMessage.id).filter(PinMessage.text_hash.in_(list(hashes))))
+    return {hashes[h]: pin_id for h, pin_id in rows.all()}
+
+
+class OutboxWorker:
+    # Фоновая доставка сообщений из таблицы outbox_messages
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def run(self, bot: Bot):
+        # Бесконечный цикл: разбираем очередь пачками, пока есть что отправлять
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self.drain_once(bot)
+                await self.report_finished(bot)
+            except Exception as e:
+                print(f"[ERROR] Outbox: {e}")
+                processed = 0
+
+            if processed:
+                continue
+
+            # Очередь пуста — ждём нового пакета или ближайшей повторной попытки
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=await self._idle_timeout())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _idle_timeout(self) -> float:
+        async with AsyncSessionLocal() as session:
+            next_at = await session.scalar(
+                select(func.min(OutboxMessage.next_attempt_at)).filter(OutboxMessage.status == "pending")
+            )
+        if next_at is None:
+            return IDLE_INTERVAL
+        delay = (next_at - datetime.utcnow()).total_seconds()
+        return min(max(delay, 1), IDLE_INTERVAL)
+
+    @staticmethod
+    async def _send(bot: Bot, m: OutboxMessage):
+        markup = InlineKeyboardMarkup.model_validate_json(m.reply_markup) if m.reply_markup else None
+        if m.photo_id:
+            await bot.send_photo(chat_id=m.chat_id, photo=m.photo_id, caption=m.text, parse_mode=m.parse_mode)
+        else:
+            await safe_send_message(bot, m.chat_id, m.text, reply_markup=markup, parse_mode=m.parse_mode)
+
+    async def drain_once(self, bot: Bot) -> int:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            rows = (await session.scalars(
+                select(OutboxMessage)
+                .filter(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now)
+                .order_by(OutboxMessage.id)
+                .limit(OUTBOX_BATCH_SIZE)
+            )).all()
+            if not rows:
+                return 0
+
+            stats = await broadcaster.deliver(rows, lambda m: self._send(bot, m), key=lambda m: m.chat_id)
+
+            # Записываем результаты доставки
+            sent_at = datetime.utcnow()
+            for m in stats.delivered:
+                m.status = "sent"
+                m.sent_at = sent_at
+                m.attempts += 1
+
+            # Пины журналируем в raid_pin_send_logs одним INSERT; текст пина — ссылкой на pin_messages
+            pins = [m for m in stats.delivered if m.admin_id is not None]
+            if pins:
+                pin_ids = await pin_message_ids(session, {m.text for m in pins})
+                await session.execute(insert(RaidPinSendLog).values([
+                    {
+                        "admin_id": m.admin_id,
+                        "raid_id": m.raid_id,
+                        "target_id": m.target_user_id,
+                        "pin_message_id": pin_ids[m.text],
+                        "sent_at": sent_at,
+                        "batch_id": m.batch_id,
+                    }
+                    for m in pins
+                ]))
+
+            for m, error in stats.errors:
+                m.attempts += 1
+                m.last_error = str(error)[:500]
+                if isinstance(error, PERMANENT_ERRORS) or m.attempts >= MAX_ATTEMPTS:
+                    m.status = "failed"
+                else:
+                    m.next_attempt_at = sent_at + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (m.attempts - 1))
+
+            await session.commit()
+
+        print(f"[OUTBOX] Обработано {len(rows)}: {stats.sent} отправлено, {stats.failed} ошибок, "
+              f"{stats.rate:.1f} сообщ./с")
+        return len(rows)
+
+    async def report_finished(self, bot: Bot):
+        # Закрываем пакеты, в которых не осталось ожидающих сообщений, и отправляем итоги
+        async with AsyncSessionLocal() as session:
+            pending = (
+                select(OutboxMessage.id)
+                .filter(OutboxMessage.batch_id == OutboxBatch.id, OutboxMessage.status == "pending")
+                .exists()
+            )
+            batches = (await session.scalars(
+                select(OutboxBatch).filter(OutboxBatch.finished_at.is_(None), ~pending)
+            )).all()
+
+            for batch in batches:
+                counts = dict((await session.execute(
+                    select(OutboxMessage.status, func.count())
+                    .filter(OutboxMessage.batch_id == batch.id)
+                    .group_by(OutboxMessage.status)
+                )).all())
+                batch.finished_at = datetime.utcnow()
+                # Итоги посчитаны — сами сообщения больше не нужны: текст и клавиатура хранились
+                # отдельно для каждого получателя (журнал пинов ссылается на pin_messages)
+                await session.execute(delete(OutboxMessage).filter(OutboxMessage.batch_id == batch.id))
+                await session.commit()
+
+                sent, failed = counts.get("sent", 0), counts.get("failed", 0)
+                elapsed = (batch.finished_at - batch.created_at).total_seconds()
+                rate = sent / elapsed if elapsed > 0 else 0.0
+                summary = (
+                    f"📨 Отправлено: {sent}, ошибок: {failed}\n"
+                    f"⏱ {elapsed:.1f} с ({rate:.1f} сообщ./с)"
+                )
+
+                if batch.admin_chat_id:
+                    title = REPORT_TITLES.get(batch.purpose, "✅ Доставка завершена")
+                    try:
+                        await safe_send_message(bot, batch.admin_chat_id, f"{title} {sent} игрокам.\n{summary}")
+                    except Exception as e:
+                        print(f"[ERROR] Не удалось отправить отчёт о пакете {batch.id}: {e}")
+                else:
+                    print(f"[OUTBOX] Пакет {batch.id} ({batch.purpose}) завершён: {sent} отправлено, {failed} ошибок")
+
+
+# Общий воркер: запускается в main.py, будится из enqueue()
+outbox_worker = OutboxWorker()
@@ -2,6 +2,8 @@ from aiogram.enums import ChatType
 from aiogram.types import Message
 from aiogram import Bot
 
+from utils.chat_cache import chat_cache
+
 
 async def safe_answer(message: Message, text: str, reply_markup=None, **kwargs):
     # Проверяем, является ли чат приватным. Если нет, убираем клавиатуру
@@ -12,10 +14,10 @@ async def safe_answer(message: Message, text: str, reply_markup=None, **kwargs):
 
 
 async def safe_send_message(bot: Bot, chat_id: int, text: str, reply_markup=None, **kwargs):
-    # Получаем информацию о чате по его ID
-    chat = await bot.get_chat(chat_id)
+    # Тип чата берём из кэша (get_chat вызывается только для неизвестных чатов)
+    chat_type = await chat_cache.resolve(bot, chat_id)
     # Если чат не является приватным, убираем клавиатуру
-    if chat.type != ChatType.PRIVATE:
+    if chat_type != ChatType.PRIVATE:
         reply_markup = None
     # Отправляем сообщение в указанный чат
     return await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, **kwargs)
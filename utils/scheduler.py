@@ -1,124 +1,171 @@
-from utils.safe_send import safe_send_message
+from utils.outbox import enqueue
 import asyncio
+import heapq
 from datetime import datetime, timedelta
 from pytz import timezone
-from database.db import session
+from sqlalchemy import select, delete, update
+from database.db import AsyncSessionLocal
 from database.models import RaidEvent, RaidParticipation, User, RaidReminder
 
 # Установка часового пояса — Москва
 moscow = timezone("Europe/Moscow")
 
+# Типы событий рейда и их смещение относительно времени старта
+REMIND_HOUR = "remind_60"     # Напоминание подписавшимся (RaidReminder) за 1 час
+REMIND_PARTS = "remind_30"    # Напоминание записавшимся участникам за 30 минут
+FINISH = "finish"             # Завершение рейда через 2 часа после старта
 
-async def raid_reminder_loop(bot):
-    # Бесконечный цикл для проверки рейдов и отправки напоминаний
-    while True:
-        # Получаем текущее время в часовом поясе Москвы
-        now = datetime.now(moscow)
+EVENT_OFFSETS = {
+    REMIND_HOUR: timedelta(minutes=-60),
+    REMIND_PARTS: timedelta(minutes=-30),
+    FINISH: timedelta(hours=2),
+}
 
-        # 1. Завершить рейды, которые начались более чем 2 часа назад
-        expired_raids = (
-            session.query(RaidEvent)
+# Сколько секунд после дедлайна напоминание ещё имеет смысл (при перезапуске бота)
+REMINDER_GRACE = 60
+
+# Пауза перед повтором события, которое завершилось ошибкой (например, база временно заблокирована)
+EVENT_RETRY_DELAY = 60
+
+
+def raid_start(raid) -> datetime:
+    # Время старта хранится без таймзоны (московское), но у только что созданного объекта она может быть
+    start = raid.start_time
+    return start if start.tzinfo else moscow.localize(start)
+
+
+class RaidScheduler:
+    # Планировщик событий рейдов: куча дедлайнов и сон ровно до ближайшего
+    def __init__(self):
+        self._heap = []  # Элементы: (timestamp дедлайна, raid_id, тип события, timestamp старта)
+        self._wakeup = asyncio.Event()
+
+    def schedule_raid(self, raid):
+        # Добавляем в очередь все будущие события рейда
+        self.cancel_raid(raid.id)
+        start_ts = raid_start(raid).timestamp()
+        now_ts = datetime.now(moscow).timestamp()
+
+        for kind, offset in EVENT_OFFSETS.items():
+            deadline = start_ts + offset.total_seconds()
+            # Пропущенные напоминания не отправляем, а завершение выполняем даже с опозданием
+            if kind != FINISH and deadline < now_ts - REMINDER_GRACE:
+                continue
+            heapq.heappush(self._heap, (deadline, raid.id, kind, start_ts))
+
+        self._wakeup.set()  # Будим цикл — возможно, ближайший дедлайн сдвинулся
+
+    def cancel_raid(self, raid_id: int):
+        # Убираем из очереди все события рейда (например, после удаления)
+        before = len(self._heap)
+        self._heap = [item for item in self._heap if item[1] != raid_id]
+        if len(self._heap) != before:
+            heapq.heapify(self._heap)
+            self._wakeup.set()
+
+    async def load(self):
+        # Заполняем очередь активными рейдами из БД при старте
+        async with AsyncSessionLocal() as session:
+            raids = (await session.scalars(select(RaidEvent).filter(RaidEvent.status == "active"))).all()
+        for raid in raids:
+            self.schedule_raid(raid)
+        print(f"[SCHEDULER] Запланировано событий: {len(self._heap)} (рейдов: {len(raids)})")
+
+    async def run(self):
+        await self.load()
+
+        # Бесконечный цикл: выполняем наступившие события и спим до следующего дедлайна
+        while True:
+            self._wakeup.clear()
+            now_ts = datetime.now(moscow).timestamp()
+
+            while self._heap and self._heap[0][0] <= now_ts:
+                _, raid_id, kind, start_ts = heapq.heappop(self._heap)
+                try:
+                    await self._fire(raid_id, kind, start_ts)
+                except Exception as e:
+                    # Событие уже снято с кучи — возвращаем его, иначе оно потеряется до перезапуска.
+                    # Повтор безопасен: _fire заново проверяет статус рейда и время старта
+                    print(f"[ERROR] Ошибка события {kind} для рейда {raid_id}: {e}, повтор через {EVENT_RETRY_DELAY} с")
+                    heapq.heappush(self._heap, (datetime.now(moscow).timestamp() + EVENT_RETRY_DELAY, raid_id, kind, start_ts))
+                now_ts = datetime.now(moscow).timestamp()
+
+            # Ждём ближайший дедлайн либо сигнал об изменении очереди
+            timeout = self._heap[0][0] - now_ts if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, raid_id: int, kind: str, start_ts: float):
+        async with AsyncSessionLocal() as session:
+            # Проверяем, что рейд всё ещё активен и время старта не менялось
+            event = await session.scalar(select(RaidEvent).filter_by(id=raid_id))
+            if not event or event.status != "active" or raid_start(event).timestamp() != start_ts:
+                return
+
+            if kind == FINISH:
+                await self._finish(session, event)
+            elif kind == REMIND_PARTS:
+                await self._remind_participants(session, event)
+            elif kind == REMIND_HOUR:
+                await self._remind_subscribers(session, event)
+
+    async def _finish(self, session, event):
+        # 1. Завершаем рейд
+        event.status = "finished"
+
+        # 2. Обновляем статус участников, которые записались на завершённый рейд
+        await session.execute(
+            update(RaidParticipation)
             .filter(
-                RaidEvent.start_time < now - timedelta(hours=2),
-                RaidEvent.status == "active"
+                RaidParticipation.raid_id == event.id,
+                RaidParticipation.status == "записался"
             )
-            .all()
+            .values(status="участвовал")
         )
-        for raid in expired_raids:
-            raid.status = "finished"
-        session.commit()
-
-        # 2. Обновить статус участников, которые записались на завершенные рейды
-        participations = (
-            session.query(RaidParticipation)
-            .join(RaidEvent)
+        await session.commit()
+
+    async def _remind_participants(self, session, event):
+        # 3. Напоминание за 30 минут до старта всем записавшимся участникам
+        participants = (await session.scalars(
+            select(User)
+            .join(RaidParticipation, RaidParticipation.user_id == User.id)
             .filter(
-                RaidEvent.status == "finished",
+                RaidParticipation.raid_id == event.id,
                 RaidParticipation.status == "записался"
             )
-            .all()
+        )).all()
+
+        dt_str = event.start_time.strftime('%d.%m %H:%M')
+        text = (
+            f"⏰ <b>Напоминание о рейде!</b>\n\n"
+            f"⚔ Рейд: {event.name}\n"
+            f"🕔 Время: {dt_str}\n"
+            f"📍 Не забудьте вовремя прийти!"
         )
-        for part in participations:
-            part.status = "участвовал"
-        session.commit()
 
-        # 3. Напоминание за 30 минут до старта (окно: 29-31 минут до события)
-        window_start = now + timedelta(minutes=29)
-        window_end = now + timedelta(minutes=31)
+        messages = [{"chat_id": user.game_id, "text": text, "parse_mode": "HTML"} for user in participants if user.game_id]
+        await enqueue(session, "reminder", messages)
+        print(f"[SCHEDULER] Напоминание за 30 минут, рейд {event.id}: в очереди {len(messages)}")
 
-        # Находим активные рейды, которые начнутся в этом окне
-        upcoming_raids = (
-            session.query(RaidEvent)
-            .filter(
-                RaidEvent.start_time.between(window_start, window_end),
-                RaidEvent.status == "active"
-            )
-            .all()
-        )
+    async def _remind_subscribers(self, session, event):
+        # 4. Напоминание за 1 час до старта пользователям, установившим напоминание
+        users = (await session.scalars(
+            select(User)
+            .join(RaidReminder, RaidReminder.user_id == User.id)
+            .filter(RaidReminder.raid_id == event.id)
+        )).all()
 
-        # Отправляем напоминания всем участникам этих рейдов
-        for event in upcoming_raids:
-            participants = (
-                session.query(User)
-                .join(RaidParticipation, RaidParticipation.user_id == User.id)
-                .filter(
-                    RaidParticipation.raid_id == event.id,
-                    RaidParticipation.status == "записался"
-                )
-                .all()
-            )
+        text = f"🔔 Напоминание: рейд '{event.name}' начнётся через 1 час!"
+
+        messages = [{"chat_id": user.game_id, "text": text, "parse_mode": "HTML"} for user in users if user.game_id]
+
+        # Удаляем напоминания в той же транзакции, в которой сообщения попадают в очередь
+        await session.execute(delete(RaidReminder).filter_by(raid_id=event.id))
+        await enqueue(session, "reminder", messages)
+        print(f"[SCHEDULER] Напоминание за 1 час, рейд {event.id}: в очереди {len(messages)}")
 
-            for user in participants:
-                if user.game_id:
-                    dt_str = event.start_time.strftime('%d.%m %H:%M')
-                    try:
-                        await safe_send_message(
-                            bot,
-                            chat_id=user.game_id,
-                            text=(
-                                f"⏰ <b>Напоминание о рейде!</b>\n\n"
-                                f"⚔ Рейд: {event.name}\n"
-                                f"🕔 Время: {dt_str}\n"
-                                f"📍 Не забудьте вовремя прийти!"
-                            ),
-                            parse_mode="HTML"
-                        )
-                    except Exception as e:
-                        print(f"[ERROR] Не удалось отправить сообщение пользователю {user.id}: {e}")
-
-        # 4. Напомнить за 1 час до старта (окно: 59-61 минут до события)
-        remind_window_start = now + timedelta(minutes=59)
-        remind_window_end = now + timedelta(minutes=61)
-
-        # Находим активные рейды, которые начнутся в этом окне
-        events_to_remind = (
-            session.query(RaidEvent)
-            .filter(
-                RaidEvent.start_time.between(remind_window_start, remind_window_end),
-                RaidEvent.status == "active"
-            )
-            .all()
-        )
 
-        # Отправляем напоминания всем пользователям, установившим напоминание
-        for event in events_to_remind:
-            reminders = session.query(RaidReminder).filter_by(raid_id=event.id).all()
-            for r in reminders:
-                user = session.query(User).filter_by(id=r.user_id).first()
-                if user and user.game_id:
-                    try:
-                        await safe_send_message(
-                            bot,
-                            chat_id=user.game_id,
-                            text=f"🔔 Напоминание: рейд '{event.name}' начнётся через 1 час!",
-                            parse_mode="HTML"
-                        )
-                    except Exception as e:
-                        print(f"[ERROR] Не удалось отправить напоминание пользователю {user.id}: {e}")
-
-            # После отправки удаляем все напоминания для этого рейда
-            session.query(RaidReminder).filter_by(raid_id=event.id).delete()
-            session.commit()
-
-        # Пауза на 60 секунд перед следующей итерацией цикла
-        await asyncio.sleep(60)
+# Единый экземпляр планировщика: запускается в main.py, обновляется при создании/удалении рейдов
+raid_scheduler = RaidScheduler()
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.orm import make_transient_to_detached
+
+from config import ADMIN_IDS
+from database.models import User
+
+# Сколько игроков держим в памяти и сколько секунд доверяем закэшированной строке users
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+
+def is_admin_user(game_id: int, user) -> bool:
+    # Админ — из ADMIN_IDS в config.py или с флагом users.is_admin
+    return game_id in ADMIN_IDS or bool(user and user.is_admin)
+
+
+class UserCache:
+    # Кэш строк users по Telegram ID с коротким TTL (включая незарегистрированных).
+    # После изменения игрока вызывайте invalidate — иначе изменения станут видны через USER_CACHE_TTL
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._users = OrderedDict()  # game_id -> (момент устаревания, значения колонок или None)
+
+    async def get(self, session, game_id: int, fresh: bool = False):
+        # Игрок по Telegram ID. Из кэша возвращается отсоединённый снимок только для чтения: в сессию
+        # он не попадает, и select(User) в хендлере по-прежнему читает актуальную строку.
+        # fresh=True — для проверок прав: всегда читаем из БД (и обновляем кэш)
+        entry = self._users.get(game_id)
+        if not fresh and entry is not None and entry[0] > time.monotonic():
+            self._users.move_to_end(game_id)
+            if entry[1] is None:
+                return None
+            user = User(**entry[1])
+            make_transient_to_detached(user)
+            return user
+
+        query = select(User).filter_by(game_id=game_id)
+        if fresh:
+            query = query.execution_options(populate_existing=True)
+        user = await session.scalar(query)
+        values = {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs} if user else None
+        self._users[game_id] = (time.monotonic() + self.ttl, values)
+        self._users.move_to_end(game_id)
+        if len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, game_id: int):
+        self._users.pop(game_id, None)
+
+
+# Общий кэш игроков (UserIdentityMiddleware, is_user_admin)
+user_cache = UserCache()